@@ -0,0 +1,151 @@
+"""Event-loop blocking by Docker calls, measured as /health latency.
+
+Serves main:app in-process with its sandbox replaced by a real SandboxManager over
+bench/fake_docker.py, whose calls block their thread like docker-py's do. --sessions
+workers each open their sandbox through GET /notebooks/{id}, run a command in it the
+way run_notebook does on a cache miss, and now and then destroy it so containers keep
+starting and stopping. Meanwhile /health is polled every --interval seconds. Three runs:
+
+- idle: no sandbox load, the baseline;
+- threaded: Docker calls go through AsyncDocker's thread pool, as they do now;
+- inline: the same calls made directly on the event loop, as before AsyncDocker.
+
+/health does no work, so its latency above the idle baseline is time the loop spent
+stuck in a Docker call. The fake sandbox backend used by bench/load.py never calls
+Docker and cannot show this.
+
+    python bench/blocking_docker.py --sessions 20 --duration 10
+    python bench/blocking_docker.py --run-latency 1.0 --exec-latency 0.5
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import functools
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, TypeVar
+
+import httpx
+import uvicorn
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+T = TypeVar("T")
+
+
+async def drive(
+    url: str,
+    recorder: Any,
+    mode: str,
+    sandbox: Any,
+    args: argparse.Namespace,
+) -> float:
+    deadline = time.monotonic() + args.duration
+
+    async def poll_health(client: httpx.AsyncClient) -> None:
+        while time.monotonic() < deadline:
+            with recorder.measure(mode):
+                (await client.get("/health")).raise_for_status()
+            await asyncio.sleep(args.interval)
+
+    async def session(client: httpx.AsyncClient, session_id: str) -> None:
+        while time.monotonic() < deadline:
+            with recorder.measure(f"{mode}: GET /notebooks/{{id}}"):
+                (await client.get(f"/notebooks/{session_id}")).raise_for_status()
+            await sandbox.exec_in_container(session_id, ["marimo", "export", "script", "notebook.py"])
+            if random.random() < args.destroy_rate:
+                await sandbox.destroy(session_id)
+
+    started = time.monotonic()
+    async with httpx.AsyncClient(base_url=url, timeout=60) as client:
+        workers = [] if mode == "idle" else [session(client, f"s{i}") for i in range(args.sessions)]
+        await asyncio.gather(poll_health(client), *workers)
+    return time.monotonic() - started
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=10, help="seconds per run")
+    parser.add_argument("--interval", type=float, default=0.02, help="seconds between /health polls")
+    parser.add_argument("--destroy-rate", type=float, default=0.2, help="chance a round ends by destroying")
+    parser.add_argument("--run-latency", type=float, default=0.5, help="fake container start, seconds")
+    parser.add_argument("--exec-latency", type=float, default=0.2, help="fake command run, seconds")
+    parser.add_argument("--port-start", type=int, default=19300, help="start of the sandbox host port range")
+    parser.add_argument("--json", type=Path, help="also write the report here")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.environ.update({
+            "SANDBOX_BACKEND": "fake",  # replaced below; keeps main from connecting to Docker
+            "NOTEBOOK_DATA_DIR": str(Path(workdir) / "notebooks"),
+            "CONVERSATION_DB_PATH": str(Path(workdir) / "conversations.sqlite3"),
+            "SEARCH_CACHE_PATH": str(Path(workdir) / "search.sqlite3"),
+            "MARIMO_POOL_SIZE": "0",
+            "MARIMO_PORT_START": str(args.port_start),
+            "MARIMO_PORT_END": str(args.port_start + args.sessions + 10),
+            "SANDBOX_KEEP_ON_SHUTDOWN": "0",
+            "LOGFIRE_SEND_TO_LOGFIRE": "false",
+            "LOGFIRE_CONSOLE": "false",
+        })
+        for key in ("OPENROUTER_API_KEY", "LINKUP_API_KEY", "TAVILY_API_KEY"):
+            os.environ.setdefault(key, "unused")
+
+        import main as kitsune
+        from fake_docker import FakeDockerClient
+        from load import Recorder, free_port, wait_until_up
+
+        from kitsune.services.docker_client import AsyncDocker
+        from kitsune.services.sandbox import SandboxManager
+
+        class InlineDocker(AsyncDocker):
+            """AsyncDocker with every call made on the event loop thread."""
+
+            async def call(self, op: str, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+                async with self._limits[op]:
+                    return functools.partial(fn, *args, **kwargs)()
+
+        port = free_port()
+        # The lifespan would close the app's stores; each run starts and stops its own sandbox
+        server = uvicorn.Server(uvicorn.Config(kitsune.app, port=port, log_level="warning", lifespan="off"))
+        serving = asyncio.create_task(server.serve())
+        url = f"http://127.0.0.1:{port}"
+        await wait_until_up(f"{url}/health")
+
+        report = {}
+        for mode, docker_class in (("idle", AsyncDocker), ("threaded", AsyncDocker), ("inline", InlineDocker)):
+            client = FakeDockerClient(run_latency=args.run_latency, exec_latency=args.exec_latency)
+            kitsune.sandbox = SandboxManager(docker_class(client))
+            await kitsune.sandbox.startup()
+            recorder = Recorder()
+            try:
+                elapsed = await drive(url, recorder, mode, kitsune.sandbox, args)
+            finally:
+                await kitsune.sandbox.shutdown()
+            report.update(recorder.report(elapsed))
+
+        server.should_exit = True
+        await serving
+
+    print(
+        f"{args.sessions} sessions, {args.duration:.0f}s per run, "
+        f"container start {args.run_latency * 1000:.0f} ms, exec {args.exec_latency * 1000:.0f} ms"
+    )
+    print(f"{'run':30} {'ok':>6} {'err':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name, row in report.items():
+        cells = [f"{row[k]:>9}" if row[k] is not None else f"{'-':>9}" for k in ("p50_ms", "p95_ms", "p99_ms", "max_ms")]
+        print(f"{name:30} {row['ok']:>6} {sum(row['errors'].values()):>5} {' '.join(cells)}")
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
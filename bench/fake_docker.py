@@ -0,0 +1,176 @@
+"""A blocking stand-in for docker.DockerClient, for sandbox benchmarks without a daemon.
+
+Implements the part of docker-py that AsyncDocker and SandboxManager use. Like the real
+client, every call blocks its thread for as long as the daemon would take, so code that
+calls it on the event loop stalls the loop just as it would in production. Each running
+container answers marimo's /api/status endpoints on its host port from a small HTTP
+server thread, so readiness and connection probes run unchanged. Commands only echo.
+"""
+
+from __future__ import annotations
+
+import itertools
+import json
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Iterator
+
+from docker.errors import APIError, NotFound
+from docker.models.containers import ExecResult
+
+
+class _StatusHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        body = json.dumps({"active": 0} if self.path.endswith("/connections") else {"status": "ok"}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+class FakeContainer:
+    def __init__(self, client: FakeDockerClient, name: str, port: int, labels: dict[str, str]) -> None:
+        self._client = client
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.port = port
+        self.labels = labels
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), _StatusHandler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    @property
+    def attrs(self) -> dict:
+        # The shape of a sparse `docker ps` entry
+        return {
+            "Id": self.id,
+            "Names": [f"/{self.name}"],
+            "Labels": self.labels,
+            "Ports": [{"PrivatePort": 2718, "PublicPort": self.port}],
+        }
+
+    def rename(self, name: str) -> None:
+        self._client.block(self._client.call_latency)
+        self.name = name
+
+    def stop(self, timeout: int = 10) -> None:
+        self._client.block(self._client.stop_latency)
+        self._server.shutdown()
+        self._server.server_close()
+        # Sandbox containers run with remove=True
+        self._client.containers.forget(self)
+
+    def exec_run(self, cmd: list[str], **kwargs: Any) -> ExecResult:
+        self._client.block(self._client.exec_latency)
+        return ExecResult(0, f"[fake docker] {' '.join(cmd)}\n".encode())
+
+
+class _Containers:
+    def __init__(self, client: FakeDockerClient) -> None:
+        self._client = client
+        self._running: dict[str, FakeContainer] = {}
+        self._lock = threading.Lock()
+
+    def run(self, image: str, **kwargs: Any) -> FakeContainer:
+        self._client.block(self._client.run_latency)
+        port = next(iter(kwargs["ports"].values()))
+        with self._lock:
+            if any(c.name == kwargs["name"] for c in self._running.values()):
+                raise APIError(f"Conflict. The container name {kwargs['name']!r} is already in use")
+            try:
+                container = FakeContainer(self._client, kwargs["name"], port, kwargs.get("labels") or {})
+            except OSError as e:
+                raise APIError(f"Bind for 127.0.0.1:{port} failed: {e}") from e
+            self._running[container.id] = container
+        self._client.started += 1
+        self._client.started_names[kwargs["name"]] += 1
+        return container
+
+    def get(self, container_id: str) -> FakeContainer:
+        self._client.block(self._client.call_latency)
+        container = self._running.get(container_id)
+        if container is None:
+            raise NotFound(f"No such container: {container_id}")
+        return container
+
+    def list(self, filters: dict | None = None, **kwargs: Any) -> list[FakeContainer]:
+        self._client.block(self._client.call_latency)
+        label = (filters or {}).get("label")
+        return [c for c in list(self._running.values()) if label is None or label in c.labels]
+
+    def forget(self, container: FakeContainer) -> None:
+        with self._lock:
+            self._running.pop(container.id, None)
+
+    def __len__(self) -> int:
+        return len(self._running)
+
+
+class _Api:
+    def __init__(self, client: FakeDockerClient) -> None:
+        self._client = client
+        self._ids = itertools.count()
+        self._execs: dict[str, list[str]] = {}
+
+    def exec_create(self, container_id: str, cmd: list[str], **kwargs: Any) -> dict:
+        self._client.block(self._client.call_latency)
+        self._client.containers.get(container_id)
+        exec_id = f"exec-{next(self._ids)}"
+        self._execs[exec_id] = cmd
+        return {"Id": exec_id}
+
+    def exec_start(self, exec_id: str, stream: bool = False, **kwargs: Any) -> Iterator[bytes]:
+        cmd = self._execs[exec_id]
+
+        def chunks() -> Iterator[bytes]:
+            self._client.block(self._client.exec_latency)
+            yield f"[fake docker] {' '.join(cmd)}\n".encode()
+
+        return chunks() if stream else b"".join(chunks())
+
+    def exec_inspect(self, exec_id: str) -> dict:
+        self._client.block(self._client.call_latency)
+        self._execs.pop(exec_id, None)
+        return {"ExitCode": 0}
+
+
+class FakeDockerClient:
+    """Latencies are seconds each call blocks: container start, stop, exec and any other call."""
+
+    def __init__(
+        self,
+        run_latency: float = 0.5,
+        stop_latency: float = 0.1,
+        exec_latency: float = 0.2,
+        call_latency: float = 0.005,
+        cpus: int = 64,
+        memory_mb: int = 256 * 1024,
+    ) -> None:
+        self.run_latency = run_latency
+        self.stop_latency = stop_latency
+        self.exec_latency = exec_latency
+        self.call_latency = call_latency
+        self._info = {"NCPU": cpus, "MemTotal": memory_mb * 1024 * 1024}
+        self.containers = _Containers(self)
+        self.api = _Api(self)
+        self.started = 0
+        self.started_names: Counter[str] = Counter()
+
+    @staticmethod
+    def block(seconds: float) -> None:
+        # time.sleep, not asyncio.sleep: docker-py holds its thread for the whole call
+        time.sleep(seconds)
+
+    def info(self) -> dict:
+        self.block(self.call_latency)
+        return dict(self._info)
+
+    def close(self) -> None:
+        for container in list(self.containers._running.values()):
+            container.stop()
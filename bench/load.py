@@ -0,0 +1,208 @@
+"""Load test for the Kitsune API.
+
+Starts the stub model server (bench/stub_model.py) and Kitsune itself with the fake
+sandbox backend, then drives --sessions concurrent sessions. Each session repeatedly
+opens its notebook sandbox, lists and watches its notebooks, sends a chat message and
+reads /sandbox/status. Reports throughput and latency percentiles per endpoint. For
+/notebooks/watch, latency is the time to the first event; for /chat, to the end of the
+stream. Pass --url to drive an already running server instead.
+
+    python bench/load.py --sessions 50 --duration 30
+    python bench/load.py --sessions 20 --start-latency 5 --exec-latency 0.5 --json results.json
+
+Server-side limits (CHAT_MAX_CONCURRENT etc.) come from the environment as usual;
+refused requests are counted per status code.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+class Recorder:
+    def __init__(self) -> None:
+        self.latencies: defaultdict[str, list[float]] = defaultdict(list)
+        self.errors: defaultdict[str, Counter] = defaultdict(Counter)
+
+    @contextmanager
+    def measure(self, endpoint: str):
+        start = time.perf_counter()
+        try:
+            yield
+        except httpx.HTTPStatusError as e:
+            self.errors[endpoint][e.response.status_code] += 1
+        except httpx.HTTPError as e:
+            self.errors[endpoint][type(e).__name__] += 1
+        else:
+            self.latencies[endpoint].append(time.perf_counter() - start)
+
+    def report(self, elapsed: float) -> dict:
+        def percentile(values: list[float], q: float) -> float:
+            return values[min(len(values) - 1, int(q * len(values)))] * 1000
+
+        report = {}
+        for endpoint in sorted(set(self.latencies) | set(self.errors)):
+            values = sorted(self.latencies[endpoint])
+            report[endpoint] = {
+                "ok": len(values),
+                "errors": dict(self.errors[endpoint]),
+                "rps": round(len(values) / elapsed, 2),
+                **{
+                    name: round(percentile(values, q), 1) if values else None
+                    for name, q in (("p50_ms", 0.5), ("p95_ms", 0.95), ("p99_ms", 0.99), ("max_ms", 1.0))
+                },
+            }
+        return report
+
+
+async def run_session(client: httpx.AsyncClient, recorder: Recorder, deadline: float, message: str) -> None:
+    session_id = f"load-{uuid.uuid4().hex[:8]}"
+    headers = {"x-session-id": session_id}
+    first = True
+    while time.monotonic() < deadline:
+        with recorder.measure("GET /notebooks/{id} (cold)" if first else "GET /notebooks/{id}"):
+            (await client.get(f"/notebooks/{session_id}")).raise_for_status()
+        first = False
+
+        with recorder.measure("GET /notebooks"):
+            (await client.get("/notebooks", headers=headers)).raise_for_status()
+
+        with recorder.measure("GET /notebooks/watch"):
+            async with client.stream("GET", "/notebooks/watch", params={"session_id": session_id}) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if line.startswith("data:"):
+                        break
+
+        body = {
+            "trigger": "submit-message",
+            "id": session_id,
+            "messages": [{"id": uuid.uuid4().hex, "role": "user", "parts": [{"type": "text", "text": message}]}],
+        }
+        with recorder.measure("POST /chat"):
+            async with client.stream("POST", "/chat", json=body, headers=headers) as response:
+                response.raise_for_status()
+                async for _ in response.aiter_bytes():
+                    pass
+
+        with recorder.measure("GET /sandbox/status"):
+            (await client.get("/sandbox/status")).raise_for_status()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_until_up(url: str, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(url, timeout=2)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def start_servers(args: argparse.Namespace, workdir: Path) -> tuple[str, list[subprocess.Popen]]:
+    model_port, app_port = free_port(), free_port()
+    model = subprocess.Popen([
+        sys.executable, str(ROOT / "bench" / "stub_model.py"),
+        "--port", str(model_port),
+        "--ttft", str(args.model_ttft),
+        "--tokens-per-second", str(args.model_tps),
+        "--tool-rate", str(args.tool_rate),
+    ])
+    env = {
+        **os.environ,
+        "SANDBOX_BACKEND": "fake",
+        "SANDBOX_FAKE_START_LATENCY": str(args.start_latency),
+        "SANDBOX_FAKE_EXEC_LATENCY": str(args.exec_latency),
+        "LOCAL_URL": f"http://127.0.0.1:{model_port}/v1",
+        "MODEL_ROUTING": "local",
+        "NOTEBOOK_DATA_DIR": str(workdir / "notebooks"),
+        "CONVERSATION_DB_PATH": str(workdir / "conversations.sqlite3"),
+        "SEARCH_CACHE_PATH": str(workdir / "search.sqlite3"),
+        "LOGFIRE_SEND_TO_LOGFIRE": "false",
+        "LOGFIRE_CONSOLE": "false",
+    }
+    for key in ("OPENROUTER_API_KEY", "LINKUP_API_KEY", "TAVILY_API_KEY"):
+        env.setdefault(key, "unused")
+    app = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(app_port), "--log-level", "warning"],
+        cwd=ROOT,
+        env=env,
+    )
+    return f"http://127.0.0.1:{app_port}", [model, app]
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=20, help="concurrent sessions")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to run")
+    parser.add_argument("--url", help="drive this running server instead of starting one")
+    parser.add_argument("--message", default="List my notebooks and summarize them.")
+    parser.add_argument("--start-latency", type=float, default=2.0, help="fake sandbox start, seconds")
+    parser.add_argument("--exec-latency", type=float, default=0.2, help="fake command/cell run, seconds")
+    parser.add_argument("--model-ttft", type=float, default=0.3, help="stub model time to first token, seconds")
+    parser.add_argument("--model-tps", type=float, default=80, help="stub model tokens per second")
+    parser.add_argument("--tool-rate", type=float, default=0.5, help="fraction of chat turns that call a tool")
+    parser.add_argument("--json", type=Path, help="also write the report here")
+    args = parser.parse_args()
+
+    processes: list[subprocess.Popen] = []
+    with tempfile.TemporaryDirectory() as workdir:
+        try:
+            url = args.url
+            if url is None:
+                url, processes = start_servers(args, Path(workdir))
+            await wait_until_up(f"{url}/sandbox/status")
+
+            recorder = Recorder()
+            limits = httpx.Limits(max_connections=args.sessions * 2, max_keepalive_connections=args.sessions * 2)
+            async with httpx.AsyncClient(base_url=url, limits=limits, timeout=120) as client:
+                started = time.monotonic()
+                deadline = started + args.duration
+                await asyncio.gather(*(
+                    run_session(client, recorder, deadline, args.message) for _ in range(args.sessions)
+                ))
+                elapsed = time.monotonic() - started
+        finally:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.wait()
+
+    report = recorder.report(elapsed)
+    print(f"{args.sessions} sessions, {elapsed:.1f}s")
+    print(f"{'endpoint':32} {'ok':>6} {'err':>5} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for endpoint, row in report.items():
+        cells = [f"{row[k]:>9}" if row[k] is not None else f"{'-':>9}" for k in ("p50_ms", "p95_ms", "p99_ms", "max_ms")]
+        print(f"{endpoint:32} {row['ok']:>6} {sum(row['errors'].values()):>5} {row['rps']:>8} {' '.join(cells)}")
+        if row["errors"]:
+            print(f"{'':32} errors: {row['errors']}")
+    if args.json:
+        args.json.write_text(json.dumps({"sessions": args.sessions, "elapsed": elapsed, "endpoints": report}, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,147 @@
+"""Concurrency stress test for SandboxManager against a fake Docker daemon.
+
+Hammers one session and then many sessions at once and checks the guarantees that
+concurrent callers rely on:
+
+- single flight: simultaneous get_or_create calls for one session start one container;
+- port reservation: no two live containers share a host port, and a port is released
+  exactly when its container stops;
+- no leaks: running containers match the sessions and pool, and shutdown stops them all.
+
+Phase one sends --callers concurrent get_or_create calls for a single session. Phase two
+runs --workers tasks over --sessions sessions; each round a task opens its session,
+runs a command in it and sometimes destroys it. Docker is bench/fake_docker.py, so
+calls block their executor threads like docker-py does. Exits non-zero if a check fails.
+
+    python bench/sandbox_stress.py
+    python bench/sandbox_stress.py --sessions 60 --workers 300 --pool 4 --run-latency 0.2
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+for key in ("OPENROUTER_API_KEY", "LINKUP_API_KEY", "TAVILY_API_KEY"):
+    os.environ.setdefault(key, "unused")
+
+from fake_docker import FakeDockerClient  # noqa: E402
+from load import Recorder  # noqa: E402
+
+from kitsune.services.docker_client import AsyncDocker  # noqa: E402
+from kitsune.services.sandbox import _NAME_PREFIX, SandboxManager  # noqa: E402
+
+
+def sample(manager: SandboxManager, name: str) -> float:
+    return next(m.value for m in manager.metrics() if m.name == name)
+
+
+class Checks:
+    def __init__(self) -> None:
+        self.failures: list[str] = []
+
+    def expect(self, ok: bool, message: str) -> None:
+        print(f"  {'ok  ' if ok else 'FAIL'} {message}")
+        if not ok:
+            self.failures.append(message)
+
+    def invariants(self, manager: SandboxManager, client: FakeDockerClient) -> None:
+        sessions = manager.status()["sessions"]
+        ports = [s["host_port"] for s in sessions]
+        pooled = sample(manager, "kitsune_sandbox_pool_idle") + sample(manager, "kitsune_sandbox_pool_starting")
+        self.expect(len(ports) == len(set(ports)), f"{len(ports)} sessions on distinct ports")
+        self.expect(
+            sample(manager, "kitsune_sandbox_ports_in_use") == len(sessions) + pooled,
+            "reserved ports match sessions plus pool",
+        )
+        self.expect(
+            len(client.containers) == len(sessions) + sample(manager, "kitsune_sandbox_pool_idle"),
+            f"{len(client.containers)} running containers match sessions plus idle pool",
+        )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--callers", type=int, default=100, help="concurrent callers for the single session")
+    parser.add_argument("--sessions", type=int, default=40)
+    parser.add_argument("--workers", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--destroy-rate", type=float, default=0.3, help="chance a round ends by destroying")
+    parser.add_argument("--pool", type=int, default=0, help="MARIMO_POOL_SIZE")
+    parser.add_argument("--run-latency", type=float, default=0.3, help="fake container start, seconds")
+    parser.add_argument("--exec-latency", type=float, default=0.05, help="fake command run, seconds")
+    parser.add_argument("--port-start", type=int, default=19100, help="start of the host port range")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.environ.update({
+            "NOTEBOOK_DATA_DIR": workdir,
+            "MARIMO_POOL_SIZE": str(args.pool),
+            "MARIMO_PORT_START": str(args.port_start),
+            "MARIMO_PORT_END": str(args.port_start + args.sessions + args.pool + 10),
+            "SANDBOX_KEEP_ON_SHUTDOWN": "0",
+        })
+        client = FakeDockerClient(run_latency=args.run_latency, exec_latency=args.exec_latency)
+        manager = SandboxManager(AsyncDocker(client))
+        await manager.startup()
+        recorder = Recorder()
+        checks = Checks()
+
+        print(f"Phase 1: {args.callers} concurrent get_or_create calls for one session")
+
+        async def open_one():
+            with recorder.measure("get_or_create (one session)"):
+                return await manager.get_or_create("one")
+
+        infos = await asyncio.gather(*(open_one() for _ in range(args.callers)))
+        checks.expect(len({i.container_id for i in infos}) == 1, "every caller got the same container")
+        # Pool refills start containers too; only ones named for the session count
+        started = client.started_names[f"{_NAME_PREFIX}one"]
+        checks.expect(started <= 1, f"{started} container started for it")
+        checks.invariants(manager, client)
+        await manager.destroy("one")
+
+        print(f"Phase 2: {args.workers} workers over {args.sessions} sessions, {args.rounds} rounds each")
+        wall = time.monotonic()
+
+        async def worker(session_id: str) -> None:
+            for _ in range(args.rounds):
+                with recorder.measure("get_or_create"):
+                    await manager.get_or_create(session_id)
+                with recorder.measure("exec_in_container"):
+                    try:
+                        await manager.exec_in_container(session_id, ["echo", "hi"])
+                    except RuntimeError:
+                        pass  # destroyed by another worker of the same session in between
+                if random.random() < args.destroy_rate:
+                    with recorder.measure("destroy"):
+                        await manager.destroy(session_id)
+
+        await asyncio.gather(*(worker(f"s{i % args.sessions}") for i in range(args.workers)))
+        elapsed = time.monotonic() - wall
+        checks.invariants(manager, client)
+
+        await manager.shutdown()
+        print("After shutdown")
+        checks.expect(len(client.containers) == 0, f"{len(client.containers)} containers left running")
+        checks.expect(sample(manager, "kitsune_sandbox_ports_in_use") == 0, "every port released")
+
+    print(f"\n{client.started} containers started, phase 2 took {elapsed:.1f}s")
+    print(f"{'operation':30} {'ok':>6} {'err':>5} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}")
+    for operation, row in recorder.report(elapsed).items():
+        cells = [f"{row[k]:>9}" if row[k] is not None else f"{'-':>9}" for k in ("p50_ms", "p95_ms", "max_ms")]
+        print(f"{operation:30} {row['ok']:>6} {sum(row['errors'].values()):>5} {' '.join(cells)}")
+    if checks.failures:
+        sys.exit(f"{len(checks.failures)} check(s) failed")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,98 @@
+"""Search request latency with a client per call versus Kitsune's pooled HTTP client.
+
+Starts the stub search server (bench/stub_search.py) and sends --requests LinkUp
+search requests from --concurrency workers twice: once opening a new httpx client
+per request, as the search tools did before the shared clients, and once through
+`http_clients.get("linkup")`. Reports latency percentiles and throughput for both.
+Outbound rate limits and the search cache are left out, so only connection handling
+differs. Pass --url to target another LinkUp-compatible server.
+
+    python bench/search_latency.py --requests 500 --concurrency 16 --latency 0.05
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+for key in ("OPENROUTER_API_KEY", "LINKUP_API_KEY", "TAVILY_API_KEY"):
+    os.environ.setdefault(key, "unused")
+
+from load import Recorder, free_port, wait_until_up  # noqa: E402
+
+from kitsune.services.http import http_clients  # noqa: E402
+
+
+async def drive(url: str, recorder: Recorder, mode: str, requests: int, concurrency: int) -> float:
+    pending = iter(range(requests))
+
+    async def post(client: httpx.AsyncClient, i: int) -> None:
+        payload = {"q": f"query {i}", "depth": "standard", "outputType": "sourcedAnswer"}
+        (await client.post(f"{url}/search", json=payload)).raise_for_status()
+
+    async def worker() -> None:
+        for i in pending:
+            with recorder.measure(mode):
+                if mode == "per-call":
+                    async with httpx.AsyncClient(timeout=30) as client:
+                        await post(client, i)
+                else:
+                    await post(http_clients.get("linkup"), i)
+
+    started = time.monotonic()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.monotonic() - started
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.05, help="stub server latency, seconds")
+    parser.add_argument("--url", help="LinkUp-compatible server to use instead of the stub")
+    parser.add_argument("--json", type=Path, help="also write the report here")
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if url is None:
+        port = free_port()
+        server = subprocess.Popen([
+            sys.executable, str(ROOT / "bench" / "stub_search.py"),
+            "--port", str(port), "--latency", str(args.latency),
+        ])
+        url = f"http://127.0.0.1:{port}"
+    try:
+        await wait_until_up(f"{url}/docs" if server else url)
+        report = {}
+        for mode in ("per-call", "pooled"):
+            recorder = Recorder()
+            elapsed = await drive(url, recorder, mode, args.requests, args.concurrency)
+            report[mode] = recorder.report(elapsed)[mode]
+        await http_clients.aclose()
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    print(f"{args.requests} requests, concurrency {args.concurrency}, server latency {args.latency * 1000:.0f} ms")
+    print(f"{'client':10} {'ok':>6} {'err':>5} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for mode, row in report.items():
+        cells = [f"{row[k]:>9}" if row[k] is not None else f"{'-':>9}" for k in ("p50_ms", "p95_ms", "p99_ms", "max_ms")]
+        print(f"{mode:10} {row['ok']:>6} {sum(row['errors'].values()):>5} {row['rps']:>8} {' '.join(cells)}")
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
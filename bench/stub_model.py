@@ -0,0 +1,120 @@
+"""Stub OpenAI-compatible chat completions server for load tests.
+
+Answers every request with canned text after a fixed time to first token, then streams
+tokens at a fixed rate. With --tool-rate, that fraction of fresh user turns is answered
+with a call to a tool that takes no arguments (list_notebooks when offered), so agent
+runs also exercise the tool path.
+
+    python bench/stub_model.py --port 11500 --ttft 0.3 --tokens-per-second 80
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+_WORDS = "the notebook loads the data frame and plots the monthly totals by region".split()
+
+
+def create_app(ttft: float, tokens_per_second: float, reply_tokens: int, tool_rate: float) -> FastAPI:
+    app = FastAPI(title="Stub model")
+
+    def pick_tool(body: dict) -> str | None:
+        messages = body.get("messages") or []
+        tools = [t["function"]["name"] for t in body.get("tools") or []]
+        if not tools or not messages or messages[-1].get("role") != "user" or random.random() >= tool_rate:
+            return None
+        return "list_notebooks" if "list_notebooks" in tools else None
+
+    def usage(body: dict, completion_tokens: int) -> dict:
+        prompt_tokens = len(json.dumps(body.get("messages"))) // 4
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+
+    @app.post("/v1/chat/completions")
+    async def completions(request: Request):
+        body = await request.json()
+        model = body.get("model", "stub")
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        tool = pick_tool(body)
+        words = [random.choice(_WORDS) for _ in range(reply_tokens)]
+        tool_call = {
+            "id": f"call_{uuid.uuid4().hex[:12]}",
+            "type": "function",
+            "function": {"name": tool, "arguments": "{}"},
+        }
+
+        if not body.get("stream"):
+            await asyncio.sleep(ttft + (0 if tool else reply_tokens / tokens_per_second))
+            message = (
+                {"role": "assistant", "content": None, "tool_calls": [tool_call]} if tool
+                else {"role": "assistant", "content": " ".join(words)}
+            )
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if tool else "stop"}],
+                "usage": usage(body, 1 if tool else reply_tokens),
+            }
+
+        def chunk(delta: dict, finish_reason: str | None = None, **extra) -> str:
+            choices = [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if delta is not None else []
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": choices,
+                **extra,
+            }
+            return f"data: {json.dumps(payload)}\n\n"
+
+        async def stream():
+            await asyncio.sleep(ttft)
+            if tool:
+                yield chunk({"role": "assistant", "tool_calls": [{"index": 0, **tool_call}]})
+                yield chunk({}, "tool_calls")
+                completion_tokens = 1
+            else:
+                for i, word in enumerate(words):
+                    yield chunk({"role": "assistant", "content": word if i == 0 else f" {word}"})
+                    await asyncio.sleep(1 / tokens_per_second)
+                yield chunk({}, "stop")
+                completion_tokens = reply_tokens
+            yield chunk(None, usage=usage(body, completion_tokens))
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--ttft", type=float, default=0.3, help="seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=80)
+    parser.add_argument("--reply-tokens", type=int, default=40)
+    parser.add_argument("--tool-rate", type=float, default=0.0, help="fraction of user turns answered with a tool call")
+    args = parser.parse_args()
+    app = create_app(args.ttft, args.tokens_per_second, args.reply_tokens, args.tool_rate)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
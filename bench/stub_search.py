@@ -0,0 +1,53 @@
+"""Stub LinkUp-compatible search server for benchmarks.
+
+Answers /search and /fetch with canned results after a fixed latency, so client-side
+costs (connection setup, pooling, rate limiting) are what a benchmark measures.
+
+    python bench/stub_search.py --port 11600 --latency 0.05
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+
+import uvicorn
+from fastapi import FastAPI, Request
+
+
+def create_app(latency: float) -> FastAPI:
+    app = FastAPI(title="Stub search")
+
+    @app.post("/search")
+    async def search(request: Request):
+        body = await request.json()
+        await asyncio.sleep(latency)
+        query = body.get("q", "")
+        return {
+            "answer": f"Stub answer for {query!r}.",
+            "sources": [
+                {"name": f"Result {i}", "url": f"https://example.com/{i}", "snippet": f"About {query}."}
+                for i in range(3)
+            ],
+        }
+
+    @app.post("/fetch")
+    async def fetch(request: Request):
+        body = await request.json()
+        await asyncio.sleep(latency)
+        return {"markdown": f"# {body.get('url', '')}\n\nStub page."}
+
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11600)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds before each response")
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.latency), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
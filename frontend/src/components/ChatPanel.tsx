@@ -1,6 +1,6 @@
 import { useState, useEffect, useRef } from "react";
 import { useChat } from "@ai-sdk/react";
-import { DefaultChatTransport } from "ai";
+import { DefaultChatTransport, type UIMessage } from "ai";
 import { Send, Sparkles } from "lucide-react";
 import { useSession } from "@/hooks/useSession";
 
@@ -10,13 +10,27 @@ export function ChatPanel() {
   const scrollRef = useRef<HTMLDivElement>(null);
   const [inputFocused, setInputFocused] = useState(false);
 
-  const { messages, status, sendMessage } = useChat({
+  const { messages, status, sendMessage, setMessages } = useChat({
     transport: new DefaultChatTransport({
       api: "/chat",
       headers: { "x-session-id": sessionId },
+      // The server keeps the conversation history, so only send the new message
+      prepareSendMessagesRequest: ({ id, messages, trigger, messageId }) => ({
+        body: { id, trigger, messageId, messages: messages.slice(-1) },
+      }),
     }),
   });
 
+  // Restore the most recent page of this session's history
+  useEffect(() => {
+    fetch(`/sessions/${sessionId}/messages`)
+      .then((r) => r.json())
+      .then((data: { messages: UIMessage[] }) => {
+        setMessages((current) => (current.length === 0 ? data.messages : current));
+      })
+      .catch(() => {});
+  }, [sessionId, setMessages]);
+
   const isLoading = status === "submitted" || status === "streaming";
 
   useEffect(() => {
@@ -29,8 +29,7 @@ export function useNotebooks() {
     const es = new EventSource(`/notebooks/watch?session_id=${sessionId}`);
     let initialized = false;
 
-    es.onmessage = (e) => {
-      const data: Notebook[] = JSON.parse(e.data);
+    const apply = (data: Notebook[]) => {
       sharedNotebooks = data;
 
       if (!initialized) {
@@ -44,6 +43,20 @@ export function useNotebooks() {
       notify();
     };
 
+    // Full listing: sent on connect, and again if the server had to resync us
+    es.onmessage = (e) => apply(JSON.parse(e.data));
+
+    // Incremental update: notebooks added or removed since the last event
+    es.addEventListener("diff", (e) => {
+      const { added, removed }: { added: Notebook[]; removed: Notebook[] } = JSON.parse(
+        (e as MessageEvent).data,
+      );
+      const gone = new Set(removed.map((nb) => nb.name));
+      const next = sharedNotebooks.filter((nb) => !gone.has(nb.name)).concat(added);
+      next.sort((a, b) => a.name.localeCompare(b.name));
+      apply(next);
+    });
+
     return () => es.close();
   }, [sessionId]);
 
@@ -0,0 +1,304 @@
+"""Keeping long conversations within a token budget before each model request."""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+from collections import OrderedDict
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from dataclasses import replace
+from typing import Any
+
+import logfire
+from pydantic_ai import Agent, RunContext
+from pydantic_ai.messages import (
+    ModelMessage,
+    ModelRequest,
+    ModelResponse,
+    TextPart,
+    ToolCallPart,
+    ToolReturnPart,
+    UserPromptPart,
+)
+from pydantic_ai.models import Model, ModelRequestParameters, StreamedResponse
+from pydantic_ai.models.wrapper import WrapperModel
+from pydantic_ai.settings import ModelSettings
+from pydantic_ai.usage import RequestUsage
+
+from kitsune.logging import get_logger
+from kitsune.services.metrics import Histogram
+
+logger = get_logger("history")
+
+# Rough tokens per character for budgeting; exact counts come back in each response's usage
+_CHARS_PER_TOKEN = 4
+
+_SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+# Notebook tools whose result is made stale by a later call of the same kind for the same notebook
+_SUPERSEDED_BY = {"read_notebook": "source", "list_cells": "source", "run_notebook": "run"}
+
+Turn = list[ModelMessage]
+
+
+def estimate_tokens(messages: list[ModelMessage]) -> int:
+    chars = 0
+    for message in messages:
+        for part in message.parts:
+            if isinstance(part, ToolReturnPart):
+                chars += len(part.model_response_str())
+            elif isinstance(part, ToolCallPart):
+                chars += len(part.args_as_json_str())
+            elif isinstance(getattr(part, "content", None), str):
+                chars += len(part.content)
+    return chars // _CHARS_PER_TOKEN
+
+
+def _split_turns(messages: list[ModelMessage]) -> list[Turn]:
+    """Group messages into turns, each starting at a request that carries a user prompt.
+
+    Cutting only at turn boundaries keeps every tool call next to its return.
+    """
+    turns: list[Turn] = []
+    for message in messages:
+        starts_turn = isinstance(message, ModelRequest) and any(
+            isinstance(p, UserPromptPart) for p in message.parts
+        )
+        if starts_turn or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def _superseded(messages: list[ModelMessage]) -> set[str]:
+    """Tool call ids of notebook reads and runs followed by a later one of the same notebook."""
+    keys: dict[str, tuple[str, Any]] = {}
+    latest: dict[tuple[str, Any], str] = {}
+    for message in messages:
+        for part in message.parts:
+            if isinstance(part, ToolCallPart) and part.tool_name in _SUPERSEDED_BY:
+                try:
+                    name = part.args_as_dict().get("name")
+                except (ValueError, AssertionError):
+                    continue  # Malformed arguments; the call failed anyway
+                keys[part.tool_call_id] = (_SUPERSEDED_BY[part.tool_name], name)
+            elif isinstance(part, ToolReturnPart) and part.tool_call_id in keys:
+                latest[keys[part.tool_call_id]] = part.tool_call_id
+    return set(keys) - set(latest.values())
+
+
+def _transcript(turns: list[Turn], limit: int = 600) -> str:
+    def clip(text: str) -> str:
+        return text if len(text) <= limit else text[:limit] + " [...]"
+
+    lines = []
+    for message in (m for turn in turns for m in turn):
+        for part in message.parts:
+            if isinstance(part, UserPromptPart):
+                content = part.content if isinstance(part.content, str) else "[non-text content]"
+                lines.append(f"User: {clip(content)}")
+            elif isinstance(part, TextPart):
+                lines.append(f"Assistant: {clip(part.content)}")
+            elif isinstance(part, ToolCallPart):
+                lines.append(f"Tool call {part.tool_name}: {clip(part.args_as_json_str())}")
+            elif isinstance(part, ToolReturnPart):
+                lines.append(f"Tool result {part.tool_name}: {clip(part.model_response_str())}")
+    return "\n".join(lines)
+
+
+class HistoryCompactor:
+    """Keeps the context sent to the model within a token budget.
+
+    Tool results longer than `tool_result_max_chars` are replaced by a short reference,
+    as they can be fetched again with the same tool, unless they are in the last
+    `keep_turns` turns and among the last `keep_tool_steps` model requests that returned
+    tool results. The step limit matters for long agent runs, which are a single turn.
+    Notebook reads and runs followed by a later read or run of the same notebook are
+    replaced in recent turns too. If the history is still over `token_budget`, turns
+    before the last `keep_turns` are replaced by a model-written summary. Turns are summarized in
+    blocks of `summary_chunk` so the summarized prefix, and its cached summary, only
+    changes every few turns. The stored conversation is never modified: CompactingModel
+    applies this to a copy of the history for each request.
+    """
+
+    def __init__(
+        self,
+        model: Model,
+        token_budget: int,
+        keep_turns: int,
+        tool_result_max_chars: int,
+        keep_tool_steps: int = 4,
+        summary_chunk: int = 4,
+        summary_timeout: float = 30,
+        cache_size: int = 256,
+    ) -> None:
+        self._summarizer = Agent(
+            model,
+            output_type=str,
+            instructions=(
+                "Summarize the conversation transcript for the assistant that will continue it. "
+                "Keep the user's goals, decisions made, notebook and file names, key results and "
+                "open problems. Be concise; use short bullet points."
+            ),
+        )
+        self._token_budget = token_budget
+        self._keep_turns = keep_turns
+        self._tool_result_max_chars = tool_result_max_chars
+        self._keep_tool_steps = keep_tool_steps
+        self._summary_chunk = summary_chunk
+        self._summary_timeout = summary_timeout
+        self._summaries: OrderedDict[str, str] = OrderedDict()
+        self._cache_size = cache_size
+        self.context_tokens = Histogram((1000, 2000, 4000, 8000, 16000, 32000, 64000, 128000))
+        self._counters = {
+            "requests": 0,
+            "tool_results_elided": 0,
+            "tool_results_superseded": 0,
+            "summaries": 0,
+            "summary_failures": 0,
+        }
+
+    async def process(self, ctx: RunContext[Any] | None, messages: list[ModelMessage]) -> list[ModelMessage]:
+        before = estimate_tokens(messages)
+        turns = _split_turns(messages)
+        split = max(0, len(turns) - self._keep_turns)
+        steps = [
+            m for m in messages
+            if isinstance(m, ModelRequest) and any(isinstance(p, ToolReturnPart) for p in m.parts)
+        ]
+        stale = {id(m) for m in steps[:max(0, len(steps) - self._keep_tool_steps)]}
+        stale.update(id(m) for turn in turns[:split] for m in turn)
+        # Old turns only lose long results, so the transcripts behind cached summaries stay put
+        superseded = _superseded([m for turn in turns[split:] for m in turn])
+        turns = [self._elide_tool_results(turn, stale, superseded) for turn in turns]
+        old, recent = turns[:split], turns[split:]
+
+        compacted = [m for turn in turns for m in turn]
+        if old and estimate_tokens(compacted) > self._token_budget:
+            cut = len(old) - len(old) % self._summary_chunk
+            if cut:
+                summary = await self._summary(old[:cut])
+                head = ModelRequest(parts=[UserPromptPart(_SUMMARY_PREFIX + summary)])
+                compacted = [head, *(m for turn in old[cut:] + recent for m in turn)]
+
+        self._record(ctx, before, estimate_tokens(compacted))
+        return compacted
+
+    def stats(self) -> dict:
+        return {**self._counters, "context_tokens": self.context_tokens.snapshot()}
+
+    # -- internal --
+
+    def _record(self, ctx: RunContext[Any] | None, before: int, after: int) -> None:
+        self._counters["requests"] += 1
+        self.context_tokens.observe(after)
+        # Estimates next to the input tokens the model server has actually reported this run
+        logfire.info(
+            "history {tokens_after} tokens (from {tokens_before})",
+            tokens_before=before,
+            tokens_after=after,
+            run_input_tokens=ctx.usage.input_tokens if ctx and ctx.usage else None,
+            run_step=ctx.run_step if ctx else None,
+        )
+
+    def _elide_tool_results(self, turn: Turn, stale: set[int], superseded: set[str]) -> Turn:
+        result: Turn = []
+        for message in turn:
+            if isinstance(message, ModelRequest):
+                parts = [self._elide(part, id(message) in stale, superseded) for part in message.parts]
+                if any(new is not old for new, old in zip(parts, message.parts)):
+                    # Copies, so the messages stored for the conversation keep the full results
+                    message = replace(message, parts=parts)
+            result.append(message)
+        return result
+
+    def _elide(self, part: Any, stale: bool, superseded: set[str]) -> Any:
+        if not isinstance(part, ToolReturnPart):
+            return part
+        if part.tool_call_id in superseded:
+            self._counters["tool_results_superseded"] += 1
+            return replace(part, content=(
+                f"[Result of {part.tool_name} omitted: a later call for the same notebook supersedes it.]"
+            ))
+        size = len(part.model_response_str())
+        if not stale or size <= self._tool_result_max_chars:
+            return part
+        self._counters["tool_results_elided"] += 1
+        return replace(part, content=(
+            f"[Earlier result of {part.tool_name} omitted ({size} chars). "
+            "Call the tool again if you need it.]"
+        ))
+
+    async def _summary(self, turns: list[Turn]) -> str:
+        # Summaries build on the summary of the previous block, so each block is summarized once
+        key = hashlib.sha256(_transcript(turns).encode()).hexdigest()
+        if key in self._summaries:
+            self._summaries.move_to_end(key)
+            return self._summaries[key]
+
+        previous = ""
+        if len(turns) > self._summary_chunk:
+            previous = await self._summary(turns[:-self._summary_chunk])
+        transcript = _transcript(turns[-self._summary_chunk:])
+        prompt = f"{_SUMMARY_PREFIX}{previous}\n\nNew turns:\n{transcript}" if previous else transcript
+        try:
+            result = await asyncio.wait_for(self._summarizer.run(prompt), self._summary_timeout)
+            summary = result.output.strip()
+            self._counters["summaries"] += 1
+        except Exception as e:
+            # Fall back to the clipped transcript itself: worse, but still bounded and never blocks the run
+            logger.warning(f"History summary failed, using transcript excerpt: {e!r}")
+            self._counters["summary_failures"] += 1
+            summary = "\n".join(filter(None, [previous, _transcript(turns[-self._summary_chunk:], limit=150)]))
+
+        self._summaries[key] = summary
+        while len(self._summaries) > self._cache_size:
+            self._summaries.popitem(last=False)
+        return summary
+
+
+class CompactingModel(WrapperModel):
+    """Model that sends each request with its history compacted by a HistoryCompactor.
+
+    Not a history processor: pydantic-ai keeps a processor's output as the run's history,
+    so elided results and summaries would come back from new_messages() and be stored,
+    and the next step would summarize the summary. Here only the messages sent are
+    compacted, always starting from the full history.
+    """
+
+    def __init__(self, wrapped: Model, compactor: HistoryCompactor) -> None:
+        super().__init__(wrapped)
+        self.compactor = compactor
+
+    async def request(
+        self,
+        messages: list[ModelMessage],
+        model_settings: ModelSettings | None,
+        model_request_parameters: ModelRequestParameters,
+    ) -> ModelResponse:
+        messages = await self.compactor.process(None, messages)
+        return await self.wrapped.request(messages, model_settings, model_request_parameters)
+
+    async def count_tokens(
+        self,
+        messages: list[ModelMessage],
+        model_settings: ModelSettings | None,
+        model_request_parameters: ModelRequestParameters,
+    ) -> RequestUsage:
+        messages = await self.compactor.process(None, messages)
+        return await self.wrapped.count_tokens(messages, model_settings, model_request_parameters)
+
+    @asynccontextmanager
+    async def request_stream(
+        self,
+        messages: list[ModelMessage],
+        model_settings: ModelSettings | None,
+        model_request_parameters: ModelRequestParameters,
+        run_context: RunContext[Any] | None = None,
+    ) -> AsyncIterator[StreamedResponse]:
+        messages = await self.compactor.process(run_context, messages)
+        async with self.wrapped.request_stream(
+            messages, model_settings, model_request_parameters, run_context
+        ) as response:
+            yield response
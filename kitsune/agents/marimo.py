@@ -1,103 +1,76 @@
+import asyncio
 import re
-import textwrap
 from dataclasses import dataclass
-from importlib.metadata import version
-from typing import Any
+from typing import Any, Callable
 
-from pydantic import BaseModel, Field
 from pydantic_ai import Agent, RunContext
 from pydantic_ai.models.openai import OpenAIChatModel
 from pydantic_ai.providers.openai import OpenAIProvider
 
+from kitsune.agents.history import CompactingModel, HistoryCompactor
+from kitsune.agents.notebook import CellSpec, NotebookCache, ParsedNotebook, build_notebook
+from kitsune.agents.routing import Backend, RoutedModel
+from kitsune.agents.tools import tool_calls
 from kitsune.config import get_config
-from kitsune.services.sandbox import SandboxManager
+from kitsune.services.sandbox import SandboxBackend
 
 config = get_config()
 
+# Parsed notebooks shared by all sessions' tool calls, keyed by file path
+notebook_cache = NotebookCache(config.NOTEBOOK_CACHE_MAX_BYTES)
+
 
 # -- Deps --
 
 @dataclass
 class MarimoAgentDeps:
     session_id: str
-    sandbox: SandboxManager
-
-
-# -- Notebook builder helpers --
-
-_MARIMO_VERSION = version("marimo")
-
-MARIMO_HEADER = f"""\
-import marimo
-
-__generated_with = "{_MARIMO_VERSION}"
-app = marimo.App(width="medium")
-"""
-
-MARIMO_FOOTER = """\
-if __name__ == "__main__":
-    app.run()
-"""
-
-
-class CellSpec(BaseModel):
-    """Specification for a single marimo notebook cell."""
-
-    code: str = Field(description="Python code for the cell body.")
-    deps: list[str] = Field(
-        default_factory=list,
-        description="Variable names this cell needs from other cells (become function params).",
-    )
-    returns: list[str] = Field(
-        default_factory=list,
-        description="Variable names this cell exports (become the return tuple).",
-    )
-    name: str = Field(
-        default="_",
-        description="Optional cell function name. Use '_' for anonymous.",
-    )
-
-
-def _cell_to_source(cell: CellSpec) -> str:
-    params = ", ".join(cell.deps) if cell.deps else ""
-    sig = f"def {cell.name}({params}):"
-    body = textwrap.indent(textwrap.dedent(cell.code).strip(), "    ")
-
-    if cell.returns:
-        ret = ", ".join(cell.returns)
-        ret_line = f"    return ({ret},)" if len(cell.returns) == 1 else f"    return ({ret})"
-    else:
-        ret_line = "    return"
-
-    return f"@app.cell\n{sig}\n{body}\n{ret_line}"
-
-
-def _build_notebook(cells: list[CellSpec]) -> str:
-    parts = [MARIMO_HEADER]
-    for cell in cells:
-        parts.append("")
-        parts.append(_cell_to_source(cell))
-    parts.append("")
-    parts.append("")
-    parts.append(MARIMO_FOOTER)
-    return "\n".join(parts) + "\n"
+    sandbox: SandboxBackend
+    # Receives progress events (e.g. notebook output) while a tool is still running
+    progress: Callable[[dict[str, Any]], None] | None = None
 
 
 # -- Agent + Tools --
 
-model = OpenAIChatModel(
-    provider=OpenAIProvider(base_url=config.LOCAL_URL),
-    model_name=config.LOCAL_MODEL,
+local = Backend(
+    name="local",
+    model=OpenAIChatModel(
+        provider=OpenAIProvider(base_url=config.LOCAL_URL),
+        model_name=config.LOCAL_MODEL,
+    ),
+    capacity=config.LOCAL_MAX_CONCURRENCY,
+)
+openrouter = Backend(
+    name="openrouter",
+    model=OpenAIChatModel(
+        provider=OpenAIProvider(base_url=config.OPENROUTER_URL, api_key=config.OPENROUTER_API_KEY),
+        model_name=config.OPENROUTER_MODEL,
+    ),
+    capacity=config.OPENROUTER_MAX_CONCURRENCY,
+)
+backends = {"auto": [local, openrouter], "local": [local], "openrouter": [openrouter]}[config.MODEL_ROUTING]
+model = RoutedModel(backends, timeout=config.MODEL_TIMEOUT, cooldown=config.MODEL_FAILURE_COOLDOWN)
+
+# Keeps long sessions' context small: stale tool output is dropped, old turns summarized
+history = HistoryCompactor(
+    model,
+    token_budget=config.HISTORY_TOKEN_BUDGET,
+    keep_turns=config.HISTORY_KEEP_TURNS,
+    tool_result_max_chars=config.HISTORY_TOOL_RESULT_MAX_CHARS,
+    keep_tool_steps=config.HISTORY_KEEP_TOOL_STEPS,
+    summary_chunk=config.HISTORY_SUMMARY_CHUNK,
 )
 
 agent = Agent(
-    model=model,
+    model=CompactingModel(model, history),
     deps_type=MarimoAgentDeps,
     instructions=(
         "You are Kitsune, an AI data analysis assistant. "
         "You can create and run marimo notebooks for interactive data analysis. "
         "When asked to analyze data or create visualizations, write a marimo notebook "
-        "using the write_notebook tool, then run it with run_notebook to verify it works."
+        "using the write_notebook tool, then run it with run_notebook to verify it works. "
+        "To change an existing notebook, use list_cells and the insert_cell, replace_cell, "
+        "delete_cell and move_cell tools instead of rewriting the whole notebook."
     ),
 )
 
@@ -106,6 +79,13 @@ def _user_dir(ctx: RunContext[MarimoAgentDeps]):
     return ctx.deps.sandbox.get_user_dir(ctx.deps.session_id)
 
 
+def _progress(ctx: RunContext[MarimoAgentDeps], **fields: Any) -> Callable[[Any], None] | None:
+    emit = ctx.deps.progress
+    if emit is None:
+        return None
+    return lambda update: emit({**fields, "update": update})
+
+
 def _safe_name(name: str) -> str:
     """Sanitize notebook name to prevent directory traversal."""
     # Strip path separators and keep only safe characters
@@ -117,6 +97,7 @@ def _safe_name(name: str) -> str:
 
 
 @agent.tool
+@tool_calls.timed
 async def list_notebooks(ctx: RunContext[MarimoAgentDeps]) -> list[dict[str, str]]:
     """List all marimo notebooks in the user's notebook directory."""
     nb_dir = _user_dir(ctx)
@@ -129,16 +110,22 @@ async def list_notebooks(ctx: RunContext[MarimoAgentDeps]) -> list[dict[str, str
 
 
 @agent.tool
+@tool_calls.timed
 async def read_notebook(ctx: RunContext[MarimoAgentDeps], name: str) -> str:
     """Read the full source code of a marimo notebook by name (without .py extension)."""
     name = _safe_name(name)
     path = _user_dir(ctx) / f"{name}.py"
     if not path.exists():
         return f"Error: notebook '{name}' not found."
-    return path.read_text(encoding="utf-8")
+    try:
+        return notebook_cache.get(path).source
+    except SyntaxError:
+        # Still return unparsable notebooks so the model can see and fix them
+        return path.read_text(encoding="utf-8")
 
 
 @agent.tool
+@tool_calls.timed
 async def write_notebook(ctx: RunContext[MarimoAgentDeps], name: str, cells: list[CellSpec]) -> str:
     """Create or overwrite a marimo notebook.
 
@@ -150,16 +137,122 @@ async def write_notebook(ctx: RunContext[MarimoAgentDeps], name: str, cells: lis
     nb_dir = _user_dir(ctx)
     nb_dir.mkdir(parents=True, exist_ok=True)
     path = nb_dir / f"{name}.py"
-    source = _build_notebook(cells)
+    source = build_notebook(cells)
     path.write_text(source, encoding="utf-8")
+    notebook_cache.invalidate(path)
     return f"Notebook written to {path.name} ({len(cells)} cells)."
 
 
+def _edit_notebook(ctx: RunContext[MarimoAgentDeps], name: str, edit: Callable[[ParsedNotebook], str]) -> str:
+    """Apply edit to the parsed notebook and write it back only if the source changed."""
+    name = _safe_name(name)
+    path = _user_dir(ctx) / f"{name}.py"
+    if not path.exists():
+        return f"Error: notebook '{name}' not found."
+    try:
+        cached = notebook_cache.get(path)
+        notebook = cached.notebook.copy()
+        message = edit(notebook)
+    except (SyntaxError, IndexError, KeyError) as e:
+        return f"Error: {e}"
+    if notebook.render() == cached.source:
+        return f"{message} No changes to write."
+    notebook_cache.write(path, notebook)
+    return f"{message} Notebook now has {len(notebook.cells)} cells."
+
+
+@agent.tool
+@tool_calls.timed
+async def list_cells(ctx: RunContext[MarimoAgentDeps], name: str) -> list[dict[str, Any]] | str:
+    """List a notebook's cells with their index, name, deps and returns.
+
+    Use the index (or a unique non-'_' name) to target a cell with
+    replace_cell, delete_cell, move_cell or insert_cell.
+    """
+    name = _safe_name(name)
+    path = _user_dir(ctx) / f"{name}.py"
+    if not path.exists():
+        return f"Error: notebook '{name}' not found."
+    try:
+        notebook = notebook_cache.get(path).notebook
+    except SyntaxError as e:
+        return f"Error: {e}"
+    return [
+        {
+            "index": i,
+            "name": cell.spec.name,
+            "deps": cell.spec.deps,
+            "returns": cell.spec.returns,
+            "first_line": cell.spec.code.split("\n", 1)[0],
+        }
+        for i, cell in enumerate(notebook.cells)
+    ]
+
+
+@agent.tool
+@tool_calls.timed
+async def insert_cell(ctx: RunContext[MarimoAgentDeps], name: str, cell: CellSpec, index: int = -1) -> str:
+    """Insert a single cell into an existing notebook without resending the others.
+
+    index is the 0-based position the new cell will have; -1 appends it at the end.
+    """
+    def edit(notebook: ParsedNotebook) -> str:
+        position = len(notebook.cells) if index < 0 else index
+        notebook.insert(position, cell)
+        return f"Inserted cell at index {min(position, len(notebook.cells) - 1)}."
+
+    return _edit_notebook(ctx, name, edit)
+
+
+@agent.tool
+@tool_calls.timed
+async def replace_cell(ctx: RunContext[MarimoAgentDeps], name: str, cell_ref: str | int, cell: CellSpec) -> str:
+    """Replace one cell, identified by 0-based index or unique name, leaving the rest untouched."""
+    def edit(notebook: ParsedNotebook) -> str:
+        i = notebook.index_of(cell_ref)
+        notebook.replace(i, cell)
+        return f"Replaced cell {i}."
+
+    return _edit_notebook(ctx, name, edit)
+
+
+@agent.tool
+@tool_calls.timed
+async def delete_cell(ctx: RunContext[MarimoAgentDeps], name: str, cell_ref: str | int) -> str:
+    """Delete one cell, identified by 0-based index or unique name."""
+    def edit(notebook: ParsedNotebook) -> str:
+        i = notebook.index_of(cell_ref)
+        notebook.delete(i)
+        return f"Deleted cell {i}."
+
+    return _edit_notebook(ctx, name, edit)
+
+
+@agent.tool
+@tool_calls.timed
+async def move_cell(ctx: RunContext[MarimoAgentDeps], name: str, cell_ref: str | int, to_index: int) -> str:
+    """Move one cell, identified by 0-based index or unique name, to a new 0-based position."""
+    def edit(notebook: ParsedNotebook) -> str:
+        i = notebook.index_of(cell_ref)
+        notebook.move(i, to_index)
+        return f"Moved cell {i} to index {min(max(to_index, 0), len(notebook.cells) - 1)}."
+
+    return _edit_notebook(ctx, name, edit)
+
+
 @agent.tool
-async def run_notebook(ctx: RunContext[MarimoAgentDeps], name: str) -> dict[str, Any]:
+@tool_calls.timed
+async def run_notebook(ctx: RunContext[MarimoAgentDeps], name: str, fresh: bool = False) -> dict[str, Any]:
     """Execute a marimo notebook inside the user's sandbox container and return output.
 
     Useful for verifying a notebook works or inspecting computed results.
+    Cells run in a persistent kernel: only cells whose code or upstream
+    dependencies changed since the last run are re-executed, the rest report
+    "cached". Each cell reports its status, stdout, last-expression output and
+    duration. If neither the notebook nor the session's data files changed since
+    a previous successful run, that run's result is returned without executing
+    anything; failed runs are always retried.
+    Set fresh=True to run the whole notebook in a new process instead.
     """
     name = _safe_name(name)
     nb_dir = _user_dir(ctx)
@@ -167,19 +260,54 @@ async def run_notebook(ctx: RunContext[MarimoAgentDeps], name: str) -> dict[str,
     if not path.exists():
         return {"error": f"Notebook '{name}' not found."}
 
+    sandbox = ctx.deps.sandbox
     try:
-        await ctx.deps.sandbox.get_or_create(ctx.deps.session_id)
-        output = await ctx.deps.sandbox.exec_in_container(
+        if fresh:
+            await sandbox.get_or_create(ctx.deps.session_id)
+            output = await sandbox.exec_in_container(
+                ctx.deps.session_id,
+                ["marimo", "run", "--headless", f"/notebooks/{name}.py"],
+                on_output=_progress(ctx, tool="run_notebook", notebook=name),
+            )
+            return {"status": "ok", "output": output}
+
+        parsed = notebook_cache.get(path)
+        inputs = await asyncio.to_thread(sandbox.run_cache.data_digest, nb_dir)
+        cache_key = sandbox.run_cache.key(name, parsed.source, "kernel", inputs)
+        cached = sandbox.run_cache.get(cache_key)
+        if cached is not None:
+            return {**cached, "result_cache": "hit"}
+
+        cells = parsed.notebook.specs
+        await sandbox.get_or_create(ctx.deps.session_id)
+        result = await sandbox.run_in_kernel(
             ctx.deps.session_id,
-            ["marimo", "run", "--headless", f"/notebooks/{name}.py"],
+            name,
+            [cell.model_dump() for cell in cells],
+            on_event=_progress(ctx, tool="run_notebook", notebook=name),
+            inputs=inputs,
         )
-        return {"status": "ok", "output": output}
+        failed = any(cell["status"] in ("error", "skipped") for cell in result["cells"])
+        response = {
+            "status": "error" if failed else "ok",
+            "executed": result["executed"],
+            "duration_ms": result["duration_ms"],
+            "cells": result["cells"],
+        }
+        if not failed:
+            # A failure may be transient (network, memory, a timeout), so a retry must run again
+            sandbox.run_cache.put(ctx.deps.session_id, cache_key, response)
+        return response
     except Exception as e:
         return {"error": f"{type(e).__name__}: {e}"}
 
 
-def create_deps(session_id: str, sandbox: SandboxManager) -> MarimoAgentDeps:
-    return MarimoAgentDeps(session_id=session_id, sandbox=sandbox)
+def create_deps(
+    session_id: str,
+    sandbox: SandboxBackend,
+    progress: Callable[[dict[str, Any]], None] | None = None,
+) -> MarimoAgentDeps:
+    return MarimoAgentDeps(session_id=session_id, sandbox=sandbox, progress=progress)
 
 
 def create_agent() -> Agent[MarimoAgentDeps]:
@@ -0,0 +1,310 @@
+"""Building and parsing marimo notebook source files."""
+
+import ast
+import hashlib
+import textwrap
+from collections import OrderedDict
+from dataclasses import dataclass, field, replace
+from importlib.metadata import version
+from pathlib import Path
+
+from pydantic import BaseModel, Field
+
+_MARIMO_VERSION = version("marimo")
+
+MARIMO_HEADER = f"""\
+import marimo
+
+__generated_with = "{_MARIMO_VERSION}"
+app = marimo.App(width="medium")
+"""
+
+MARIMO_FOOTER = """\
+if __name__ == "__main__":
+    app.run()
+"""
+
+
+class CellSpec(BaseModel):
+    """Specification for a single marimo notebook cell."""
+
+    code: str = Field(description="Python code for the cell body.")
+    deps: list[str] = Field(
+        default_factory=list,
+        description="Variable names this cell needs from other cells (become function params).",
+    )
+    returns: list[str] = Field(
+        default_factory=list,
+        description="Variable names this cell exports (become the return tuple).",
+    )
+    name: str = Field(
+        default="_",
+        description="Optional cell function name. Use '_' for anonymous.",
+    )
+
+
+def cell_to_source(cell: CellSpec, decorator: str = "@app.cell") -> str:
+    params = ", ".join(cell.deps) if cell.deps else ""
+    sig = f"def {cell.name}({params}):"
+    body = textwrap.indent(textwrap.dedent(cell.code).strip(), "    ")
+
+    if cell.returns:
+        ret = ", ".join(cell.returns)
+        ret_line = f"    return ({ret},)" if len(cell.returns) == 1 else f"    return ({ret})"
+    else:
+        ret_line = "    return"
+
+    return f"{decorator}\n{sig}\n{body}\n{ret_line}"
+
+
+def build_notebook(cells: list[CellSpec]) -> str:
+    parts = [MARIMO_HEADER]
+    for cell in cells:
+        parts.append("")
+        parts.append(cell_to_source(cell))
+    parts.append("")
+    parts.append("")
+    parts.append(MARIMO_FOOTER)
+    return "\n".join(parts) + "\n"
+
+
+def _is_app_cell(decorator: ast.expr) -> bool:
+    target = decorator.func if isinstance(decorator, ast.Call) else decorator
+    return (
+        isinstance(target, ast.Attribute)
+        and target.attr == "cell"
+        and isinstance(target.value, ast.Name)
+        and target.value.id == "app"
+    )
+
+
+def _return_names(node: ast.Return) -> list[str]:
+    value = node.value
+    elts = value.elts if isinstance(value, ast.Tuple) else [value] if value else []
+    return [e.id for e in elts if isinstance(e, ast.Name)]
+
+
+def _start_line(node: ast.stmt) -> int:
+    return min([node.lineno] + [d.lineno for d in getattr(node, "decorator_list", [])])
+
+
+def _cell_spec(node: ast.FunctionDef | ast.AsyncFunctionDef, lines: list[str]) -> CellSpec:
+    body = node.body
+    returns: list[str] = []
+    if body and isinstance(body[-1], ast.Return):
+        returns = _return_names(body[-1])
+        body = body[:-1]
+
+    code = ""
+    if body:
+        code = "".join(lines[_start_line(body[0]) - 1:body[-1].end_lineno])
+        code = textwrap.dedent(code).strip()
+
+    return CellSpec(
+        code=code,
+        deps=[a.arg for a in node.args.args],
+        returns=returns,
+        name=node.name,
+    )
+
+
+@dataclass
+class ParsedCell:
+    spec: CellSpec
+    # Exact source of the cell, decorators included, and the text separating it
+    # from the previous cell (or the header). Untouched cells render byte-for-byte.
+    source: str
+    gap: str = "\n\n"
+    decorator: str = "@app.cell"
+
+
+@dataclass
+class ParsedNotebook:
+    """A marimo notebook split into cells that can be edited individually.
+
+    Everything outside the cells (header, setup code, footer) is kept verbatim.
+    """
+
+    header: str
+    cells: list[ParsedCell] = field(default_factory=list)
+    footer: str = ""
+
+    @classmethod
+    def parse(cls, source: str) -> "ParsedNotebook":
+        """Raises SyntaxError if the source is not valid Python."""
+        tree = ast.parse(source)
+        lines = source.splitlines(keepends=True)
+        nodes = [
+            node for node in tree.body
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))
+            and any(_is_app_cell(d) for d in node.decorator_list)
+        ]
+        if not nodes:
+            # Split before the `if __name__ == "__main__":` footer so inserted cells land above it
+            mains = [node for node in tree.body if isinstance(node, ast.If) and "__name__" in ast.unparse(node.test)]
+            if not mains:
+                return cls(header=source)
+            header = "".join(lines[:mains[0].lineno - 1]).rstrip("\n") + "\n"
+            return cls(header=header, footer="\n\n" + "".join(lines[mains[0].lineno - 1:]))
+
+        cells = []
+        prev_end = _start_line(nodes[0]) - 1
+        header = "".join(lines[:prev_end])
+        for node in nodes:
+            start = _start_line(node) - 1
+            cells.append(ParsedCell(
+                spec=_cell_spec(node, lines),
+                source="".join(lines[start:node.end_lineno]),
+                gap="".join(lines[prev_end:start]),
+                decorator="".join(lines[start:node.lineno - 1]).rstrip("\n") or "@app.cell",
+            ))
+            prev_end = node.end_lineno
+        return cls(header=header, cells=cells, footer="".join(lines[prev_end:]))
+
+    @classmethod
+    def empty(cls) -> "ParsedNotebook":
+        return cls.parse(build_notebook([]))
+
+    def copy(self) -> "ParsedNotebook":
+        """Copy that can be edited without affecting this notebook. CellSpecs are shared, never mutated."""
+        return replace(self, cells=[replace(cell) for cell in self.cells])
+
+    @property
+    def specs(self) -> list[CellSpec]:
+        return [cell.spec for cell in self.cells]
+
+    def render(self) -> str:
+        parts = [self.header]
+        for cell in self.cells:
+            parts.append(cell.gap)
+            parts.append(cell.source)
+        parts.append(self.footer)
+        return "".join(parts)
+
+    def index_of(self, ref: str | int) -> int:
+        """Resolve a cell by 0-based index or by function name."""
+        if isinstance(ref, int) or ref.lstrip("-").isdigit():
+            index = int(ref)
+            if not -len(self.cells) <= index < len(self.cells):
+                raise IndexError(f"Cell index {index} out of range (notebook has {len(self.cells)} cells)")
+            return index % len(self.cells)
+        matches = [i for i, cell in enumerate(self.cells) if cell.spec.name == ref]
+        if not matches:
+            raise KeyError(f"No cell named {ref!r}")
+        if len(matches) > 1 or ref == "_":
+            raise KeyError(f"Cell name {ref!r} is ambiguous; use its index")
+        return matches[0]
+
+    def insert(self, index: int, spec: CellSpec) -> None:
+        index = max(0, min(index, len(self.cells)))
+        cell = ParsedCell(spec=spec, source=cell_to_source(spec) + "\n")
+        if index == 0 and self.cells:
+            cell.gap, self.cells[0].gap = self.cells[0].gap, cell.gap
+        self.cells.insert(index, cell)
+
+    def replace(self, index: int, spec: CellSpec) -> None:
+        old = self.cells[index]
+        if old.spec == spec:
+            return
+        source = cell_to_source(spec, old.decorator) + "\n"
+        self.cells[index] = ParsedCell(spec=spec, source=source, gap=old.gap, decorator=old.decorator)
+
+    def delete(self, index: int) -> CellSpec:
+        removed = self.cells.pop(index)
+        if index == 0 and self.cells:
+            self.cells[0].gap = removed.gap
+        return removed.spec
+
+    def move(self, index: int, to: int) -> None:
+        # Gaps stay with positions so the header/cell spacing doesn't move with the cell
+        gaps = [cell.gap for cell in self.cells]
+        cell = self.cells.pop(index)
+        self.cells.insert(max(0, min(to, len(self.cells))), cell)
+        for cell, gap in zip(self.cells, gaps):
+            cell.gap = gap
+
+
+def parse_notebook(source: str) -> list[CellSpec]:
+    """Parse the `@app.cell` functions of a marimo notebook back into CellSpecs.
+
+    Raises SyntaxError if the source is not valid Python.
+    """
+    return ParsedNotebook.parse(source).specs
+
+
+@dataclass
+class CachedNotebook:
+    source: str
+    source_hash: str
+    notebook: ParsedNotebook
+    mtime_ns: int
+    size: int
+
+
+class NotebookCache:
+    """LRU cache of parsed notebooks, bounded by total source size.
+
+    Entries are validated against the file's mtime and size on every lookup, so
+    edits made outside Kitsune (e.g. in the marimo editor) are picked up.
+    Callers must treat returned notebooks as read-only; use copy() to edit.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self._max_bytes = max_bytes
+        self._entries: OrderedDict[Path, CachedNotebook] = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path: Path) -> CachedNotebook:
+        """Return the parsed notebook at path. Raises FileNotFoundError or SyntaxError."""
+        path = path.resolve()
+        stat = path.stat()
+        entry = self._entries.get(path)
+        if entry and entry.mtime_ns == stat.st_mtime_ns and entry.size == stat.st_size:
+            self._entries.move_to_end(path)
+            self.hits += 1
+            return entry
+        self.misses += 1
+        source = path.read_text(encoding="utf-8")
+        entry = CachedNotebook(
+            source=source,
+            source_hash=hashlib.sha256(source.encode()).hexdigest(),
+            notebook=ParsedNotebook.parse(source),
+            mtime_ns=stat.st_mtime_ns,
+            size=stat.st_size,
+        )
+        self._store(path, entry)
+        return entry
+
+    def write(self, path: Path, notebook: ParsedNotebook) -> str:
+        """Render and write notebook to path, caching it as the file's current state."""
+        path = path.resolve()
+        source = notebook.render()
+        path.write_text(source, encoding="utf-8")
+        stat = path.stat()
+        self._store(path, CachedNotebook(
+            source=source,
+            source_hash=hashlib.sha256(source.encode()).hexdigest(),
+            notebook=notebook,
+            mtime_ns=stat.st_mtime_ns,
+            size=stat.st_size,
+        ))
+        return source
+
+    def invalidate(self, path: Path) -> None:
+        entry = self._entries.pop(path.resolve(), None)
+        if entry is not None:
+            self._bytes -= len(entry.source)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "bytes": self._bytes, "hits": self.hits, "misses": self.misses}
+
+    def _store(self, path: Path, entry: CachedNotebook) -> None:
+        self.invalidate(path)
+        if len(entry.source) > self._max_bytes:
+            return
+        self._entries[path] = entry
+        self._bytes += len(entry.source)
+        while self._bytes > self._max_bytes:
+            self.invalidate(next(iter(self._entries)))
@@ -0,0 +1,193 @@
+"""Routing model requests between the local model server and OpenRouter."""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from collections.abc import AsyncIterator
+from contextlib import AsyncExitStack, asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any
+
+from pydantic_ai import RunContext
+from pydantic_ai.exceptions import FallbackExceptionGroup, ModelAPIError
+from pydantic_ai.messages import ModelMessage, ModelResponse
+from pydantic_ai.models import Model, ModelRequestParameters, StreamedResponse
+from pydantic_ai.models.fallback import FallbackModel
+from pydantic_ai.settings import ModelSettings
+from pydantic_ai.usage import RequestUsage
+
+from kitsune.logging import get_logger
+from kitsune.services.metrics import Histogram
+
+logger = get_logger("routing")
+
+# Weight of the newest sample in the moving average of response latency
+_EWMA_ALPHA = 0.3
+
+
+@dataclass
+class Backend:
+    """One model server and what we've measured about it."""
+
+    name: str
+    model: Model
+    # Requests the server works on in parallel; more than this queue up behind each other
+    capacity: int
+    in_flight: int = 0
+    # Seconds until the response starts (first chunk when streaming), averaged
+    latency_ewma: float | None = None
+    failed_at: float | None = None
+    counters: dict[str, int] = field(default_factory=lambda: {
+        "requests": 0, "errors": 0, "timeouts": 0, "output_tokens": 0,
+    })
+    latency: Histogram = field(default_factory=Histogram)
+    # Output tokens per second of generation, per response
+    throughput: Histogram = field(
+        default_factory=lambda: Histogram((1, 5, 10, 20, 40, 80, 160, 320)),
+    )
+
+    def expected_wait(self) -> float:
+        """Rough time until a new request would start responding."""
+        latency = self.latency_ewma if self.latency_ewma is not None else 1.0
+        return latency * (1 + self.in_flight // self.capacity)
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "in_flight": self.in_flight,
+            "latency_ewma": round(self.latency_ewma, 3) if self.latency_ewma is not None else None,
+            "latency": self.latency.snapshot(),
+            "tokens_per_second": self.throughput.snapshot(),
+        }
+
+    def record_start(self, elapsed: float) -> None:
+        self.failed_at = None
+        self.latency.observe(elapsed)
+        if self.latency_ewma is None:
+            self.latency_ewma = elapsed
+        else:
+            self.latency_ewma += _EWMA_ALPHA * (elapsed - self.latency_ewma)
+
+    def record_usage(self, usage: RequestUsage, elapsed: float) -> None:
+        self.counters["output_tokens"] += usage.output_tokens
+        if usage.output_tokens and elapsed > 0:
+            self.throughput.observe(usage.output_tokens / elapsed)
+
+
+class RoutedModel(FallbackModel):
+    """Sends each request to the backend expected to respond first, falling back on failure.
+
+    The first backend (the local server) is preferred while it has a free slot.
+    Once it is saturated, backends are ranked by expected wait: their latency average
+    scaled by how many requests are already queued on them. A backend that errored
+    recently is tried last for `cooldown` seconds. A backend that hasn't started
+    responding within `timeout` seconds is abandoned for the next one; once a stream
+    has started it is never switched.
+    """
+
+    def __init__(self, backends: list[Backend], timeout: float, cooldown: float = 30) -> None:
+        super().__init__(
+            backends[0].model,
+            *[b.model for b in backends[1:]],
+            fallback_on=(ModelAPIError, TimeoutError),
+        )
+        self.backends = backends
+        self._timeout = timeout
+        self._cooldown = cooldown
+
+    @property
+    def model_name(self) -> str:
+        return f'routed:{",".join(b.model.model_name for b in self.backends)}'
+
+    def stats(self) -> dict:
+        return {b.name: b.stats() for b in self.backends}
+
+    def _ranked(self) -> list[Backend]:
+        now = time.monotonic()
+
+        def key(backend: Backend) -> tuple[bool, bool, float]:
+            cooling = backend.failed_at is not None and now - backend.failed_at < self._cooldown
+            preferred = backend is self.backends[0] and backend.in_flight < backend.capacity
+            return cooling, not preferred, backend.expected_wait()
+
+        return sorted(self.backends, key=key)
+
+    def _record_failure(self, backend: Backend, exc: Exception) -> None:
+        backend.failed_at = time.monotonic()
+        backend.counters["timeouts" if isinstance(exc, TimeoutError) else "errors"] += 1
+        logger.warning(f"Model backend {backend.name} failed, falling back: {exc!r}")
+
+    async def request(
+        self,
+        messages: list[ModelMessage],
+        model_settings: ModelSettings | None,
+        model_request_parameters: ModelRequestParameters,
+    ) -> ModelResponse:
+        exceptions: list[Exception] = []
+        for backend in self._ranked():
+            model = backend.model
+            backend.in_flight += 1
+            backend.counters["requests"] += 1
+            started = time.monotonic()
+            try:
+                _, prepared_parameters = model.prepare_request(model_settings, model_request_parameters)
+                async with asyncio.timeout(self._timeout):
+                    response = await model.request(messages, model_settings, model_request_parameters)
+            except Exception as exc:
+                if not self._fallback_on(exc):
+                    raise
+                self._record_failure(backend, exc)
+                exceptions.append(exc)
+                continue
+            finally:
+                backend.in_flight -= 1
+
+            elapsed = time.monotonic() - started
+            backend.record_start(elapsed)
+            backend.record_usage(response.usage, elapsed)
+            self._set_span_attributes(model, prepared_parameters)
+            return response
+
+        raise FallbackExceptionGroup("All model backends failed", exceptions)
+
+    @asynccontextmanager
+    async def request_stream(
+        self,
+        messages: list[ModelMessage],
+        model_settings: ModelSettings | None,
+        model_request_parameters: ModelRequestParameters,
+        run_context: RunContext[Any] | None = None,
+    ) -> AsyncIterator[StreamedResponse]:
+        exceptions: list[Exception] = []
+        for backend in self._ranked():
+            model = backend.model
+            async with AsyncExitStack() as stack:
+                backend.in_flight += 1
+                stack.callback(self._release, backend)
+                backend.counters["requests"] += 1
+                started = time.monotonic()
+                try:
+                    _, prepared_parameters = model.prepare_request(model_settings, model_request_parameters)
+                    async with asyncio.timeout(self._timeout):
+                        response = await stack.enter_async_context(
+                            model.request_stream(messages, model_settings, model_request_parameters, run_context)
+                        )
+                except Exception as exc:
+                    if not self._fallback_on(exc):
+                        raise
+                    self._record_failure(backend, exc)
+                    exceptions.append(exc)
+                    continue
+
+                backend.record_start(time.monotonic() - started)
+                self._set_span_attributes(model, prepared_parameters)
+                yield response
+                backend.record_usage(response.usage(), time.monotonic() - started)
+                return
+
+        raise FallbackExceptionGroup("All model backends failed", exceptions)
+
+    @staticmethod
+    def _release(backend: Backend) -> None:
+        backend.in_flight -= 1
@@ -0,0 +1,15 @@
+"""Agent tools, and the call metrics shared by every tool the agents register."""
+
+from typing import Any
+
+from kitsune.services.metrics import CallMetrics
+
+
+def _reports_error(result: Any) -> bool:
+    # Tools hand failures back to the model instead of raising
+    if isinstance(result, dict):
+        return "error" in result
+    return isinstance(result, str) and result.startswith("Error:")
+
+
+tool_calls = CallMetrics("kitsune_tool_call", "tool", is_error=_reports_error)
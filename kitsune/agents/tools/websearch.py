@@ -1,13 +1,21 @@
 from __future__ import annotations
 
-from typing import Literal, TypeVar
+import asyncio
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Literal, TypeVar
+from urllib.parse import urlsplit, urlunsplit
 
-import httpx
 from pydantic import BaseModel, Field
-from pydantic_ai import Agent
+from pydantic_ai import Agent, RunContext
 
+from kitsune.agents.tools import tool_calls
 from kitsune.config import get_config
-from kitsune.utils import is_public_url
+from kitsune.services.http import http_clients
+from kitsune.services.metrics import Metric
+from kitsune.services.outbound import get_guard
+from kitsune.services.tiered_cache import TieredCache
+from kitsune.services.url_policy import BlockedUrlError, get_url_policy
 
 
 class LinkupSource(BaseModel):
@@ -29,6 +37,20 @@ class LinkupFetchResult(BaseModel):
 	)
 
 
+class BatchSearchItem(BaseModel):
+	query: str
+	answer: str = ""
+	sources: list[LinkupSource] = Field(default_factory=list)
+	error: str | None = None
+
+
+class BatchFetchItem(BaseModel):
+	url: str
+	markdown: str = ""
+	truncated: bool = False
+	error: str | None = None
+
+
 async def _linkup_post(endpoint: str, payload: dict) -> dict:
 	config = get_config()
 	url = f"{config.LINKUP_URL}/{endpoint}"
@@ -37,8 +59,10 @@ async def _linkup_post(endpoint: str, payload: dict) -> dict:
 		"Content-Type": "application/json",
 	}
 
-	async with httpx.AsyncClient() as client:
-		response = await client.post(url, headers=headers, json=payload)
+	client = http_clients.get("linkup")
+	response = await get_guard("linkup").request(
+		lambda: client.post(url, headers=headers, json=payload),
+	)
 
 	if response.is_error:
 		raise RuntimeError(
@@ -48,19 +72,77 @@ async def _linkup_post(endpoint: str, payload: dict) -> dict:
 	return response.json()
 
 
+async def _tavily_post(endpoint: str, payload: dict) -> dict:
+	config = get_config()
+	url = f"{config.TAVILY_URL}/{endpoint}"
+	headers = {
+		"Authorization": f"Bearer {config.TAVILY_API_KEY}",
+		"Content-Type": "application/json",
+	}
+
+	client = http_clients.get("tavily")
+	response = await get_guard("tavily").request(
+		lambda: client.post(url, headers=headers, json=payload),
+	)
+
+	if response.is_error:
+		raise RuntimeError(
+			f"Tavily API error: {response.status_code} {response.reason_phrase}",
+		)
+
+	return response.json()
+
+
+@lru_cache
+def get_search_cache() -> TieredCache:
+	config = get_config()
+	return TieredCache(
+		Path(config.SEARCH_CACHE_PATH),
+		memory_entries=config.SEARCH_CACHE_MEMORY_ENTRIES,
+		stale_ttl=config.SEARCH_CACHE_STALE_TTL,
+	)
+
+
+def search_metrics() -> list[Metric]:
+	"""Metrics of the providers' outbound guards and the shared result cache."""
+	return [
+		*get_guard("linkup").metrics(),
+		*get_guard("tavily").metrics(),
+		*get_search_cache().metrics("kitsune_search_cache"),
+	]
+
+
+def _normalize_query(query: str) -> str:
+	return " ".join(query.lower().split())
+
+
+def _normalize_url(url: str) -> str:
+	# Scheme and host are case-insensitive, default ports and fragments never reach the server
+	parts = urlsplit(url.strip())
+	scheme = parts.scheme.lower()
+	host = (parts.hostname or "").lower()
+	if parts.port and (scheme, parts.port) not in (("http", 80), ("https", 443)):
+		host = f"{host}:{parts.port}"
+	return urlunsplit((scheme, host, parts.path or "/", parts.query, ""))
+
+
 async def search_linkup(
 	query: str,
 	depth: Literal["standard", "deep"],
 ) -> LinkupSearchResult:
-	data = await _linkup_post(
-		endpoint="search",
-		payload={
-			"q": query,
-			"depth": depth,
-			"outputType": "sourcedAnswer",
-			"includeImages": False,
-			"includeInlineCitations": False,
-		},
+	data = await get_search_cache().get_or_fetch(
+		f"linkup:search:{depth}:{_normalize_query(query)}",
+		ttl=get_config().SEARCH_CACHE_SEARCH_TTL,
+		fetch=lambda: _linkup_post(
+			endpoint="search",
+			payload={
+				"q": query,
+				"depth": depth,
+				"outputType": "sourcedAnswer",
+				"includeImages": False,
+				"includeInlineCitations": False,
+			},
+		),
 	)
 	return LinkupSearchResult.model_validate(data)
 
@@ -69,29 +151,254 @@ async def fetch_linkup(
 	url: str,
 	render_js: bool = False,
 ) -> LinkupFetchResult:
-	data = await _linkup_post(
-		endpoint="fetch",
-		payload={
-			"url": url,
-			"includeRawHtml": False,
-			"renderJs": render_js,
-			"extractImages": False,
-		},
+	data = await get_search_cache().get_or_fetch(
+		f"linkup:fetch:{int(render_js)}:{_normalize_url(url)}",
+		ttl=get_config().SEARCH_CACHE_FETCH_TTL,
+		fetch=lambda: _linkup_post(
+			endpoint="fetch",
+			payload={
+				"url": url,
+				"includeRawHtml": False,
+				"renderJs": render_js,
+				"extractImages": False,
+			},
+		),
 	)
 	return LinkupFetchResult.model_validate(data)
 
+async def search_tavily(
+	query: str,
+	depth: Literal["standard", "deep"],
+) -> LinkupSearchResult:
+	data = await get_search_cache().get_or_fetch(
+		f"tavily:search:{depth}:{_normalize_query(query)}",
+		ttl=get_config().SEARCH_CACHE_SEARCH_TTL,
+		fetch=lambda: _tavily_post(
+			endpoint="search",
+			payload={
+				"query": query,
+				"search_depth": "advanced" if depth == "deep" else "basic",
+				"include_answer": True,
+			},
+		),
+	)
+	# Same shape as LinkUp results so callers don't care which provider answered
+	return LinkupSearchResult(
+		answer=data.get("answer") or "",
+		sources=[
+			LinkupSource(url=r["url"], name=r.get("title", ""), snippet=r.get("content", ""))
+			for r in data.get("results", [])
+		],
+	)
+
+
+SEARCH_PROVIDERS = {
+	"linkup": search_linkup,
+	"tavily": search_tavily,
+}
+
+
+async def _first_acceptable(tasks: dict[asyncio.Task, str]) -> LinkupSearchResult:
+	"""Return the first result with sources, else the first result at all."""
+	pending = set(tasks)
+	fallback: LinkupSearchResult | None = None
+	errors = []
+	while pending:
+		done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+		for task in done:
+			if task.exception() is not None:
+				errors.append(f"{tasks[task]}: {task.exception()}")
+				continue
+			result = task.result()
+			if result.sources:
+				return result
+			fallback = fallback or result
+	if fallback is not None:
+		return fallback
+	raise RuntimeError(f"All search providers failed: {'; '.join(errors)}")
+
+
+def _merge(results: list[LinkupSearchResult]) -> LinkupSearchResult:
+	# Interleave by rank so each provider's best hits come first, keeping the first copy of a URL
+	seen: set[str] = set()
+	sources = []
+	for rank in range(max(len(r.sources) for r in results)):
+		for result in results:
+			if rank < len(result.sources):
+				source = result.sources[rank]
+				key = _normalize_url(source.url)
+				if key not in seen:
+					seen.add(key)
+					sources.append(source)
+	answer = next((r.answer for r in results if r.answer), "")
+	return LinkupSearchResult(answer=answer, sources=sources)
+
+
+async def search_web(
+	query: str,
+	depth: Literal["standard", "deep"] = "standard",
+	mode: Literal["race", "merge"] | None = None,
+) -> LinkupSearchResult:
+	"""Query every provider concurrently.
+
+	"race" returns the first result with sources. "merge" waits up to SEARCH_MERGE_BUDGET
+	seconds and combines whatever has arrived, de-duplicated by URL; if nothing has, it
+	falls back to racing the remaining providers.
+	"""
+	config = get_config()
+	mode = mode or config.SEARCH_MODE
+	tasks = {asyncio.create_task(search(query, depth)): name for name, search in SEARCH_PROVIDERS.items()}
+	try:
+		if mode == "race":
+			return await _first_acceptable(tasks)
+		done, pending = await asyncio.wait(tasks, timeout=config.SEARCH_MERGE_BUDGET)
+		results = [t.result() for t in tasks if t in done and t.exception() is None]
+		if results:
+			return _merge(results)
+		if pending:
+			return await _first_acceptable({t: tasks[t] for t in pending})
+		return await _first_acceptable(tasks)
+	finally:
+		# Losing lookups aren't wasted: the cache finishes them in the background
+		for task in tasks:
+			task.cancel()
+
+
 AgentDepsT = TypeVar("AgentDepsT")
 AgentResultT = TypeVar("AgentResultT")
+
+
+async def _run_batch(
+	items: list[str],
+	run: Callable[[str], Awaitable[BaseModel]],
+	on_result: Callable[[dict[str, Any]], None] | None,
+) -> list[Any]:
+	# Bounded fan-out; each item is reported as soon as it finishes, results keep input order
+	semaphore = asyncio.Semaphore(get_config().SEARCH_BATCH_CONCURRENCY)
+
+	async def one(index: int, item: str) -> BaseModel:
+		async with semaphore:
+			result = await run(item)
+		if on_result:
+			on_result({"index": index, "total": len(items), **result.model_dump(exclude_defaults=True)})
+		return result
+
+	return await asyncio.gather(*(one(i, item) for i, item in enumerate(items)))
+
+
+def _check_batch_size(items: list[str]) -> None:
+	limit = get_config().SEARCH_BATCH_MAX_ITEMS
+	if len(items) > limit:
+		raise ValueError(f"At most {limit} items per batch, got {len(items)}")
+
+
+async def search_batch(
+	queries: list[str],
+	depth: Literal["standard", "deep"] = "standard",
+	search: Callable[[str, Literal["standard", "deep"]], Awaitable[LinkupSearchResult]] = search_linkup,
+	on_result: Callable[[dict[str, Any]], None] | None = None,
+) -> list[BatchSearchItem]:
+	"""Run several searches concurrently. A failed query becomes an item with an error."""
+	_check_batch_size(queries)
+	max_sources = get_config().SEARCH_BATCH_MAX_SOURCES
+
+	async def run(query: str) -> BatchSearchItem:
+		try:
+			result = await search(query, depth)
+		except Exception as e:
+			return BatchSearchItem(query=query, error=str(e))
+		return BatchSearchItem(query=query, answer=result.answer, sources=result.sources[:max_sources])
+
+	return await _run_batch(queries, run, on_result)
+
+
+async def fetch_batch(
+	urls: list[str],
+	render_js: bool = False,
+	on_result: Callable[[dict[str, Any]], None] | None = None,
+) -> list[BatchFetchItem]:
+	"""Fetch several pages concurrently, truncating each to SEARCH_BATCH_FETCH_MAX_CHARS."""
+	_check_batch_size(urls)
+	max_chars = get_config().SEARCH_BATCH_FETCH_MAX_CHARS
+
+	async def run(url: str) -> BatchFetchItem:
+		try:
+			await get_url_policy().check(url)
+		except BlockedUrlError as e:
+			return BatchFetchItem(url=url, error=str(e))
+		try:
+			result = await fetch_linkup(url, render_js)
+		except Exception as e:
+			return BatchFetchItem(url=url, error=str(e))
+		markdown = result.markdown
+		if len(markdown) <= max_chars:
+			return BatchFetchItem(url=url, markdown=markdown)
+		return BatchFetchItem(url=url, markdown=markdown[:max_chars], truncated=True)
+
+	return await _run_batch(urls, run, on_result)
+
+
+def _batch_progress(ctx: RunContext[Any], tool: str) -> Callable[[dict[str, Any]], None] | None:
+	# Deps that accept progress events (e.g. MarimoAgentDeps) get each item as it finishes
+	emit = getattr(ctx.deps, "progress", None)
+	if emit is None:
+		return None
+	return lambda update: emit({"tool": tool, "update": update})
+
+
+def _with_batch_tools(
+	agent: Agent[AgentDepsT, AgentResultT],
+	search: Callable[[str, Literal["standard", "deep"]], Awaitable[LinkupSearchResult]],
+) -> None:
+	@agent.tool
+	@tool_calls.timed
+	async def search_batch_tool(
+		ctx: RunContext[AgentDepsT],
+		queries: list[str],
+		depth: Literal["standard", "deep"] = "standard",
+	) -> list[BatchSearchItem]:
+		"""Run several web searches at once. Prefer this over repeated search_tool calls."""
+		return await search_batch(queries, depth, search, _batch_progress(ctx, "search_batch_tool"))
+
+	@agent.tool
+	@tool_calls.timed
+	async def fetch_batch_tool(
+		ctx: RunContext[AgentDepsT],
+		urls: list[str],
+		render_js: bool = False,
+	) -> list[BatchFetchItem]:
+		"""Fetch several web pages at once as markdown. Long pages are truncated."""
+		return await fetch_batch(urls, render_js, _batch_progress(ctx, "fetch_batch_tool"))
+
+
 def with_linkup(agent: Agent[AgentDepsT, AgentResultT]) -> Agent[AgentDepsT, AgentResultT]:
     @agent.tool_plain
+    @tool_calls.timed
     async def search_tool(query: str, depth: Literal["standard", "deep"] = "standard") -> LinkupSearchResult:
         return await search_linkup(query, depth)
 	
     @agent.tool_plain
+    @tool_calls.timed
     async def fetch_tool(url: str, render_js: bool = False) -> LinkupFetchResult:
-        if is_public_url(url):
-            return await fetch_linkup(url, render_js)
-        else:
-            raise ValueError("Blocked URL: only public http(s) URLs are allowed")
+        await get_url_policy().check(url)
+        return await fetch_linkup(url, render_js)
 
+    _with_batch_tools(agent, search_linkup)
     return agent
+
+
+def with_websearch(agent: Agent[AgentDepsT, AgentResultT]) -> Agent[AgentDepsT, AgentResultT]:
+	"""Like with_linkup, but searches every configured provider concurrently."""
+	@agent.tool_plain
+	@tool_calls.timed
+	async def search_tool(query: str, depth: Literal["standard", "deep"] = "standard") -> LinkupSearchResult:
+		return await search_web(query, depth)
+
+	@agent.tool_plain
+	@tool_calls.timed
+	async def fetch_tool(url: str, render_js: bool = False) -> LinkupFetchResult:
+		await get_url_policy().check(url)
+		return await fetch_linkup(url, render_js)
+
+	_with_batch_tools(agent, search_web)
+	return agent
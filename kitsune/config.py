@@ -30,6 +30,10 @@ def required_env(key: str, default: str | None = None) -> str:
     return value
 
 
+def _csv_env(key: str) -> tuple[str, ...]:
+    return tuple(item.strip() for item in required_env(key, "").split(",") if item.strip())
+
+
 #TODO: Hacky way to read prompts from files, should be refactored later
 #TODO: Add frontmatter to the prompt files to specify metadata like description, tags, etc.
 def required_prompts(file: str) -> str:
@@ -57,6 +61,35 @@ class Config:
 
     OPENROUTER_URL: str = field(default_factory=lambda: required_env("OPENROUTER_URL", "https://openrouter.ai/api/v1"))
     OPENROUTER_API_KEY: str = field(default_factory=lambda: required_env("OPENROUTER_API_KEY"))
+    OPENROUTER_MODEL: str = field(default_factory=lambda: required_env("OPENROUTER_MODEL", "openai/gpt-oss-20b"))
+
+    # Model routing: "auto" uses the local server while it has a free slot (LOCAL_MAX_CONCURRENCY)
+    # and otherwise whichever backend is expected to respond first; "local"/"openrouter" pin one.
+    # A backend that hasn't started responding within MODEL_TIMEOUT seconds or errors is skipped
+    # in favour of the other, and ranked last for MODEL_FAILURE_COOLDOWN seconds.
+    MODEL_ROUTING: str = field(default_factory=lambda: required_env("MODEL_ROUTING", "auto"))
+    LOCAL_MAX_CONCURRENCY: int = field(default_factory=lambda: int(required_env("LOCAL_MAX_CONCURRENCY", "2")))
+    OPENROUTER_MAX_CONCURRENCY: int = field(default_factory=lambda: int(required_env("OPENROUTER_MAX_CONCURRENCY", "32")))
+    MODEL_TIMEOUT: float = field(default_factory=lambda: float(required_env("MODEL_TIMEOUT", "60")))
+    MODEL_FAILURE_COOLDOWN: float = field(default_factory=lambda: float(required_env("MODEL_FAILURE_COOLDOWN", "30")))
+    # Context sent to the model per request: tool results over HISTORY_TOOL_RESULT_MAX_CHARS
+    # replaced by references unless within both the last HISTORY_KEEP_TURNS turns and the last
+    # HISTORY_KEEP_TOOL_STEPS tool-result requests, superseded notebook reads and runs dropped,
+    # and, past HISTORY_TOKEN_BUDGET (estimated) tokens, older turns summarized HISTORY_SUMMARY_CHUNK at a time.
+    HISTORY_TOKEN_BUDGET: int = field(default_factory=lambda: int(required_env("HISTORY_TOKEN_BUDGET", "12000")))
+    HISTORY_KEEP_TURNS: int = field(default_factory=lambda: int(required_env("HISTORY_KEEP_TURNS", "4")))
+    HISTORY_TOOL_RESULT_MAX_CHARS: int = field(default_factory=lambda: int(required_env("HISTORY_TOOL_RESULT_MAX_CHARS", "1000")))
+    HISTORY_KEEP_TOOL_STEPS: int = field(default_factory=lambda: int(required_env("HISTORY_KEEP_TOOL_STEPS", "4")))
+    HISTORY_SUMMARY_CHUNK: int = field(default_factory=lambda: int(required_env("HISTORY_SUMMARY_CHUNK", "4")))
+
+    # /chat admission control: agent runs in progress at once (globally and per session), and
+    # how many more may wait, for how many seconds, before requests are refused with Retry-After.
+    CHAT_MAX_CONCURRENT: int = field(default_factory=lambda: int(required_env("CHAT_MAX_CONCURRENT", "8")))
+    CHAT_MAX_PER_SESSION: int = field(default_factory=lambda: int(required_env("CHAT_MAX_PER_SESSION", "1")))
+    CHAT_MAX_QUEUE: int = field(default_factory=lambda: int(required_env("CHAT_MAX_QUEUE", "16")))
+    CHAT_QUEUE_TIMEOUT: float = field(default_factory=lambda: float(required_env("CHAT_QUEUE_TIMEOUT", "10")))
+    # SQLite database holding chat sessions and their message history
+    CONVERSATION_DB_PATH: str = field(default_factory=lambda: required_env("CONVERSATION_DB_PATH", "data/kitsune.sqlite3"))
 
     LINKUP_URL: str = field(default_factory=lambda: required_env("LINKUP_URL", "https://api.linkup.so/v1"))
     LINKUP_API_KEY: str = field(default_factory=lambda: required_env("LINKUP_API_KEY"))
@@ -64,10 +97,117 @@ class Config:
     TAVILY_URL: str = field(default_factory=lambda: required_env("TAVILY_URL", "https://api.tavily.com"))
     TAVILY_API_KEY: str = field(default_factory=lambda: required_env("TAVILY_API_KEY"))
 
+    # Outbound search API controls. Each provider gets a token bucket (requests/second, with
+    # bursts of the same size) and a cap on in-flight calls shared by all sessions. 429/5xx
+    # responses are retried with jittered exponential backoff; Retry-After values longer than
+    # OUTBOUND_BACKOFF_MAX fail immediately. After OUTBOUND_BREAKER_THRESHOLD consecutive failed
+    # requests a provider is skipped for OUTBOUND_BREAKER_COOLDOWN seconds.
+    LINKUP_RATE_LIMIT: float = field(default_factory=lambda: float(required_env("LINKUP_RATE_LIMIT", "10")))
+    LINKUP_CONCURRENCY: int = field(default_factory=lambda: int(required_env("LINKUP_CONCURRENCY", "8")))
+    TAVILY_RATE_LIMIT: float = field(default_factory=lambda: float(required_env("TAVILY_RATE_LIMIT", "10")))
+    TAVILY_CONCURRENCY: int = field(default_factory=lambda: int(required_env("TAVILY_CONCURRENCY", "8")))
+    OUTBOUND_MAX_RETRIES: int = field(default_factory=lambda: int(required_env("OUTBOUND_MAX_RETRIES", "3")))
+    OUTBOUND_BACKOFF_BASE: float = field(default_factory=lambda: float(required_env("OUTBOUND_BACKOFF_BASE", "0.5")))
+    OUTBOUND_BACKOFF_MAX: float = field(default_factory=lambda: float(required_env("OUTBOUND_BACKOFF_MAX", "10")))
+    OUTBOUND_BREAKER_THRESHOLD: int = field(default_factory=lambda: int(required_env("OUTBOUND_BREAKER_THRESHOLD", "5")))
+    OUTBOUND_BREAKER_COOLDOWN: float = field(default_factory=lambda: float(required_env("OUTBOUND_BREAKER_COOLDOWN", "30")))
+
+    # Shared outbound HTTP clients (one keep-alive pool per upstream host). The sandbox
+    # probe client reaches every container on every node and is sized separately.
+    HTTP_TIMEOUT: float = field(default_factory=lambda: float(required_env("HTTP_TIMEOUT", "30")))
+    HTTP_CONNECT_TIMEOUT: float = field(default_factory=lambda: float(required_env("HTTP_CONNECT_TIMEOUT", "5")))
+    HTTP_MAX_CONNECTIONS_PER_HOST: int = field(default_factory=lambda: int(required_env("HTTP_MAX_CONNECTIONS_PER_HOST", "20")))
+    HTTP_MAX_KEEPALIVE_PER_HOST: int = field(default_factory=lambda: int(required_env("HTTP_MAX_KEEPALIVE_PER_HOST", "10")))
+    HTTP_KEEPALIVE_EXPIRY: float = field(default_factory=lambda: float(required_env("HTTP_KEEPALIVE_EXPIRY", "30")))
+
+    # Web search/fetch result cache (in-memory LRU over a SQLite file). Entries are fresh for
+    # their TTL, then served stale for up to SEARCH_CACHE_STALE_TTL while refreshed in the background.
+    SEARCH_CACHE_PATH: str = field(default_factory=lambda: required_env("SEARCH_CACHE_PATH", "data/cache/websearch.sqlite3"))
+    SEARCH_CACHE_MEMORY_ENTRIES: int = field(default_factory=lambda: int(required_env("SEARCH_CACHE_MEMORY_ENTRIES", "1024")))
+    SEARCH_CACHE_SEARCH_TTL: float = field(default_factory=lambda: float(required_env("SEARCH_CACHE_SEARCH_TTL", "600")))
+    SEARCH_CACHE_FETCH_TTL: float = field(default_factory=lambda: float(required_env("SEARCH_CACHE_FETCH_TTL", "3600")))
+    SEARCH_CACHE_STALE_TTL: float = field(default_factory=lambda: float(required_env("SEARCH_CACHE_STALE_TTL", "3600")))
+    # How web search uses multiple providers: "race" returns the first result with sources,
+    # "merge" combines the results that arrive within SEARCH_MERGE_BUDGET seconds.
+    SEARCH_MODE: str = field(default_factory=lambda: required_env("SEARCH_MODE", "race"))
+    SEARCH_MERGE_BUDGET: float = field(default_factory=lambda: float(required_env("SEARCH_MERGE_BUDGET", "3")))
+    # Batch search/fetch tools: items per call, items in flight at once, sources kept per
+    # query and characters of markdown kept per fetched page.
+    SEARCH_BATCH_MAX_ITEMS: int = field(default_factory=lambda: int(required_env("SEARCH_BATCH_MAX_ITEMS", "10")))
+    SEARCH_BATCH_CONCURRENCY: int = field(default_factory=lambda: int(required_env("SEARCH_BATCH_CONCURRENCY", "4")))
+    SEARCH_BATCH_MAX_SOURCES: int = field(default_factory=lambda: int(required_env("SEARCH_BATCH_MAX_SOURCES", "5")))
+    SEARCH_BATCH_FETCH_MAX_CHARS: int = field(default_factory=lambda: int(required_env("SEARCH_BATCH_FETCH_MAX_CHARS", "8000")))
+    # URLs the fetch tools may request. Hosts must resolve only to public addresses unless
+    # allowed here. Both lists are comma-separated hostnames (subdomains match) or CIDR
+    # networks; the deny list wins. Resolutions are cached for URL_DNS_CACHE_TTL seconds.
+    URL_ALLOWLIST: tuple[str, ...] = field(default_factory=lambda: _csv_env("URL_ALLOWLIST"))
+    URL_DENYLIST: tuple[str, ...] = field(default_factory=lambda: _csv_env("URL_DENYLIST"))
+    URL_DNS_CACHE_TTL: float = field(default_factory=lambda: float(required_env("URL_DNS_CACHE_TTL", "300")))
+    URL_DNS_TIMEOUT: float = field(default_factory=lambda: float(required_env("URL_DNS_TIMEOUT", "2")))
+
     MARIMO_IMAGE: str = field(default_factory=lambda: required_env("MARIMO_IMAGE", "kitsune-marimo-sandbox"))
     MARIMO_PORT_START: int = field(default_factory=lambda: int(required_env("MARIMO_PORT_START", "9100")))
     MARIMO_PORT_END: int = field(default_factory=lambda: int(required_env("MARIMO_PORT_END", "9200")))
     MARIMO_CONTAINER_TIMEOUT: int = field(default_factory=lambda: int(required_env("MARIMO_CONTAINER_TIMEOUT", "30")))
+    # Warm pool of idle, already-healthy sandbox containers that new sessions claim instead of
+    # cold-starting one. MARIMO_POOL_SIZE is how many idle containers to keep ready (0 disables
+    # the pool). MARIMO_POOL_HIGH_WATER caps total containers (sessions + idle); replenishment
+    # stops there so warm containers never take ports from real sessions. 0 means the port range.
+    MARIMO_POOL_SIZE: int = field(default_factory=lambda: int(required_env("MARIMO_POOL_SIZE", "2")))
+    MARIMO_POOL_HIGH_WATER: int = field(default_factory=lambda: int(required_env("MARIMO_POOL_HIGH_WATER", "0")))
+    # Blocking Docker SDK calls run on a bounded thread pool, with a separate concurrency
+    # limit per operation type so long-running execs can't starve container starts/stops.
+    DOCKER_MAX_WORKERS: int = field(default_factory=lambda: int(required_env("DOCKER_MAX_WORKERS", "32")))
+    DOCKER_RUN_CONCURRENCY: int = field(default_factory=lambda: int(required_env("DOCKER_RUN_CONCURRENCY", "4")))
+    DOCKER_STOP_CONCURRENCY: int = field(default_factory=lambda: int(required_env("DOCKER_STOP_CONCURRENCY", "8")))
+    DOCKER_EXEC_CONCURRENCY: int = field(default_factory=lambda: int(required_env("DOCKER_EXEC_CONCURRENCY", "16")))
+    DOCKER_INSPECT_CONCURRENCY: int = field(default_factory=lambda: int(required_env("DOCKER_INSPECT_CONCURRENCY", "8")))
+    # Limits for commands and kernel runs inside sandboxes: wall-clock seconds before the
+    # process is killed, bytes of command output kept (head + tail), and bytes per cell output.
+    SANDBOX_EXEC_TIMEOUT: int = field(default_factory=lambda: int(required_env("SANDBOX_EXEC_TIMEOUT", "300")))
+    SANDBOX_EXEC_MAX_BYTES: int = field(default_factory=lambda: int(required_env("SANDBOX_EXEC_MAX_BYTES", str(64 * 1024))))
+    SANDBOX_CELL_OUTPUT_MAX_BYTES: int = field(default_factory=lambda: int(required_env("SANDBOX_CELL_OUTPUT_MAX_BYTES", "4000")))
+    # Sandbox containers outlive Kitsune restarts: they are left running on shutdown and
+    # healthy ones are adopted on startup. Health probes run at most SANDBOX_PROBE_CONCURRENCY at once.
+    SANDBOX_KEEP_ON_SHUTDOWN: bool = field(default_factory=lambda: required_env("SANDBOX_KEEP_ON_SHUTDOWN", "1") == "1")
+    SANDBOX_PROBE_CONCURRENCY: int = field(default_factory=lambda: int(required_env("SANDBOX_PROBE_CONCURRENCY", "16")))
+    SANDBOX_HTTP_MAX_CONNECTIONS: int = field(default_factory=lambda: int(required_env("SANDBOX_HTTP_MAX_CONNECTIONS", "100")))
+    SANDBOX_HTTP_MAX_KEEPALIVE: int = field(default_factory=lambda: int(required_env("SANDBOX_HTTP_MAX_KEEPALIVE", "20")))
+    # Resources per sandbox container: CPUs, memory (MB, no swap) and process count. These make
+    # the "default" profile; SANDBOX_PROFILES adds named ones as comma-separated name:cpus:memory_mb:pids.
+    SANDBOX_CPUS: float = field(default_factory=lambda: float(required_env("SANDBOX_CPUS", "1")))
+    SANDBOX_MEMORY_MB: int = field(default_factory=lambda: int(required_env("SANDBOX_MEMORY_MB", "1024")))
+    SANDBOX_PIDS_LIMIT: int = field(default_factory=lambda: int(required_env("SANDBOX_PIDS_LIMIT", "256")))
+    SANDBOX_PROFILES: tuple[str, ...] = field(default_factory=lambda: _csv_env("SANDBOX_PROFILES"))
+    # Host capacity shared by all sandboxes; 0 means what the Docker daemon reports, less
+    # SANDBOX_HOST_RESERVED_MB of memory for Kitsune itself. A new sandbox that doesn't fit first
+    # replaces idle pooled containers, then the least recently used session idle for at least
+    # SANDBOX_EVICT_IDLE seconds, and otherwise waits up to SANDBOX_CAPACITY_TIMEOUT seconds.
+    SANDBOX_HOST_CPUS: float = field(default_factory=lambda: float(required_env("SANDBOX_HOST_CPUS", "0")))
+    SANDBOX_HOST_MEMORY_MB: int = field(default_factory=lambda: int(required_env("SANDBOX_HOST_MEMORY_MB", "0")))
+    SANDBOX_HOST_RESERVED_MB: int = field(default_factory=lambda: int(required_env("SANDBOX_HOST_RESERVED_MB", "2048")))
+    SANDBOX_EVICT_IDLE: int = field(default_factory=lambda: int(required_env("SANDBOX_EVICT_IDLE", "300")))
+    SANDBOX_CAPACITY_TIMEOUT: int = field(default_factory=lambda: int(required_env("SANDBOX_CAPACITY_TIMEOUT", "30")))
+    # Docker daemons to spread sandboxes over, as comma-separated host=docker_url entries, e.g.
+    # "gpu1=ssh://kitsune@gpu1,10.0.0.12=tcp://10.0.0.12:2375". Each node's sandbox ports are
+    # reached at its host, which is also what notebook URLs point to. All nodes must mount
+    # NOTEBOOK_HOST_DIR from shared storage. Empty runs every sandbox on the local daemon.
+    SANDBOX_NODES: tuple[str, ...] = field(default_factory=lambda: _csv_env("SANDBOX_NODES"))
+    # "fake" swaps Docker for an in-process stand-in that starts no containers: creating a sandbox
+    # takes SANDBOX_FAKE_START_LATENCY seconds and each command or notebook cell SANDBOX_FAKE_EXEC_LATENCY.
+    # For load tests (bench/load.py) and working on the API without Docker.
+    SANDBOX_BACKEND: str = field(default_factory=lambda: required_env("SANDBOX_BACKEND", "docker"))
+    SANDBOX_FAKE_START_LATENCY: float = field(default_factory=lambda: float(required_env("SANDBOX_FAKE_START_LATENCY", "2")))
+    SANDBOX_FAKE_EXEC_LATENCY: float = field(default_factory=lambda: float(required_env("SANDBOX_FAKE_EXEC_LATENCY", "0.2")))
+    # In-process cache of parsed notebooks, bounded by total source size
+    NOTEBOOK_CACHE_MAX_BYTES: int = field(default_factory=lambda: int(required_env("NOTEBOOK_CACHE_MAX_BYTES", str(32 * 1024 * 1024))))
+    # /notebooks/watch: debounce window for bursts of file events, and how many pending
+    # events a slow SSE client may queue before it is resynced with a full snapshot
+    NOTEBOOK_WATCH_DEBOUNCE_MS: int = field(default_factory=lambda: int(required_env("NOTEBOOK_WATCH_DEBOUNCE_MS", "300")))
+    NOTEBOOK_WATCH_QUEUE_SIZE: int = field(default_factory=lambda: int(required_env("NOTEBOOK_WATCH_QUEUE_SIZE", "16")))
+    # Cache of run_notebook results keyed by notebook source and session data file contents
+    RUN_CACHE_MAX_BYTES: int = field(default_factory=lambda: int(required_env("RUN_CACHE_MAX_BYTES", str(64 * 1024 * 1024))))
+    RUN_CACHE_SESSION_MAX_BYTES: int = field(default_factory=lambda: int(required_env("RUN_CACHE_SESSION_MAX_BYTES", str(8 * 1024 * 1024))))
     NOTEBOOK_DATA_DIR: str = field(default_factory=lambda: required_env("NOTEBOOK_DATA_DIR", "data/notebooks"))
     # When Kitsune runs inside Docker it spawns sibling sandbox containers via the host
     # Docker daemon. Volume paths passed to the daemon must be host-side paths, not paths
@@ -12,12 +12,15 @@ class User(BaseModel):
 
 class Message(BaseModel):
     id: int
-    session_id: int
+    session_id: str
+    # "request" or "response", the kind of the pydantic-ai ModelMessage in content
+    kind: str
+    # The ModelMessage serialized as JSON
     content: str
     created_at: str
 
 
 class Session(BaseModel):
-    id: int
+    id: str
     created_at: str
     updated_at: str
@@ -0,0 +1,229 @@
+"""Long-lived notebook kernel that runs inside a sandbox container.
+
+Started by KernelSession with `python -u -c <this file>`, so it must only use the
+standard library. Speaks newline-delimited JSON: one request per line on stdin, one
+response per line on a private dup of the original stdout. File descriptor 1 is
+pointed at stderr so stray prints from cell code can't corrupt the protocol.
+
+Each notebook keeps its own namespace of cell exports. A run request carries the
+full cell list and a digest of the session's data files; only cells whose code,
+deps or returns changed since the last run, or that depend on a re-run cell, are
+executed. Everything else reports "cached" with the output of its last run. When
+the data digest changes every cell runs again, since any of them may read the files,
+and helper modules imported from the notebook directory are imported afresh.
+Each executed cell's result is also emitted as an {"event": "cell"} line tagged with
+the request id as soon as it finishes, ahead of the final response.
+"""
+
+import ast
+import contextlib
+import hashlib
+import importlib
+import io
+import json
+import os
+import sys
+import time
+import traceback
+
+DEFAULT_OUTPUT_LIMIT = 4000
+
+
+class NotebookState:
+    def __init__(self, inputs=None):
+        self.inputs = inputs  # digest of the data files the cells last ran against
+        self.hashes = {}  # cell key -> hash of the last successful run
+        self.values = {}  # variable name -> value exported by its cell
+        self.results = {}  # cell key -> stdout and output of the last successful run
+
+
+_notebooks = {}
+
+
+def _cell_key(cell, index):
+    return cell["name"] if cell["name"] != "_" else f"#{index}"
+
+
+def _cell_hash(cell):
+    payload = json.dumps([cell["code"], cell["deps"], cell["returns"]])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _topo_order(cells):
+    """Order cells so producers run before consumers, keeping notebook order otherwise."""
+    producers = {}
+    for i, cell in enumerate(cells):
+        for name in cell["returns"]:
+            producers[name] = i
+    upstream = [
+        {producers[d] for d in cell["deps"] if d in producers and producers[d] != i}
+        for i, cell in enumerate(cells)
+    ]
+    order, done = [], set()
+    while len(order) < len(cells):
+        ready = [i for i in range(len(cells)) if i not in done and upstream[i] <= done]
+        if not ready:
+            raise ValueError("Cells have a cyclic dependency")
+        order.append(ready[0])
+        done.add(ready[0])
+    return order, upstream
+
+
+def _compile_cell(cell):
+    """Wrap the cell body in a function returning its exports and last expression."""
+    tree = ast.parse(cell["code"] or "pass")
+    if tree.body and isinstance(tree.body[-1], ast.Expr):
+        tree.body[-1] = ast.Assign(
+            targets=[ast.Name(id="__kitsune_out__", ctx=ast.Store())],
+            value=tree.body[-1].value,
+        )
+    else:
+        tree.body.append(ast.parse("__kitsune_out__ = None").body[0])
+    exports = ast.parse(
+        "return {" + ", ".join(f"{r!r}: {r}" for r in cell["returns"]) + "}, __kitsune_out__"
+    ).body[0]
+    fn = ast.FunctionDef(
+        name="__kitsune_cell__",
+        args=ast.arguments(
+            posonlyargs=[],
+            args=[ast.arg(arg=d) for d in cell["deps"]],
+            kwonlyargs=[],
+            kw_defaults=[],
+            defaults=[],
+        ),
+        body=tree.body + [exports],
+        decorator_list=[],
+        type_params=[],
+    )
+    module = ast.fix_missing_locations(ast.Module(body=[fn], type_ignores=[]))
+    namespace = {"__name__": "__kitsune__"}
+    exec(compile(module, f"<cell {cell['name']}>", "exec"), namespace)
+    return namespace["__kitsune_cell__"]
+
+
+def _forget_local_modules():
+    """Unload modules imported from the notebook directory so edits to them take effect."""
+    root = os.getcwd() + os.sep
+    for name, module in list(sys.modules.items()):
+        if (getattr(module, "__file__", None) or "").startswith(root):
+            del sys.modules[name]
+    importlib.invalidate_caches()
+
+
+def _truncate(text, limit):
+    if len(text) <= limit:
+        return text
+    half = limit // 2
+    return text[:half] + f"\n... [{len(text) - 2 * half} chars truncated] ...\n" + text[-half:]
+
+
+def _run(request, emit):
+    inputs = request.get("inputs")
+    state = _notebooks.get(request["notebook"])
+    if state is None or (inputs is not None and inputs != state.inputs):
+        if state is not None:
+            _forget_local_modules()
+        state = _notebooks[request["notebook"]] = NotebookState(inputs)
+    cells = request["cells"]
+    limit = request.get("output_limit", DEFAULT_OUTPUT_LIMIT)
+    order, upstream = _topo_order(cells)
+    keys = [_cell_key(cell, i) for i, cell in enumerate(cells)]
+    results = [None] * len(cells)
+    rerun = set()
+
+    for i in order:
+        cell = cells[i]
+        key, digest = keys[i], _cell_hash(cell)
+        blocked = [keys[u] for u in upstream[i] if results[u]["status"] in ("error", "skipped")]
+        if blocked:
+            state.hashes.pop(key, None)
+            state.results.pop(key, None)
+            results[i] = {"name": cell["name"], "status": "skipped", "blocked_by": blocked}
+            continue
+        if state.hashes.get(key) == digest and not (upstream[i] & rerun):
+            results[i] = {"name": cell["name"], "status": "cached", **state.results.get(key, {})}
+            continue
+
+        rerun.add(i)
+        stdout = io.StringIO()
+        start = time.perf_counter()
+        try:
+            fn = _compile_cell(cell)
+            args = [state.values[d] for d in cell["deps"]]
+            with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stdout):
+                exports, out = fn(*args)
+        except Exception:
+            state.hashes.pop(key, None)
+            state.results.pop(key, None)
+            results[i] = {
+                "name": cell["name"],
+                "status": "error",
+                "stdout": _truncate(stdout.getvalue(), limit),
+                "error": _truncate(traceback.format_exc(limit=-3), limit),
+                "duration_ms": round((time.perf_counter() - start) * 1000, 2),
+            }
+            emit({"event": "cell", "index": i, **results[i]})
+            continue
+        state.values.update(exports)
+        state.hashes[key] = digest
+        state.results[key] = {
+            "stdout": _truncate(stdout.getvalue(), limit),
+            "output": _truncate(repr(out), limit) if out is not None else None,
+        }
+        results[i] = {
+            "name": cell["name"],
+            "status": "ok",
+            **state.results[key],
+            "duration_ms": round((time.perf_counter() - start) * 1000, 2),
+        }
+        emit({"event": "cell", "index": i, **results[i]})
+
+    # Forget cells that no longer exist so re-adding one runs it again
+    for key in set(state.hashes) - set(keys):
+        del state.hashes[key]
+        state.results.pop(key, None)
+    return {"cells": results, "executed": len(rerun)}
+
+
+def _handle(request, emit):
+    op = request.get("op")
+    if op == "run":
+        return _run(request, emit)
+    if op == "reset":
+        _notebooks.pop(request["notebook"], None)
+        return {}
+    if op == "ping":
+        return {"pid": os.getpid()}
+    raise ValueError(f"Unknown op: {op!r}")
+
+
+def main():
+    protocol = os.fdopen(os.dup(1), "w", encoding="utf-8")
+    os.dup2(2, 1)
+    sys.stdout = sys.stderr
+    # Keep __pycache__ out of the user's notebook directory
+    sys.dont_write_bytecode = True
+    os.chdir(os.environ.get("KITSUNE_NOTEBOOK_DIR", "/notebooks"))
+    sys.path.insert(0, os.getcwd())
+
+    def send(message):
+        protocol.write(json.dumps(message) + "\n")
+        protocol.flush()
+
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        request = json.loads(line)
+        request_id = request.get("id")
+        start = time.perf_counter()
+        try:
+            response = {"ok": True, **_handle(request, lambda event: send({**event, "id": request_id}))}
+        except Exception as e:
+            response = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+        response["id"] = request_id
+        response["duration_ms"] = round((time.perf_counter() - start) * 1000, 2)
+        send(response)
+
+
+if __name__ == "__main__":
+    main()
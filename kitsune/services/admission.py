@@ -0,0 +1,158 @@
+"""Admission control for agent runs: bounded concurrency with a short wait queue."""
+
+from __future__ import annotations
+
+import asyncio
+import math
+import time
+from collections import defaultdict
+from typing import AsyncIterator, TypeVar
+
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from kitsune.services.metrics import Histogram
+
+T = TypeVar("T")
+
+# Weight of the newest run in the moving average of run duration
+_EWMA_ALPHA = 0.2
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, status_code: int, retry_after: int, reason: str) -> None:
+        super().__init__(reason)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class Admission:
+    """A granted run slot, to release when the run's response is finished. Releasing is idempotent."""
+
+    def __init__(self, controller: AdmissionController, session_id: str) -> None:
+        self._controller = controller
+        self._session_id = session_id
+        self._started = time.monotonic()
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._controller._release(self._session_id, time.monotonic() - self._started)
+
+    async def guard(self, stream: AsyncIterator[T]) -> AsyncIterator[T]:
+        """Pass stream through, releasing the slot when it ends or the client goes away."""
+        try:
+            async for item in stream:
+                yield item
+        finally:
+            self.release()
+
+    def response(self, response: Response) -> Response:
+        """Wrap a response so the slot is released however sending it ends.
+
+        guard() alone isn't enough: its cleanup runs only once the body is iterated,
+        which never happens if the client is gone or the response start fails.
+        """
+        return _ReleasingResponse(response, self)
+
+
+class _ReleasingResponse(Response):
+    def __init__(self, response: Response, admission: Admission) -> None:
+        # Only what FastAPI and middleware read; sending is left to the wrapped response
+        self.status_code = response.status_code
+        self.raw_headers = response.raw_headers
+        self.background = None
+        self._response = response
+        self._admission = admission
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await self._response(scope, receive, send)
+            if self.background is not None:
+                await self.background()
+        finally:
+            self._admission.release()
+
+
+class AdmissionController:
+    """Limits concurrent runs globally and per session.
+
+    A session already at its limit is refused at once (429). When every global slot
+    is taken, up to `max_queue` requests wait in FIFO order for up to `queue_timeout`
+    seconds; beyond that, or on timeout, requests are refused (503). Refusals carry a
+    Retry-After estimate derived from recent run durations.
+    """
+
+    def __init__(self, max_concurrent: int, per_session: int, max_queue: int, queue_timeout: float) -> None:
+        self._max_concurrent = max_concurrent
+        self._per_session = per_session
+        self._max_queue = max_queue
+        self._queue_timeout = queue_timeout
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self._sessions: defaultdict[str, int] = defaultdict(int)
+        self._active = 0
+        self._queued = 0
+        self._run_ewma: float | None = None
+        self.queue_time = Histogram()
+        self._counters = {"admitted": 0, "rejected_session": 0, "rejected_full": 0, "queue_timeouts": 0}
+
+    async def admit(self, session_id: str) -> Admission:
+        """Wait for a slot. Raises AdmissionRejected if none can be had in time."""
+        # .get(): indexing the defaultdict would leave an entry behind for rejected sessions
+        if self._sessions.get(session_id, 0) >= self._per_session:
+            self._counters["rejected_session"] += 1
+            raise AdmissionRejected(429, self._retry_after(1), "Too many concurrent requests for this session")
+        if self._slots.locked() and self._queued >= self._max_queue:
+            self._counters["rejected_full"] += 1
+            raise AdmissionRejected(503, self._retry_after(self._queued + 1), "Server is at capacity")
+
+        # Count the session before waiting so its second request can't queue behind the first
+        self._sessions[session_id] += 1
+        self._queued += 1
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self._queue_timeout)
+        except asyncio.TimeoutError:
+            self._forget(session_id)
+            self._counters["queue_timeouts"] += 1
+            raise AdmissionRejected(503, self._retry_after(self._queued), "Timed out waiting for capacity") from None
+        except BaseException:
+            self._forget(session_id)
+            raise
+        finally:
+            self._queued -= 1
+
+        self.queue_time.observe(time.monotonic() - started)
+        self._active += 1
+        self._counters["admitted"] += 1
+        return Admission(self, session_id)
+
+    def stats(self) -> dict:
+        return {
+            **self._counters,
+            "active": self._active,
+            "queued": self._queued,
+            "max_concurrent": self._max_concurrent,
+            "queue_time": self.queue_time.snapshot(),
+        }
+
+    def _retry_after(self, position: int) -> int:
+        # Runs ahead of us finish at roughly max_concurrent per average run duration
+        run = self._run_ewma if self._run_ewma is not None else 10.0
+        return max(1, math.ceil(run * position / self._max_concurrent))
+
+    def _forget(self, session_id: str) -> None:
+        self._sessions[session_id] -= 1
+        if not self._sessions[session_id]:
+            del self._sessions[session_id]
+
+    def _release(self, session_id: str, duration: float) -> None:
+        self._forget(session_id)
+        self._active -= 1
+        self._slots.release()
+        if self._run_ewma is None:
+            self._run_ewma = duration
+        else:
+            self._run_ewma += _EWMA_ALPHA * (duration - self._run_ewma)
@@ -0,0 +1,123 @@
+"""SQLite-backed store of chat sessions and their message history."""
+
+from __future__ import annotations
+
+import asyncio
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+
+from pydantic import TypeAdapter
+from pydantic_ai.messages import ModelMessage, ModelMessagesTypeAdapter
+
+from kitsune.models import Message
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+    kind TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_by_session ON messages (session_id, id);
+"""
+
+_message_adapter: TypeAdapter[ModelMessage] = TypeAdapter(ModelMessage)
+
+
+def to_model_messages(messages: list[Message]) -> list[ModelMessage]:
+    return [_message_adapter.validate_json(m.content) for m in messages]
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class ConversationStore:
+    """Sessions and their pydantic-ai messages, one row per ModelMessage.
+
+    Appending a turn is a single WAL commit and history reads walk the
+    (session_id, id) index. Queries run on worker threads over one connection
+    serialized by a lock, so the event loop never blocks on disk.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self._path = path
+        self._db: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+
+    async def history(self, session_id: str) -> list[ModelMessage]:
+        """The session's whole history, oldest first, ready to pass to an agent run."""
+        rows = await self._run(
+            "SELECT content FROM messages WHERE session_id = ? ORDER BY id", (session_id,), fetch="all",
+        )
+        # One parse for the whole history instead of one per row
+        return ModelMessagesTypeAdapter.validate_json(f"[{','.join(row[0] for row in rows)}]")
+
+    async def page(self, session_id: str, before: int | None = None, limit: int = 50) -> list[Message]:
+        """Up to `limit` messages older than message id `before` (newest if None), oldest first."""
+        rows = await self._run(
+            "SELECT id, session_id, kind, content, created_at FROM messages "
+            "WHERE session_id = ? AND id < ? ORDER BY id DESC LIMIT ?",
+            (session_id, before if before is not None else 2**63 - 1, limit),
+            fetch="all",
+        )
+        return [
+            Message(id=row[0], session_id=row[1], kind=row[2], content=row[3], created_at=row[4])
+            for row in reversed(rows)
+        ]
+
+    async def append(self, session_id: str, messages: list[ModelMessage]) -> None:
+        """Add messages to the end of a session's history, creating the session if needed."""
+        if not messages:
+            return
+        rows = [(m.kind, _message_adapter.dump_json(m).decode()) for m in messages]
+        await asyncio.to_thread(self._append, session_id, rows, _now())
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    # -- internal --
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(self._path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA foreign_keys=ON")
+            # WAL makes NORMAL durable against application crashes; only an OS crash can lose the last commits
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(_SCHEMA)
+        return self._db
+
+    async def _run(self, sql: str, params: tuple, fetch: str) -> list[tuple] | tuple | None:
+        def run() -> list[tuple] | tuple | None:
+            with self._lock:
+                cursor = self._connect().execute(sql, params)
+                return cursor.fetchone() if fetch == "one" else cursor.fetchall()
+
+        return await asyncio.to_thread(run)
+
+    def _append(self, session_id: str, rows: list[tuple[str, str]], now: str) -> None:
+        with self._lock:
+            db = self._connect()
+            with db:
+                db.execute(
+                    "INSERT INTO sessions (id, created_at, updated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT (id) DO UPDATE SET updated_at = excluded.updated_at",
+                    (session_id, now, now),
+                )
+                db.executemany(
+                    "INSERT INTO messages (session_id, kind, content, created_at) VALUES (?, ?, ?, ?)",
+                    [(session_id, kind, content, now) for kind, content in rows],
+                )
@@ -0,0 +1,93 @@
+"""Async facade over the blocking docker-py client.
+
+docker-py calls block on the daemon (exec_run for the lifetime of the process), so
+they run on a bounded thread pool with a separate concurrency limit per operation type.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, TypeVar
+
+import docker
+from docker.models.containers import Container
+
+from kitsune.config import get_config
+
+T = TypeVar("T")
+
+
+class AsyncDocker:
+    def __init__(self, client: docker.DockerClient | None = None) -> None:
+        config = get_config()
+        self._client = client or docker.from_env()
+        self._executor = ThreadPoolExecutor(
+            max_workers=config.DOCKER_MAX_WORKERS,
+            thread_name_prefix="docker",
+        )
+        self._limits = {
+            "run": asyncio.Semaphore(config.DOCKER_RUN_CONCURRENCY),
+            "stop": asyncio.Semaphore(config.DOCKER_STOP_CONCURRENCY),
+            "exec": asyncio.Semaphore(config.DOCKER_EXEC_CONCURRENCY),
+            "inspect": asyncio.Semaphore(config.DOCKER_INSPECT_CONCURRENCY),
+        }
+
+    @property
+    def client(self) -> docker.DockerClient:
+        return self._client
+
+    async def call(self, op: str, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Run a blocking docker-py call off the event loop under the `op` limit."""
+        loop = asyncio.get_running_loop()
+        async with self._limits[op]:
+            return await loop.run_in_executor(
+                self._executor, functools.partial(fn, *args, **kwargs)
+            )
+
+    async def run(self, image: str, **kwargs: Any) -> Container:
+        return await self.call("run", self._client.containers.run, image, **kwargs)
+
+    async def get(self, container_id: str) -> Container:
+        return await self.call("inspect", self._client.containers.get, container_id)
+
+    async def list_containers(self, **kwargs: Any) -> list[Container]:
+        return await self.call("inspect", self._client.containers.list, **kwargs)
+
+    async def info(self) -> dict:
+        return await self.call("inspect", self._client.info)
+
+    async def rename(self, container: Container, name: str) -> None:
+        await self.call("inspect", container.rename, name)
+
+    async def stop(self, container: Container, timeout: int = 5) -> None:
+        await self.call("stop", container.stop, timeout=timeout)
+
+    async def exec_run(self, container: Container, command: list[str], **kwargs: Any) -> Any:
+        return await self.call("exec", container.exec_run, command, **kwargs)
+
+    async def exec_stream(
+        self,
+        container: Container,
+        command: list[str],
+        on_chunk: Callable[[bytes], None],
+    ) -> int:
+        """Run a command, passing output chunks to on_chunk as they arrive. Returns the exit code.
+
+        on_chunk is called on the event loop thread.
+        """
+        api = self._client.api
+        loop = asyncio.get_running_loop()
+        exec_id = (await self.call("inspect", api.exec_create, container.id, command))["Id"]
+
+        def pump() -> None:
+            for chunk in api.exec_start(exec_id, stream=True):
+                loop.call_soon_threadsafe(on_chunk, chunk)
+
+        await self.call("exec", pump)
+        return (await self.call("inspect", api.exec_inspect, exec_id))["ExitCode"]
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._client.close()
@@ -0,0 +1,57 @@
+"""Application-scoped, pooled HTTP clients."""
+
+from __future__ import annotations
+
+import importlib.util
+
+import httpx
+
+from kitsune.config import get_config
+
+# HTTP/2 needs the optional `h2` package (httpx[http2]); fall back to HTTP/1.1 without it
+_HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+class HttpClients:
+    """Named httpx clients shared by every request, each with its own keep-alive pool.
+
+    Most names are used for a single upstream host, so the default pool limit is
+    effectively a per-host connection limit. A client that spans many hosts (the
+    sandbox probes reach every container) passes its own limits instead. Clients
+    are created on first use and closed together on application shutdown.
+    """
+
+    def __init__(self) -> None:
+        self._clients: dict[str, httpx.AsyncClient] = {}
+
+    def get(
+        self,
+        name: str,
+        *,
+        http2: bool = True,
+        max_connections: int | None = None,
+        max_keepalive: int | None = None,
+    ) -> httpx.AsyncClient:
+        """The named client. Limits apply when it is created, i.e. on the first call."""
+        client = self._clients.get(name)
+        if client is None or client.is_closed:
+            config = get_config()
+            client = httpx.AsyncClient(
+                http2=http2 and _HTTP2_AVAILABLE,
+                limits=httpx.Limits(
+                    max_connections=max_connections or config.HTTP_MAX_CONNECTIONS_PER_HOST,
+                    max_keepalive_connections=max_keepalive or config.HTTP_MAX_KEEPALIVE_PER_HOST,
+                    keepalive_expiry=config.HTTP_KEEPALIVE_EXPIRY,
+                ),
+                timeout=httpx.Timeout(config.HTTP_TIMEOUT, connect=config.HTTP_CONNECT_TIMEOUT),
+            )
+            self._clients[name] = client
+        return client
+
+    async def aclose(self) -> None:
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
+
+
+http_clients = HttpClients()
@@ -0,0 +1,151 @@
+"""Client for the persistent notebook kernel running inside a sandbox container."""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import struct
+import threading
+from pathlib import Path
+from typing import Any, Callable
+
+from kitsune.services.docker_client import AsyncDocker
+
+KERNEL_SOURCE = (Path(__file__).parent / "_kernel_main.py").read_text(encoding="utf-8")
+
+_STDOUT, _STDERR = 1, 2
+
+
+class KernelError(RuntimeError):
+    """The kernel process died or broke protocol. The session should start a new one."""
+
+
+class KernelSession:
+    """A `_kernel_main` process attached over a Docker exec socket.
+
+    Docker multiplexes the exec's stdout and stderr onto one socket as framed
+    chunks; responses are read from the stdout frames, one JSON object per line.
+    """
+
+    def __init__(self, docker: AsyncDocker, container_id: str) -> None:
+        self._docker = docker
+        self._container_id = container_id
+        self._sock: Any = None
+        self._buffer = b""
+        self._stderr = b""
+        self._next_id = 0
+        self._pid: int | None = None
+        self._lock = asyncio.Lock()
+        # A cancelled request keeps reading on its executor thread until its response arrives
+        self._io_lock = threading.Lock()
+
+    async def start(self) -> None:
+        api = self._docker.client.api
+        exec_id = await self._docker.call(
+            "exec",
+            api.exec_create,
+            self._container_id,
+            ["python", "-u", "-c", KERNEL_SOURCE],
+            stdin=True,
+            stdout=True,
+            stderr=True,
+        )
+        sock = await self._docker.call("exec", api.exec_start, exec_id["Id"], socket=True)
+        self._sock = getattr(sock, "_sock", sock)
+        self._pid = (await self.request({"op": "ping"}))["pid"]
+
+    async def request(self, payload: dict, on_event: Callable[[dict], None] | None = None) -> dict:
+        """Send a request and await its response. Events it emits go to on_event on the loop thread."""
+        loop = asyncio.get_running_loop()
+
+        def forward(event: dict) -> None:
+            if on_event is not None:
+                loop.call_soon_threadsafe(on_event, event)
+
+        async with self._lock:
+            self._next_id += 1
+            request_id = self._next_id
+            line = json.dumps({**payload, "id": request_id}).encode() + b"\n"
+            response = await self._docker.call("exec", self._roundtrip, line, request_id, forward)
+        if not response.get("ok"):
+            raise RuntimeError(response.get("error", "Kernel request failed"))
+        return response
+
+    async def run(
+        self,
+        notebook: str,
+        cells: list[dict],
+        output_limit: int,
+        on_event: Callable[[dict], None] | None = None,
+        inputs: str | None = None,
+    ) -> dict:
+        """Run a notebook's cells, re-executing only what changed since the last run.
+
+        inputs is a digest of the data files the cells may read; when it differs from
+        the previous run's, the notebook's state is dropped and every cell runs.
+        """
+        payload = {
+            "op": "run",
+            "notebook": notebook,
+            "cells": cells,
+            "output_limit": output_limit,
+            "inputs": inputs,
+        }
+        return await self.request(payload, on_event)
+
+    async def kill(self) -> None:
+        """Kill the kernel process, interrupting whatever cell it is running."""
+        if self._pid is not None:
+            container = await self._docker.get(self._container_id)
+            await self._docker.exec_run(container, ["kill", "-9", str(self._pid)])
+        self.close()
+
+    def close(self) -> None:
+        # Closing stdin ends the kernel's read loop, which exits the process
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    # -- blocking socket I/O, run on the Docker executor --
+
+    def _roundtrip(self, line: bytes, request_id: int, on_event: Callable[[dict], None]) -> dict:
+        with self._io_lock:
+            if self._sock is None:
+                raise KernelError("Kernel is closed")
+            self._sock.sendall(line)
+            # Skip responses to earlier requests whose caller was cancelled
+            while True:
+                response = json.loads(self._read_line())
+                if response.get("id") != request_id:
+                    continue
+                if "event" in response:
+                    on_event(response)
+                    continue
+                return response
+
+    def _read_line(self) -> bytes:
+        while b"\n" not in self._buffer:
+            stream, chunk = self._read_frame()
+            if stream == _STDOUT:
+                self._buffer += chunk
+            elif stream == _STDERR:
+                self._stderr = (self._stderr + chunk)[-4096:]
+        line, _, self._buffer = self._buffer.partition(b"\n")
+        return line
+
+    def _read_frame(self) -> tuple[int, bytes]:
+        stream, size = struct.unpack(">BxxxL", self._read_exactly(8))
+        return stream, self._read_exactly(size)
+
+    def _read_exactly(self, n: int) -> bytes:
+        data = b""
+        while len(data) < n:
+            try:
+                chunk = self._sock.recv(n - len(data))
+            except OSError as e:
+                raise KernelError(f"Kernel connection lost: {e}") from e
+            if not chunk:
+                stderr = self._stderr.decode("utf-8", errors="replace").strip()
+                raise KernelError(f"Kernel exited unexpectedly: {stderr[-1000:]}")
+            data += chunk
+        return data
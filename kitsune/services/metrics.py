@@ -0,0 +1,200 @@
+"""Lightweight in-process metrics."""
+
+from __future__ import annotations
+
+import bisect
+import functools
+import math
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Iterable, Iterator, ParamSpec, TypeVar
+
+from kitsune.logging import get_logger
+
+logger = get_logger("metrics")
+
+P = ParamSpec("P")
+R = TypeVar("R")
+
+# Upper bounds in seconds, roughly log-spaced from fast cache-like calls to slow upstreams
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    """Fixed-bucket histogram. Recording is a bisect and a few arithmetic updates, cheap enough for hot paths."""
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.buckets = buckets
+        # One count per bucket plus an overflow bucket for values above the last bound
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float | None:
+        """Estimate a quantile by linear interpolation within its bucket, clamped to the observed range."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lower = max(self.buckets[i - 1] if i else 0.0, self.min)
+                upper = min(self.buckets[i] if i < len(self.buckets) else self.max, self.max)
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+        return self.max
+
+    def snapshot(self) -> dict:
+        def rounded(value: float | None) -> float | None:
+            return round(value, 3) if value is not None else None
+
+        return {
+            "count": self.count,
+            "mean": rounded(self.sum / self.count if self.count else None),
+            "p50": rounded(self.quantile(0.5)),
+            "p95": rounded(self.quantile(0.95)),
+            "p99": rounded(self.quantile(0.99)),
+        }
+
+
+@dataclass
+class Metric:
+    """One sample of a metric family, built when metrics are scraped."""
+
+    name: str
+    kind: str  # "counter", "gauge" or "histogram"
+    help: str
+    value: float | Histogram
+    labels: dict[str, str] = field(default_factory=dict)
+
+
+def counter(name: str, help: str, value: float, **labels: str) -> Metric:
+    return Metric(name, "counter", help, value, labels)
+
+
+def gauge(name: str, help: str, value: float, **labels: str) -> Metric:
+    return Metric(name, "gauge", help, value, labels)
+
+
+def histogram(name: str, help: str, value: Histogram, **labels: str) -> Metric:
+    return Metric(name, "histogram", help, value, labels)
+
+
+class CallMetrics:
+    """Latency and error counts of calls to a set of named async functions.
+
+    `timed` wraps a function without changing its signature, so it can sit under
+    decorators that inspect it, such as `@agent.tool`. A call counts as an error if it
+    raises or if `is_error` says its result reports a failure.
+    """
+
+    def __init__(self, prefix: str, label: str, is_error: Callable[[Any], bool] | None = None) -> None:
+        self._prefix = prefix
+        self._label = label
+        self._is_error = is_error or (lambda result: False)
+        self._latency: dict[str, Histogram] = {}
+        self._errors: dict[str, int] = {}
+
+    def timed(self, fn: Callable[P, Awaitable[R]]) -> Callable[P, Awaitable[R]]:
+        name = fn.__name__
+        latency = self._latency.setdefault(name, Histogram())
+        self._errors.setdefault(name, 0)
+
+        @functools.wraps(fn)
+        async def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+            start = time.perf_counter()
+            failed = True
+            try:
+                result = await fn(*args, **kwargs)
+                failed = self._is_error(result)
+                return result
+            finally:
+                latency.observe(time.perf_counter() - start)
+                if failed:
+                    self._errors[name] += 1
+
+        return wrapper
+
+    def metrics(self) -> list[Metric]:
+        result = []
+        for name, latency in self._latency.items():
+            labels = {self._label: name}
+            result.append(histogram(f"{self._prefix}_seconds", "Call duration", latency, **labels))
+            result.append(counter(f"{self._prefix}_errors_total", "Calls that failed", self._errors[name], **labels))
+        return result
+
+
+class Registry:
+    """Renders metrics from registered collectors in the Prometheus text format.
+
+    Components only bump counters and observe Histograms as they work; a collector turns
+    that state into Metrics when /metrics is scraped, so recording stays as cheap as it
+    is for their stats() and nothing depends on logfire.
+    """
+
+    def __init__(self) -> None:
+        self._collectors: list[Callable[[], Iterable[Metric]]] = []
+
+    def register(self, collector: Callable[[], Iterable[Metric]]) -> None:
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        families: dict[str, list[Metric]] = {}
+        for collector in self._collectors:
+            try:
+                for metric in collector():
+                    families.setdefault(metric.name, []).append(metric)
+            except Exception as e:
+                # One broken component shouldn't take the whole scrape down
+                logger.warning(f"Metrics collector {collector!r} failed: {e!r}")
+
+        lines = []
+        for name, samples in families.items():
+            lines.append(f"# HELP {name} {samples[0].help}")
+            lines.append(f"# TYPE {name} {samples[0].kind}")
+            for metric in samples:
+                lines.extend(_sample_lines(metric))
+        return "\n".join(lines) + "\n"
+
+
+def _sample_lines(metric: Metric) -> Iterator[str]:
+    value = metric.value
+    if not isinstance(value, Histogram):
+        yield f"{metric.name}{_labels(metric.labels)} {_number(value)}"
+        return
+    cumulative = 0
+    for bound, n in zip(value.buckets, value.counts):
+        cumulative += n
+        yield f"{metric.name}_bucket{_labels({**metric.labels, 'le': _number(bound)})} {cumulative}"
+    yield f"{metric.name}_bucket{_labels({**metric.labels, 'le': '+Inf'})} {value.count}"
+    yield f"{metric.name}_sum{_labels(metric.labels)} {_number(value.sum)}"
+    yield f"{metric.name}_count{_labels(metric.labels)} {value.count}"
+
+
+def _labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(str(value))}"' for key, value in labels.items()) + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value: float) -> str:
+    if isinstance(value, float):
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        if value.is_integer():
+            return str(int(value))
+        return repr(value)
+    return str(int(value))
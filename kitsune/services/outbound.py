@@ -0,0 +1,229 @@
+"""Rate limiting, retries and circuit breaking for calls to external APIs."""
+
+from __future__ import annotations
+
+import asyncio
+import random
+import time
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
+from typing import Awaitable, Callable
+
+import httpx
+
+from kitsune.config import get_config
+from kitsune.logging import get_logger
+from kitsune.services.metrics import Histogram, Metric, counter, gauge, histogram
+
+logger = get_logger("outbound")
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class ProviderUnavailableError(RuntimeError):
+    """The provider's circuit breaker is open; the call was not attempted."""
+
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second on average, with bursts of up to `burst`."""
+
+    def __init__(self, rate: float, burst: int) -> None:
+        self._rate = rate
+        self._burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        # The lock makes waiters queue up in order instead of all waking for the same token
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self._burst, self._tokens + (now - self._updated) * self._rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self._rate)
+
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures and rejects calls for `cooldown` seconds.
+
+    After the cooldown one trial call is let through (half-open); its outcome closes
+    the breaker or opens it for another cooldown.
+    """
+
+    def __init__(self, threshold: int, cooldown: float) -> None:
+        self._threshold = threshold
+        self._cooldown = cooldown
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._trial_running = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at < self._cooldown or self._trial_running:
+            return "open"
+        return "half-open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "half-open":
+            self._trial_running = True
+        return state != "open"
+
+    def record_success(self) -> None:
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+
+    def abandon(self) -> None:
+        # The trial call was cancelled before it had an outcome; let the next call try
+        self._trial_running = False
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self._trial_running or self._failures >= self._threshold:
+            self._opened_at = time.monotonic()
+        self._trial_running = False
+
+
+class ProviderGuard:
+    """Outbound-call controls shared by every request to one provider.
+
+    Each attempt waits for a rate-limit token and a concurrency slot. 429 and 5xx
+    responses and transport errors are retried with jittered exponential backoff,
+    honouring Retry-After. Requests that still fail count towards the circuit breaker.
+    """
+
+    def __init__(self, name: str, rate: float, burst: int, concurrency: int) -> None:
+        config = get_config()
+        self.name = name
+        self._bucket = TokenBucket(rate, burst)
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._breaker = CircuitBreaker(config.OUTBOUND_BREAKER_THRESHOLD, config.OUTBOUND_BREAKER_COOLDOWN)
+        self._max_retries = config.OUTBOUND_MAX_RETRIES
+        self._backoff_base = config.OUTBOUND_BACKOFF_BASE
+        self._backoff_max = config.OUTBOUND_BACKOFF_MAX
+        self._counters = {"requests": 0, "retries": 0, "failures": 0, "rejected": 0}
+        # Wall time of requests that got a usable response, retries included
+        self.latency = Histogram()
+
+    async def request(self, send: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+        """Call send() until it succeeds or retries run out, returning the last response.
+
+        Raises ProviderUnavailableError if the breaker is open, or the last transport
+        error if no attempt got a response.
+        """
+        if not self._breaker.allow():
+            self._counters["rejected"] += 1
+            raise ProviderUnavailableError(f"{self.name} is temporarily unavailable after repeated failures")
+        self._counters["requests"] += 1
+
+        started = time.monotonic()
+        try:
+            response = await self._attempt(send)
+        except asyncio.CancelledError:
+            self._breaker.abandon()
+            raise
+        if not response.is_error:
+            self.latency.observe(time.monotonic() - started)
+        return response
+
+    def stats(self) -> dict:
+        return {**self._counters, "breaker": self._breaker.state, "latency": self.latency.snapshot()}
+
+    def metrics(self) -> list[Metric]:
+        labels = {"provider": self.name}
+        return [
+            counter("kitsune_outbound_requests_total", "Requests let through", self._counters["requests"], **labels),
+            counter("kitsune_outbound_retries_total", "Attempts retried", self._counters["retries"], **labels),
+            counter(
+                "kitsune_outbound_failures_total", "Requests failed after retries",
+                self._counters["failures"], **labels,
+            ),
+            counter(
+                "kitsune_outbound_rejected_total", "Requests refused by the open breaker",
+                self._counters["rejected"], **labels,
+            ),
+            gauge(
+                "kitsune_outbound_breaker_open", "Whether the circuit breaker is open",
+                self._breaker.state == "open", **labels,
+            ),
+            histogram("kitsune_outbound_request_seconds", "Time to a usable response", self.latency, **labels),
+        ]
+
+    async def _attempt(self, send: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+        attempt = 0
+        while True:
+            response: httpx.Response | None = None
+            error: httpx.TransportError | None = None
+            await self._bucket.acquire()
+            async with self._semaphore:
+                try:
+                    response = await send()
+                except httpx.TransportError as e:
+                    error = e
+                except Exception:
+                    # Not worth retrying (e.g. a decoding error), but still a failure, and
+                    # the outcome that ends a half-open trial
+                    self._counters["failures"] += 1
+                    self._breaker.record_failure()
+                    raise
+            if response is not None and response.status_code not in RETRYABLE_STATUS:
+                self._breaker.record_success()
+                return response
+
+            delay = self._retry_delay(attempt, response)
+            if delay is None:
+                self._counters["failures"] += 1
+                self._breaker.record_failure()
+                if error is not None:
+                    raise error
+                return response
+            attempt += 1
+            self._counters["retries"] += 1
+            logger.info(f"{self.name}: retrying in {delay:.1f}s ({response.status_code if response else error})")
+            await asyncio.sleep(delay)
+
+    def _retry_delay(self, attempt: int, response: httpx.Response | None) -> float | None:
+        if attempt >= self._max_retries:
+            return None
+        backoff = min(self._backoff_max, self._backoff_base * 2 ** attempt)
+        delay = random.uniform(0, backoff)
+        retry_after = _retry_after(response) if response is not None else None
+        if retry_after is not None:
+            # A server asking us to wait longer than we're willing to is a failure now, not later
+            if retry_after > self._backoff_max:
+                return None
+            delay = max(delay, retry_after)
+        return delay
+
+
+def _retry_after(response: httpx.Response) -> float | None:
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+@lru_cache
+def get_guard(provider: str) -> ProviderGuard:
+    """Shared guard for a search provider ("linkup" or "tavily")."""
+    config = get_config()
+    limits = {
+        "linkup": (config.LINKUP_RATE_LIMIT, config.LINKUP_CONCURRENCY),
+        "tavily": (config.TAVILY_RATE_LIMIT, config.TAVILY_CONCURRENCY),
+    }
+    rate, concurrency = limits[provider]
+    return ProviderGuard(provider, rate=rate, burst=max(1, int(rate)), concurrency=concurrency)
@@ -0,0 +1,155 @@
+"""Content-addressed cache of notebook run results."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from kitsune.config import get_config
+from kitsune.services.metrics import Metric, counter, gauge
+
+_DIGEST_MEMO_SIZE = 4096
+
+# Marks a .py file as a marimo notebook rather than a module notebooks can import
+_NOTEBOOK_MARKER = re.compile(rb"^app\s*=\s*marimo\.App\(", re.MULTILINE)
+
+# Written by the marimo editor and the Python import system, not by users
+_GENERATED_DIRS = {"__marimo__", "__pycache__"}
+
+
+@dataclass
+class _Entry:
+    session_id: str
+    result: dict[str, Any]
+    size: int
+
+
+class RunCache:
+    """LRU cache of run_notebook results keyed by notebook and data file contents.
+
+    The key covers the notebook source and the content of every data file and helper
+    module in the session directory, so any edit to either is a miss. File digests
+    are memoized by (size, mtime) so unchanged files are not re-read on every lookup.
+    """
+
+    def __init__(self) -> None:
+        config = get_config()
+        self._max_bytes = config.RUN_CACHE_MAX_BYTES
+        self._session_max_bytes = config.RUN_CACHE_SESSION_MAX_BYTES
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._session_bytes: dict[str, int] = {}
+        self._bytes = 0
+        self._digests: OrderedDict[Path, tuple[int, int, str, bool]] = OrderedDict()
+        self._digests_lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def key(self, notebook: str, source: str, mode: str, inputs: str) -> str:
+        """Hash the notebook source with the data_digest() of its session directory."""
+        h = hashlib.sha256()
+        h.update(json.dumps([notebook, mode, inputs]).encode())
+        h.update(source.encode())
+        return h.hexdigest()
+
+    def data_digest(self, session_dir: Path) -> str:
+        """Hash the data files and importable modules in a session directory. Blocking: reads files.
+
+        Notebooks are excluded so editing one doesn't invalidate every cached run, but
+        other .py files count: the kernel has the directory on sys.path.
+        """
+        h = hashlib.sha256()
+        for path in sorted(session_dir.rglob("*")):
+            rel = path.relative_to(session_dir)
+            if not path.is_file() or rel.parts[0].startswith(".") or _GENERATED_DIRS.intersection(rel.parts):
+                continue
+            digest, notebook = self._file_digest(path)
+            if notebook:
+                continue
+            h.update(str(rel).encode())
+            h.update(digest.encode())
+        return h.hexdigest()
+
+    def get(self, key: str) -> dict[str, Any] | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            self._misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self._hits += 1
+        return entry.result
+
+    def put(self, session_id: str, key: str, result: dict[str, Any]) -> None:
+        size = len(json.dumps(result, default=str))
+        if size > self._session_max_bytes or size > self._max_bytes:
+            return
+        self._remove(key)
+        self._entries[key] = _Entry(session_id=session_id, result=result, size=size)
+        self._bytes += size
+        self._session_bytes[session_id] = self._session_bytes.get(session_id, 0) + size
+
+        while self._session_bytes[session_id] > self._session_max_bytes:
+            oldest = next(k for k, e in self._entries.items() if e.session_id == session_id)
+            self._remove(oldest)
+            self._evictions += 1
+        while self._bytes > self._max_bytes:
+            self._remove(next(iter(self._entries)))
+            self._evictions += 1
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self._hits + self._misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self._max_bytes,
+            "hits": self._hits,
+            "misses": self._misses,
+            "evictions": self._evictions,
+            "hit_rate": round(self._hits / lookups, 3) if lookups else 0.0,
+        }
+
+    def metrics(self) -> list[Metric]:
+        return [
+            counter("kitsune_run_cache_hits_total", "Notebook runs answered from the cache", self._hits),
+            counter("kitsune_run_cache_misses_total", "Notebook runs not in the cache", self._misses),
+            counter("kitsune_run_cache_evictions_total", "Results evicted for space", self._evictions),
+            gauge("kitsune_run_cache_entries", "Cached run results", len(self._entries)),
+            gauge("kitsune_run_cache_bytes", "Size of cached run results", self._bytes),
+        ]
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._bytes -= entry.size
+        remaining = self._session_bytes[entry.session_id] - entry.size
+        if remaining:
+            self._session_bytes[entry.session_id] = remaining
+        else:
+            del self._session_bytes[entry.session_id]
+
+    def _file_digest(self, path: Path) -> tuple[str, bool]:
+        """The file's content hash and whether it is a marimo notebook."""
+        stat = path.stat()
+        with self._digests_lock:
+            memo = self._digests.get(path)
+            if memo and memo[0] == stat.st_size and memo[1] == stat.st_mtime_ns:
+                self._digests.move_to_end(path)
+                return memo[2], memo[3]
+        h = hashlib.sha256()
+        with path.open("rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        digest = h.hexdigest()
+        notebook = path.suffix == ".py" and _NOTEBOOK_MARKER.search(path.read_bytes()) is not None
+        with self._digests_lock:
+            self._digests[path] = (stat.st_size, stat.st_mtime_ns, digest, notebook)
+            if len(self._digests) > _DIGEST_MEMO_SIZE:
+                self._digests.popitem(last=False)
+        return digest, notebook
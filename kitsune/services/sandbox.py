@@ -3,15 +3,80 @@
 from __future__ import annotations
 
 import asyncio
+import codecs
+import heapq
+import math
+import os
 import shutil
 import time
+import uuid
+from collections import deque
+from contextlib import asynccontextmanager
 from dataclasses import dataclass, field
 from pathlib import Path
+from typing import AsyncIterator, Callable, Protocol
 
-import docker
-from docker.errors import NotFound
+import httpx
+from docker.errors import APIError, NotFound
 
 from kitsune.config import get_config
+from kitsune.logging import get_logger
+from kitsune.services.docker_client import AsyncDocker
+from kitsune.services.http import http_clients
+from kitsune.services.kernel import KernelError, KernelSession
+from kitsune.services.metrics import Histogram, Metric, counter, gauge, histogram
+from kitsune.services.run_cache import RunCache
+
+logger = get_logger("sandbox")
+
+_NAME_PREFIX = "kitsune-marimo-"
+_POOL_NAME_PREFIX = "kitsune-marimo-pool-"
+_MARIMO_PORT = 2718
+# Seconds between attempts to stop containers whose teardown failed to stop them
+_ORPHAN_RETRY = 30.0
+
+
+class SandboxCapacityError(RuntimeError):
+    """No room on the host for another sandbox within SANDBOX_CAPACITY_TIMEOUT."""
+
+
+@dataclass(frozen=True)
+class ResourceProfile:
+    """CPU, memory and process limits for a sandbox container."""
+
+    name: str
+    cpus: float
+    memory_mb: int
+    pids: int
+
+    @classmethod
+    def parse(cls, spec: str) -> ResourceProfile:
+        """From "name:cpus:memory_mb:pids"."""
+        name, cpus, memory_mb, pids = spec.split(":")
+        return cls(name=name, cpus=float(cpus), memory_mb=int(memory_mb), pids=int(pids))
+
+    @property
+    def spec(self) -> str:
+        """The "name:cpus:memory_mb:pids" form parse() reads."""
+        return f"{self.name}:{self.cpus:g}:{self.memory_mb}:{self.pids}"
+
+    def run_kwargs(self) -> dict:
+        return {
+            "nano_cpus": int(self.cpus * 1e9),
+            "mem_limit": f"{self.memory_mb}m",
+            # Same as mem_limit: no swap, so a runaway job is OOM-killed instead of thrashing the host
+            "memswap_limit": f"{self.memory_mb}m",
+            "pids_limit": self.pids,
+        }
+
+
+def load_profiles() -> dict[str, ResourceProfile]:
+    """The "default" profile and any SANDBOX_PROFILES, by name."""
+    config = get_config()
+    default = ResourceProfile("default", config.SANDBOX_CPUS, config.SANDBOX_MEMORY_MB, config.SANDBOX_PIDS_LIMIT)
+    return {"default": default, **{
+        profile.name: profile for profile in map(ResourceProfile.parse, config.SANDBOX_PROFILES)
+    }}
 
 
 @dataclass
@@ -19,21 +84,163 @@ class ContainerInfo:
     container_id: str
     session_id: str
     host_port: int
+    profile: ResourceProfile
+    # Where host_port is published: the Docker host running the container
+    host: str = "localhost"
     created_at: float = field(default_factory=time.time)
     last_activity: float = field(default_factory=time.time)
 
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.host_port}"
+
     def touch(self) -> None:
         self.last_activity = time.time()
 
 
-class SandboxManager:
+@dataclass
+class PooledContainer:
+    """An idle, healthy container waiting to be claimed by a session."""
+
+    container_id: str
+    pool_id: str
+    host_port: int
+    profile: ResourceProfile
+    created_at: float = field(default_factory=time.time)
+
+
+class BoundedOutput:
+    """Accumulates a byte stream, keeping only its first and last max_bytes / 2 bytes."""
+
+    def __init__(self, max_bytes: int) -> None:
+        self._half = max_bytes // 2
+        self._head = bytearray()
+        self._tail = bytearray()
+        self.total = 0
+
+    def write(self, chunk: bytes) -> None:
+        self.total += len(chunk)
+        room = self._half - len(self._head)
+        if room > 0:
+            self._head += chunk[:room]
+            chunk = chunk[room:]
+        if chunk:
+            self._tail += chunk
+            if len(self._tail) > self._half:
+                del self._tail[:len(self._tail) - self._half]
+
+    def text(self) -> str:
+        head = self._head.decode("utf-8", errors="replace")
+        tail = self._tail.decode("utf-8", errors="replace")
+        dropped = self.total - len(self._head) - len(self._tail)
+        if dropped:
+            return f"{head}\n... [{dropped} bytes truncated] ...\n{tail}"
+        return head + tail
+
+
+class _KeyedLocks:
+    """Per-key asyncio locks, dropped once no task holds or awaits them."""
+
     def __init__(self) -> None:
+        self._locks: dict[str, tuple[asyncio.Lock, int]] = {}
+
+    @asynccontextmanager
+    async def hold(self, key: str) -> AsyncIterator[None]:
+        lock, users = self._locks.get(key, (None, 0))
+        lock = lock or asyncio.Lock()
+        self._locks[key] = (lock, users + 1)
+        try:
+            async with lock:
+                yield
+        finally:
+            lock, users = self._locks[key]
+            if users == 1:
+                del self._locks[key]
+            else:
+                self._locks[key] = (lock, users - 1)
+
+    def busy(self, key: str) -> bool:
+        return key in self._locks
+
+
+def _sandbox_http() -> httpx.AsyncClient:
+    """The client for readiness and connection probes.
+
+    It reaches every container on every node, so it gets its own pool limits rather
+    than the per-host defaults.
+    """
+    config = get_config()
+    return http_clients.get(
+        "sandbox",
+        http2=False,
+        max_connections=config.SANDBOX_HTTP_MAX_CONNECTIONS,
+        max_keepalive=config.SANDBOX_HTTP_MAX_KEEPALIVE,
+    )
+
+
+class SandboxBackend(Protocol):
+    """What the app and the agent tools need from wherever sandboxes run."""
+
+    run_cache: RunCache
+
+    async def startup(self) -> None: ...
+
+    async def shutdown(self) -> None: ...
+
+    async def get_or_create(self, session_id: str, profile: str | None = None) -> ContainerInfo: ...
+
+    async def destroy(self, session_id: str) -> None: ...
+
+    def profile(self, name: str | None = None) -> ResourceProfile: ...
+
+    def get_info(self, session_id: str) -> ContainerInfo | None: ...
+
+    def status(self) -> dict: ...
+
+    def metrics(self) -> list[Metric]: ...
+
+    def get_user_dir(self, session_id: str) -> Path: ...
+
+    async def exec_in_container(
+        self,
+        session_id: str,
+        command: list[str],
+        timeout: int | None = None,
+        on_output: Callable[[str], None] | None = None,
+    ) -> str: ...
+
+    async def run_in_kernel(
+        self,
+        session_id: str,
+        notebook: str,
+        cells: list[dict],
+        timeout: int | None = None,
+        on_event: Callable[[dict], None] | None = None,
+        inputs: str | None = None,
+    ) -> dict: ...
+
+
+class SandboxManager:
+    """Sandboxes on one Docker daemon, reached at `host` (the local daemon by default)."""
+
+    def __init__(
+        self,
+        docker: AsyncDocker | None = None,
+        host: str = "localhost",
+        run_cache: RunCache | None = None,
+    ) -> None:
         config = get_config()
-        self._client = docker.from_env()
+        self._docker = docker or AsyncDocker()
+        self.host = host
         self._image = config.MARIMO_IMAGE
         self._port_start = config.MARIMO_PORT_START
         self._port_end = config.MARIMO_PORT_END
-        self._timeout = config.MARIMO_CONTAINER_TIMEOUT
+        self._idle_timeout = config.MARIMO_CONTAINER_TIMEOUT * 60
+        self._exec_timeout = config.SANDBOX_EXEC_TIMEOUT
+        self._exec_max_bytes = config.SANDBOX_EXEC_MAX_BYTES
+        self._cell_output_max_bytes = config.SANDBOX_CELL_OUTPUT_MAX_BYTES
+        self._keep_on_shutdown = config.SANDBOX_KEEP_ON_SHUTDOWN
+        self._probe_limit = asyncio.Semaphore(config.SANDBOX_PROBE_CONCURRENCY)
         self._data_dir = Path(config.NOTEBOOK_DATA_DIR)
         # Host-side base path for Docker volume mounts. When Kitsune runs inside a
         # container, this must point to the same directory on the *host* filesystem so
@@ -42,69 +249,167 @@ class SandboxManager:
         self._host_dir = Path(config.NOTEBOOK_HOST_DIR) if config.NOTEBOOK_HOST_DIR else self._data_dir
         self._seed_dir = Path("notebooks")
         self._containers: dict[str, ContainerInfo] = {}
-        self._cleanup_task: asyncio.Task | None = None
+        # Idle reaping. The heap holds (expiry, container id, session id), one entry per
+        # container. touch() only moves last_activity later, so an entry is never later
+        # than its real expiry; when it comes due the real expiry is checked and the entry
+        # re-pushed if the session was used in the meantime.
+        self._expiries: list[tuple[float, str, str]] = []
+        self._reaper_wakeup = asyncio.Event()
+        self._reaper_task: asyncio.Task | None = None
+        self._reaping: set[asyncio.Task] = set()
+        self._reaped = 0
+        self._kept_alive = 0
+        # Containers no longer tracked as a session or pool slot that failed to stop; the
+        # reaper retries them. Their ports and capacity are released already.
+        self._orphans: set[str] = set()
+        self._orphan_task: asyncio.Task | None = None
+        # Total time the reaped containers sat idle before being stopped
+        self._idle_seconds = 0.0
+        # Seconds between a container's idle expiry and it being stopped
+        self.reap_delay = Histogram((0.1, 0.5, 1, 5, 10, 30, 60, 300))
+        # Concurrent get_or_create calls for a session share one in-flight creation,
+        # and create/destroy/exec for a session are serialized by its lock. Ports are
+        # reserved at allocation time, before any await, and released with the container.
+        self._creating: dict[str, asyncio.Task[ContainerInfo]] = {}
+        self._session_locks = _KeyedLocks()
+        self._reserved_ports: set[int] = set()
+        self._kernels: dict[str, KernelSession] = {}
+        self.run_cache = run_cache or RunCache()
+        self._ports_exhausted = 0
+
+        # Time from deciding to create a container until it serves, by whether a pooled
+        # one was claimed or a new one started (capacity waits excluded)
+        self.start_time = {"pool": Histogram(), "cold": Histogram()}
+        self.exec_time = Histogram()
+        self._exec_timeouts = 0
+        self._exec_failures = 0
+        self.kernel_run_time = Histogram()
+        self._kernel_restarts = 0
+
+        # Host capacity. Every container, pooled or not, holds its profile's CPUs and
+        # memory from the moment it is reserved until it is stopped. Zero capacities are
+        # filled in from the Docker daemon at startup.
+        self._profiles = load_profiles()
+        self._default_profile = self._profiles["default"]
+        self._capacity_cpus = config.SANDBOX_HOST_CPUS
+        self._capacity_memory_mb = config.SANDBOX_HOST_MEMORY_MB
+        self._host_reserved_mb = config.SANDBOX_HOST_RESERVED_MB
+        self._evict_idle = config.SANDBOX_EVICT_IDLE
+        self._capacity_timeout = config.SANDBOX_CAPACITY_TIMEOUT
+        self._used_cpus = 0.0
+        self._used_memory_mb = 0
+        self._capacity_freed = asyncio.Event()
+        self._capacity_waiting = 0
+        self._evicted_pooled = 0
+        self._evicted_sessions = 0
+        self._capacity_rejections = 0
+        # Time spent reserving capacity, including waits for room on a full host
+        self.capacity_wait = Histogram()
+
+        # Warm pool. Each pooled container mounts its own slot directory under .pool/;
+        # claiming it renames that directory to the session's directory, which the bind
+        # mount follows, so the container is bound to the session without a restart.
+        self._pool_size = config.MARIMO_POOL_SIZE
+        self._pool_high_water = config.MARIMO_POOL_HIGH_WATER or (self._port_end - self._port_start)
+        self._pool: deque[PooledContainer] = deque()
+        self._pool_starting = 0
+        self._pool_dir = self._data_dir / ".pool"
+        self._pool_host_dir = self._host_dir / ".pool"
+        self._pool_wakeup = asyncio.Event()
+        self._pool_task: asyncio.Task | None = None
+        self._pool_hits = 0
+        self._pool_misses = 0
 
     # -- lifecycle --
 
     async def startup(self) -> None:
-        self._cleanup_task = asyncio.create_task(self._cleanup_loop())
+        await self._detect_capacity()
+        await self._rehydrate()
+        self._reaper_task = asyncio.create_task(self._reaper_loop())
+        if self._pool_size > 0:
+            self._pool_task = asyncio.create_task(self._replenish_loop())
 
     async def shutdown(self) -> None:
-        if self._cleanup_task:
-            self._cleanup_task.cancel()
-        for session_id in list(self._containers):
-            await self.destroy(session_id)
+        if self._reaper_task:
+            self._reaper_task.cancel()
+        for task in self._reaping:
+            task.cancel()
+        if self._pool_task:
+            self._pool_task.cancel()
+        for task in list(self._creating.values()):
+            task.cancel()
+        await asyncio.gather(*self._creating.values(), return_exceptions=True)
+        for kernel in self._kernels.values():
+            kernel.close()
+        self._kernels.clear()
+        if not self._keep_on_shutdown:
+            await asyncio.gather(
+                *(self.destroy(session_id) for session_id in list(self._containers)),
+                *(self._discard_pooled(slot) for slot in self._pool),
+                *(self._stop_container(container_id) for container_id in self._orphans),
+                return_exceptions=True,
+            )
+            self._pool.clear()
+        self._docker.close()
 
     # -- public API --
 
-    async def get_or_create(self, session_id: str) -> ContainerInfo:
-        if session_id in self._containers:
-            self._containers[session_id].touch()
-            return self._containers[session_id]
+    async def get_or_create(self, session_id: str, profile: str | None = None) -> ContainerInfo:
+        """The session's sandbox, started with the named resource profile if it isn't running.
 
-        user_dir = self._data_dir / session_id
-        user_dir.mkdir(parents=True, exist_ok=True)
+        Raises SandboxCapacityError if the host has no room for it in time.
+        """
+        info = self._containers.get(session_id)
+        if info is not None:
+            info.touch()
+            return info
 
-        # Seed with template notebooks if user dir is empty
-        if not any(user_dir.iterdir()) and self._seed_dir.exists():
-            for nb in self._seed_dir.glob("*.py"):
-                shutil.copy2(nb, user_dir / nb.name)
+        task = self._creating.get(session_id)
+        if task is None:
+            task = asyncio.create_task(self._create(session_id, self.profile(profile)))
+            self._creating[session_id] = task
+            task.add_done_callback(lambda _: self._creating.pop(session_id, None))
+        # Shield so one cancelled caller doesn't abort the creation others are awaiting
+        return await asyncio.shield(task)
 
-        port = self._allocate_port()
-        container = self._client.containers.run(
-            self._image,
-            detach=True,
-            ports={"2718/tcp": port},
-            volumes={
-                str((self._host_dir / session_id).resolve()): {"bind": "/notebooks", "mode": "rw"},
-            },
-            labels={"kitsune.session": session_id},
-            name=f"kitsune-marimo-{session_id}",
-            extra_hosts={"host.docker.internal": "host-gateway"},
-            remove=True,
-        )
+    async def destroy(self, session_id: str) -> None:
+        async with self._session_locks.hold(session_id):
+            info = self._containers.get(session_id)
+            if info is not None:
+                await self._teardown(info)
 
-        if not container or not container.id:
-            raise RuntimeError("Failed to create sandbox container")
+    def profile(self, name: str | None = None) -> ResourceProfile:
+        if name is None:
+            return self._default_profile
+        try:
+            return self._profiles[name]
+        except KeyError:
+            raise ValueError(f"Unknown sandbox profile {name!r}") from None
+
+    def session_ids(self) -> list[str]:
+        return list(self._containers)
 
-        info = ContainerInfo(
-            container_id=container.id,
-            session_id=session_id,
-            host_port=port,
+    def has_session(self, session_id: str) -> bool:
+        return session_id in self._containers or session_id in self._creating
+
+    def load(self) -> float:
+        """Fraction of this node in use: the fullest of its CPUs, memory and ports.
+
+        Containers still being created count as default-profile ones, so sessions
+        placed in a burst see each other before their capacity is reserved.
+        """
+        creating = len(self._creating)
+        cpus = self._used_cpus + creating * self._default_profile.cpus
+        memory_mb = self._used_memory_mb + creating * self._default_profile.memory_mb
+        return max(
+            cpus / self._capacity_cpus if self._capacity_cpus else 1.0,
+            memory_mb / self._capacity_memory_mb if self._capacity_memory_mb else 1.0,
+            (len(self._reserved_ports) + creating) / (self._port_end - self._port_start),
         )
-        self._containers[session_id] = info
-        await self._wait_until_ready(port, timeout=30)
-        return info
 
-    async def destroy(self, session_id: str) -> None:
-        info = self._containers.pop(session_id, None)
-        if info is None:
-            return
-        try:
-            container = self._client.containers.get(info.container_id)
-            container.stop(timeout=5)
-        except NotFound:
-            pass
+    def warm(self) -> int:
+        """Pooled containers not already spoken for by a creation in progress."""
+        return max(0, len(self._pool) - len(self._creating))
 
     def get_info(self, session_id: str) -> ContainerInfo | None:
         info = self._containers.get(session_id)
@@ -120,82 +425,766 @@ class SandboxManager:
                 {
                     "session_id": info.session_id,
                     "host_port": info.host_port,
+                    "profile": info.profile.name,
                     "idle_seconds": int(now - info.last_activity),
                 }
                 for info in self._containers.values()
             ],
+            "capacity": {
+                "cpus": self._capacity_cpus,
+                "memory_mb": self._capacity_memory_mb,
+                "allocated_cpus": round(self._used_cpus, 2),
+                "allocated_memory_mb": self._used_memory_mb,
+                "cpu_utilization": round(self._used_cpus / self._capacity_cpus, 3) if self._capacity_cpus else None,
+                "memory_utilization": (
+                    round(self._used_memory_mb / self._capacity_memory_mb, 3) if self._capacity_memory_mb else None
+                ),
+                "waiting": self._capacity_waiting,
+                "evicted_pooled": self._evicted_pooled,
+                "evicted_sessions": self._evicted_sessions,
+                "rejected": self._capacity_rejections,
+                "profiles": {
+                    name: {"cpus": p.cpus, "memory_mb": p.memory_mb, "pids": p.pids}
+                    for name, p in self._profiles.items()
+                },
+            },
+            "pool": {
+                "target": self._pool_size,
+                "high_water": self._pool_high_water,
+                "idle": len(self._pool),
+                "starting": self._pool_starting,
+                "hits": self._pool_hits,
+                "misses": self._pool_misses,
+            },
+            "reaper": {
+                "idle_timeout": self._idle_timeout,
+                "next_expiry_seconds": round(self._expiries[0][0] - now, 1) if self._expiries else None,
+                "reaped": self._reaped,
+                "kept_alive": self._kept_alive,
+                "reaping": len(self._reaping),
+                "orphans": len(self._orphans),
+                "idle_container_seconds": round(self._idle_seconds),
+                "reap_delay": self.reap_delay.snapshot(),
+            },
+            "run_cache": self.run_cache.stats(),
         }
 
+    def metrics(self) -> list[Metric]:
+        """This daemon's sandbox metrics. The run cache is shared across nodes and left out."""
+        ports = self._port_end - self._port_start
+        return [
+            gauge("kitsune_sandbox_containers", "Session containers running", len(self._containers)),
+            gauge("kitsune_sandbox_creating", "Session containers being created", len(self._creating)),
+            histogram(
+                "kitsune_sandbox_start_seconds", "Time until a session container serves",
+                self.start_time["pool"], source="pool",
+            ),
+            histogram(
+                "kitsune_sandbox_start_seconds", "Time until a session container serves",
+                self.start_time["cold"], source="cold",
+            ),
+            histogram("kitsune_sandbox_exec_seconds", "Command run time in containers", self.exec_time),
+            counter("kitsune_sandbox_exec_timeouts_total", "Commands killed at their timeout", self._exec_timeouts),
+            counter("kitsune_sandbox_exec_failures_total", "Commands that exited non-zero", self._exec_failures),
+            histogram("kitsune_sandbox_kernel_run_seconds", "Notebook kernel run time", self.kernel_run_time),
+            counter(
+                "kitsune_sandbox_kernel_restarts_total", "Kernels killed after a timeout or crash",
+                self._kernel_restarts,
+            ),
+            gauge("kitsune_sandbox_ports_in_use", "Host ports reserved for containers", len(self._reserved_ports)),
+            gauge("kitsune_sandbox_ports_total", "Host ports in the sandbox range", ports),
+            counter(
+                "kitsune_sandbox_ports_exhausted_total", "Container starts that found no free port",
+                self._ports_exhausted,
+            ),
+            gauge("kitsune_sandbox_pool_idle", "Warm containers ready to claim", len(self._pool)),
+            gauge("kitsune_sandbox_pool_starting", "Warm containers starting", self._pool_starting),
+            counter("kitsune_sandbox_pool_hits_total", "Sessions given a warm container", self._pool_hits),
+            counter("kitsune_sandbox_pool_misses_total", "Sessions that found the pool empty", self._pool_misses),
+            gauge("kitsune_sandbox_capacity_cpus", "CPUs available to sandboxes", self._capacity_cpus),
+            gauge("kitsune_sandbox_allocated_cpus", "CPUs held by containers", self._used_cpus),
+            gauge("kitsune_sandbox_capacity_memory_mb", "Memory available to sandboxes", self._capacity_memory_mb),
+            gauge("kitsune_sandbox_allocated_memory_mb", "Memory held by containers", self._used_memory_mb),
+            gauge("kitsune_sandbox_capacity_waiting", "Creations waiting for capacity", self._capacity_waiting),
+            histogram("kitsune_sandbox_capacity_wait_seconds", "Time to reserve capacity", self.capacity_wait),
+            counter(
+                "kitsune_sandbox_capacity_rejections_total", "Creations refused for lack of capacity",
+                self._capacity_rejections,
+            ),
+            counter(
+                "kitsune_sandbox_evictions_total", "Containers stopped to make room",
+                self._evicted_pooled, container="pooled",
+            ),
+            counter(
+                "kitsune_sandbox_evictions_total", "Containers stopped to make room",
+                self._evicted_sessions, container="session",
+            ),
+            counter("kitsune_sandbox_reaped_total", "Idle containers stopped", self._reaped),
+            counter("kitsune_sandbox_kept_alive_total", "Idle containers kept for open connections", self._kept_alive),
+            counter(
+                "kitsune_sandbox_idle_container_seconds_total", "Time reaped containers sat idle", self._idle_seconds,
+            ),
+            histogram("kitsune_sandbox_reap_delay_seconds", "Delay between idle expiry and stop", self.reap_delay),
+            gauge("kitsune_sandbox_orphans", "Untracked containers that failed to stop", len(self._orphans)),
+        ]
+
     def get_user_dir(self, session_id: str) -> Path:
         return self._data_dir / session_id
 
-    async def exec_in_container(self, session_id: str, command: list[str]) -> str:
-        """Run a command inside the user's container, return stdout."""
-        info = self._containers.get(session_id)
-        if info is None:
-            raise RuntimeError(f"No container for session {session_id}")
-        info.touch()
-        container = self._client.containers.get(info.container_id)
-        exit_code, output = container.exec_run(command)
-        text = output.decode("utf-8", errors="replace")
+    async def exec_in_container(
+        self,
+        session_id: str,
+        command: list[str],
+        timeout: int | None = None,
+        on_output: Callable[[str], None] | None = None,
+    ) -> str:
+        """Run a command inside the user's container, return stdout.
+
+        Output is streamed to on_output as it arrives and the returned text keeps
+        only the head and tail of it, up to SANDBOX_EXEC_MAX_BYTES. The process is
+        killed after timeout seconds (SANDBOX_EXEC_TIMEOUT by default).
+        """
+        timeout = timeout or self._exec_timeout
+        output = BoundedOutput(self._exec_max_bytes)
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+        def on_chunk(chunk: bytes) -> None:
+            # Stop forwarding progress once it would exceed what the caller gets back
+            forward = on_output is not None and output.total < self._exec_max_bytes
+            output.write(chunk)
+            if forward:
+                on_output(decoder.decode(chunk))
+
+        async with self._session_locks.hold(session_id):
+            info = self._containers.get(session_id)
+            if info is None:
+                raise RuntimeError(f"No container for session {session_id}")
+            info.touch()
+            container = await self._docker.get(info.container_id)
+            start = time.monotonic()
+            exit_code = await self._docker.exec_stream(
+                container,
+                ["timeout", "-s", "KILL", str(timeout), *command],
+                on_chunk,
+            )
+            elapsed = time.monotonic() - start
+        self.exec_time.observe(elapsed)
+        text = output.text()
+        if exit_code == 137 and elapsed >= timeout:
+            self._exec_timeouts += 1
+            raise TimeoutError(f"Command killed after {timeout}s: {text}")
         if exit_code != 0:
+            self._exec_failures += 1
             raise RuntimeError(f"Command exited {exit_code}: {text}")
         return text
 
+    async def run_in_kernel(
+        self,
+        session_id: str,
+        notebook: str,
+        cells: list[dict],
+        timeout: int | None = None,
+        on_event: Callable[[dict], None] | None = None,
+        inputs: str | None = None,
+    ) -> dict:
+        """Run notebook cells in the session's persistent kernel, starting it if needed.
+
+        Only cells whose code or upstream dependencies changed since the last run
+        are re-executed, or every cell if `inputs` (the run cache's data digest of the
+        session directory) changed. Each cell's result is passed to on_event as it finishes.
+        A kernel that dies or exceeds timeout seconds is killed and restarted on
+        the next call.
+        """
+        timeout = timeout or self._exec_timeout
+        async with self._session_locks.hold(session_id):
+            info = self._containers.get(session_id)
+            if info is None:
+                raise RuntimeError(f"No container for session {session_id}")
+            info.touch()
+            kernel = self._kernels.get(session_id)
+            if kernel is None:
+                kernel = KernelSession(self._docker, info.container_id)
+                try:
+                    await kernel.start()
+                except BaseException:
+                    kernel.close()
+                    raise
+                self._kernels[session_id] = kernel
+            start = time.monotonic()
+            try:
+                result = await asyncio.wait_for(
+                    kernel.run(notebook, cells, self._cell_output_max_bytes, on_event, inputs),
+                    timeout,
+                )
+            except TimeoutError:
+                self._kernel_restarts += 1
+                self._kernels.pop(session_id, None)
+                await kernel.kill()
+                raise TimeoutError(f"Notebook run exceeded {timeout}s; kernel was restarted") from None
+            except KernelError:
+                self._kernel_restarts += 1
+                kernel.close()
+                self._kernels.pop(session_id, None)
+                raise
+            self.kernel_run_time.observe(time.monotonic() - start)
+            return result
+
     # -- internal --
 
-    async def _wait_until_ready(self, host_port: int, timeout: int = 30) -> None:
-        """Poll the marimo container until it is accepting connections."""
-        import httpx
+    async def _create(self, session_id: str, profile: ResourceProfile) -> ContainerInfo:
+        async with self._session_locks.hold(session_id):
+            info = self._containers.get(session_id)
+            if info is not None:
+                return info
+
+            start = time.monotonic()
+            info = await self._claim_pooled(session_id, profile)
+            if info is not None:
+                self.start_time["pool"].observe(time.monotonic() - start)
+                self._pool_hits += 1
+                self._register(info)
+                self._pool_wakeup.set()
+                return info
 
-        url = f"http://localhost:{host_port}/api/status"
-        async with httpx.AsyncClient() as client:
-            deadline = time.time() + timeout
-            while time.time() < deadline:
+            if self._pool_size > 0:
+                self._pool_misses += 1
+                self._pool_wakeup.set()
+
+            user_dir = self._data_dir / session_id
+            user_dir.mkdir(parents=True, exist_ok=True)
+            self._seed(user_dir)
+
+            waited = time.monotonic()
+            await self._acquire_capacity(profile)
+            start = time.monotonic()
+            self.capacity_wait.observe(start - waited)
+            port = None
+            container_id = None
+            try:
+                port = self._allocate_port()
+                container = await self._run_container(
+                    name=f"{_NAME_PREFIX}{session_id}",
+                    port=port,
+                    mount=self._host_dir / session_id,
+                    labels={"kitsune.session": session_id},
+                    profile=profile,
+                )
+                container_id = container.id
+                await self._wait_until_ready(port, timeout=30)
+            except BaseException:
                 try:
-                    resp = await client.get(url, timeout=2)
-                    if resp.status_code < 500:
-                        return
-                except httpx.TransportError:
-                    pass
-                await asyncio.sleep(0.5)
+                    if container_id is not None:
+                        await self._stop_or_orphan(container_id)
+                finally:
+                    self._reserved_ports.discard(port)
+                    self._release_capacity(profile)
+                raise
+
+            info = ContainerInfo(
+                container_id=container_id,
+                session_id=session_id,
+                host_port=port,
+                profile=profile,
+                host=self.host,
+            )
+            self.start_time["cold"].observe(time.monotonic() - start)
+            self._register(info)
+            return info
+
+    def _register(self, info: ContainerInfo) -> None:
+        self._containers[info.session_id] = info
+        heapq.heappush(self._expiries, (info.last_activity + self._idle_timeout, info.container_id, info.session_id))
+        self._reaper_wakeup.set()
+
+    async def _teardown(self, info: ContainerInfo) -> None:
+        """Stop a session's container and free its port. Callers hold the session lock."""
+        del self._containers[info.session_id]
+        kernel = self._kernels.pop(info.session_id, None)
+        if kernel is not None:
+            kernel.close()
+        try:
+            await self._stop_or_orphan(info.container_id)
+        finally:
+            self._reserved_ports.discard(info.host_port)
+            self._release_capacity(info.profile)
+
+    async def _stop_or_orphan(self, container_id: str) -> None:
+        """Stop a container that is no longer tracked, leaving it to the reaper if that fails."""
+        try:
+            await self._stop_container(container_id)
+        except BaseException as e:
+            self._orphans.add(container_id)
+            self._reaper_wakeup.set()
+            logger.warning(f"Failed to stop container {container_id[:12]}, will retry: {e!r}")
+            raise
+
+    async def _stop_container(self, container_id: str) -> None:
+        try:
+            container = await self._docker.get(container_id)
+            await self._docker.stop(container, timeout=5)
+        except NotFound:
+            pass
+
+    async def _run_container(
+        self, name: str, port: int, mount: Path, labels: dict[str, str], profile: ResourceProfile,
+    ):
+        container = await self._docker.run(
+            self._image,
+            detach=True,
+            ports={f"{_MARIMO_PORT}/tcp": port},
+            volumes={
+                str(mount.resolve()): {"bind": "/notebooks", "mode": "rw"},
+            },
+            # The full spec, so rehydration can tell a container started under other limits
+            labels={**labels, "kitsune.profile": profile.spec},
+            name=name,
+            extra_hosts={"host.docker.internal": "host-gateway"},
+            remove=True,
+            **profile.run_kwargs(),
+        )
+        if not container or not container.id:
+            raise RuntimeError("Failed to create sandbox container")
+        return container
+
+    def _seed(self, user_dir: Path) -> None:
+        """Seed with template notebooks if user dir is empty."""
+        if not any(user_dir.iterdir()) and self._seed_dir.exists():
+            for nb in self._seed_dir.glob("*.py"):
+                shutil.copy2(nb, user_dir / nb.name)
+
+    async def _wait_until_ready(self, host_port: int, timeout: int = 30) -> None:
+        """Poll the marimo container until it is accepting connections."""
+        url = f"http://{self.host}:{host_port}/api/status"
+        client = _sandbox_http()
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            try:
+                resp = await client.get(url, timeout=2)
+                if resp.status_code < 500:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.5)
         raise RuntimeError(f"Marimo container not ready after {timeout}s")
 
+    async def _is_healthy(self, host_port: int) -> bool:
+        async with self._probe_limit:
+            try:
+                resp = await _sandbox_http().get(
+                    f"http://{self.host}:{host_port}/api/status", timeout=3,
+                )
+                return resp.status_code < 500
+            except httpx.TransportError:
+                return False
+
     def _allocate_port(self) -> int:
-        used = {info.host_port for info in self._containers.values()}
+        """Reserve a free host port. Callers must discard it from _reserved_ports when done."""
         for port in range(self._port_start, self._port_end):
-            if port not in used:
+            if port not in self._reserved_ports:
+                self._reserved_ports.add(port)
                 return port
+        self._ports_exhausted += 1
         raise RuntimeError("No available ports in sandbox range")
 
-    async def _cleanup_loop(self) -> None:
-        while True:
-            await asyncio.sleep(300)  # every 5 minutes
-            await self._cleanup_stale()
+    # -- rehydration --
+
+    async def _rehydrate(self) -> None:
+        """Adopt the healthy sandbox containers a previous Kitsune process left running.
+
+        Session containers carry the kitsune.session label. Pool containers carry
+        kitsune.pool; one that was claimed has since been renamed to its session's name.
+        Containers that can't be adopted are stopped, and so are pooled ones that weren't
+        started with the current default profile: they could otherwise be claimed as one.
+        """
+        try:
+            found = await asyncio.gather(
+                self._docker.list_containers(sparse=True, filters={"label": "kitsune.session"}),
+                self._docker.list_containers(sparse=True, filters={"label": "kitsune.pool"}),
+            )
+        except APIError as e:
+            logger.warning(f"Could not list existing sandbox containers: {e}")
+            return
 
-    async def _cleanup_stale(self) -> None:
-        import httpx
+        candidates = [self._describe(c) for containers in found for c in containers]
+        healthy = await asyncio.gather(*(self._is_healthy(port) for _, _, _, port, _ in candidates if port))
+        health = iter(healthy)
 
+        reap: list[str] = []
+        retired = 0
         now = time.time()
-        cutoff = now - (self._timeout * 60)
-        stale = [
-            sid for sid, info in self._containers.items()
-            if info.last_activity < cutoff
-        ]
-        for sid in stale:
-            info = self._containers.get(sid)
-            if info is None:
+        for container_id, session_id, pool_id, port, profile_label in candidates:
+            ok = port is not None and next(health)
+            profile = self._started_profile(profile_label)
+            usable = (
+                ok
+                and (session_id or pool_id)
+                and self._port_start <= port < self._port_end
+                and port not in self._reserved_ports
+                and (session_id not in self._containers if session_id else (self._pool_dir / pool_id).is_dir())
+            )
+            if usable and pool_id and profile != self._default_profile:
+                retired += 1
+                usable = False
+            if not usable:
+                reap.append(container_id)
+                if pool_id:
+                    shutil.rmtree(self._pool_dir / pool_id, ignore_errors=True)
+                continue
+            self._reserved_ports.add(port)
+            # Adopted even past capacity: the containers are already running either way.
+            # Sessions keep the limits they were started with, whatever the profile says now.
+            profile = profile or self._profiles.get(profile_label, self._default_profile)
+            self._take_capacity(profile)
+            if session_id:
+                # Restart the idle clock: we don't know when the session was last used
+                self._register(ContainerInfo(
+                    container_id=container_id, session_id=session_id, host_port=port, profile=profile,
+                    host=self.host, last_activity=now,
+                ))
+            else:
+                self._pool.append(PooledContainer(
+                    container_id=container_id, pool_id=pool_id, host_port=port, profile=profile,
+                ))
+
+        await asyncio.gather(*(self._stop_container(cid) for cid in reap), return_exceptions=True)
+        if candidates:
+            logger.info(
+                f"Rehydrated {len(self._containers)} sessions and {len(self._pool)} pooled containers, "
+                f"reaped {len(reap)} ({retired} pooled with an outdated profile)"
+            )
+
+    @staticmethod
+    def _started_profile(label: str | None) -> ResourceProfile | None:
+        """The profile a container was started with, from its kitsune.profile label.
+
+        None if the label is missing or holds only a profile name, as older versions wrote it.
+        """
+        try:
+            return ResourceProfile.parse(label)
+        except (AttributeError, ValueError):
+            return None
+
+    @staticmethod
+    def _describe(container) -> tuple[str, str | None, str | None, int | None, str | None]:
+        """(container id, session id, pool id, host port, profile label) from a sparse container listing."""
+        attrs = container.attrs
+        name = (attrs.get("Names") or [""])[0].lstrip("/")
+        labels = attrs.get("Labels") or {}
+        port = next(
+            (p["PublicPort"] for p in attrs.get("Ports") or []
+             if p.get("PrivatePort") == _MARIMO_PORT and p.get("PublicPort")),
+            None,
+        )
+        session_id = labels.get("kitsune.session")
+        pool_id = labels.get("kitsune.pool")
+        if pool_id and name != f"{_POOL_NAME_PREFIX}{pool_id}" and name.startswith(_NAME_PREFIX):
+            # A claimed pool container: the session is only recorded in its name
+            session_id, pool_id = name.removeprefix(_NAME_PREFIX), None
+        return attrs["Id"], session_id, pool_id, port, labels.get("kitsune.profile")
+
+    # -- host capacity --
+
+    async def _detect_capacity(self) -> None:
+        if self._capacity_cpus and self._capacity_memory_mb:
+            return
+        try:
+            info = await self._docker.info()
+            cpus, memory_mb = info["NCPU"], info["MemTotal"] // 2**20
+        except Exception as e:
+            # Daemon unreachable or old: the local machine is the best guess
+            logger.warning(f"Could not read host resources from Docker, using local ones: {e!r}")
+            cpus = os.cpu_count() or 1
+            memory_mb = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // 2**20
+        self._capacity_cpus = self._capacity_cpus or cpus
+        self._capacity_memory_mb = self._capacity_memory_mb or max(0, memory_mb - self._host_reserved_mb)
+        logger.info(f"Sandbox capacity: {self._capacity_cpus} CPUs, {self._capacity_memory_mb} MB")
+
+    def _room_for(self, profile: ResourceProfile) -> int:
+        """How many more containers with this profile fit on the host."""
+        return max(0, min(
+            math.floor((self._capacity_cpus - self._used_cpus) / profile.cpus + 1e-9),
+            (self._capacity_memory_mb - self._used_memory_mb) // profile.memory_mb,
+        ))
+
+    def _fits(self, profile: ResourceProfile) -> bool:
+        return self._room_for(profile) > 0
+
+    def _take_capacity(self, profile: ResourceProfile) -> None:
+        self._used_cpus += profile.cpus
+        self._used_memory_mb += profile.memory_mb
+
+    def _release_capacity(self, profile: ResourceProfile) -> None:
+        self._used_cpus -= profile.cpus
+        self._used_memory_mb -= profile.memory_mb
+        self._capacity_freed.set()
+        self._pool_wakeup.set()
+
+    async def _acquire_capacity(self, profile: ResourceProfile) -> None:
+        """Reserve room for a container, making room or waiting for it if the host is full."""
+        if profile.cpus > self._capacity_cpus or profile.memory_mb > self._capacity_memory_mb:
+            raise SandboxCapacityError(f"Sandbox profile {profile.name!r} is larger than the host capacity")
+        if self._fits(profile):
+            self._take_capacity(profile)
+            return
+        deadline = time.monotonic() + self._capacity_timeout
+        # Counted as waiting for the whole loop so the pool doesn't refill the room we make
+        self._capacity_waiting += 1
+        try:
+            while not self._fits(profile):
+                retry_in = await self._make_room()
+                if not retry_in:
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._capacity_rejections += 1
+                    raise SandboxCapacityError("No sandbox capacity available, try again shortly")
+                # Woken early when any container is stopped
+                self._capacity_freed.clear()
+                try:
+                    await asyncio.wait_for(self._capacity_freed.wait(), min(remaining, retry_in))
+                except TimeoutError:
+                    pass
+            self._take_capacity(profile)
+        finally:
+            self._capacity_waiting -= 1
+
+    async def _make_room(self) -> float:
+        """Stop one idle container: a pooled one, else the least recently used idle session
+        that nobody has open in the editor.
+
+        Returns 0 if one was stopped, otherwise seconds until a session may become
+        idle long enough to evict (inf if there are none).
+        """
+        if self._pool:
+            await self._discard_pooled(self._pool.pop())
+            self._evicted_pooled += 1
+            return 0
+        now = time.time()
+        for info in sorted(self._containers.values(), key=lambda info: info.last_activity):
+            if self._session_locks.busy(info.session_id):
+                continue  # running a command or kernel; not idle whatever its timestamp says
+            wait = info.last_activity + self._evict_idle - now
+            if wait > 0:
+                return wait
+            if await self._evict(info):
+                return 0
+        # Only busy or connected sessions left; check again shortly
+        return 1.0 if self._containers else math.inf
+
+    async def _evict(self, info: ContainerInfo) -> bool:
+        if await self._has_connections(info.host_port):
+            # Open in the marimo editor, which talks to the container directly: that's activity
+            info.touch()
+            return False
+        async with self._session_locks.hold(info.session_id):
+            if self._containers.get(info.session_id) is not info:
+                return False
+            if time.time() - info.last_activity < self._evict_idle:
+                return False  # used while we waited for the lock
+            await self._teardown(info)
+        self._evicted_sessions += 1
+        logger.info(f"Evicted idle sandbox for session {info.session_id} to make room")
+        return True
+
+    # -- warm pool --
+
+    async def _claim_pooled(self, session_id: str, profile: ResourceProfile) -> ContainerInfo | None:
+        """Bind an idle pooled container running `profile` to session_id, or return None if there is none."""
+        while True:
+            slot = next((slot for slot in self._pool if slot.profile == profile), None)
+            if slot is None:
+                return None
+            self._pool.remove(slot)
+            try:
+                container = await self._docker.get(slot.container_id)
+                await self._docker.rename(container, f"{_NAME_PREFIX}{session_id}")
+            except (NotFound, APIError) as e:
+                logger.warning(f"Discarding pooled container {slot.pool_id}: {e}")
+                await self._discard_pooled(slot)
                 continue
-            # Check if anyone has the notebook open before killing it
+            self._adopt_slot_dir(slot.pool_id, session_id)
+            return ContainerInfo(
+                container_id=slot.container_id,
+                session_id=session_id,
+                host_port=slot.host_port,
+                profile=slot.profile,
+                host=self.host,
+            )
+
+    def _adopt_slot_dir(self, pool_id: str, session_id: str) -> None:
+        """Turn a pool slot directory into the session's notebook directory.
+
+        Existing session files are moved into the slot first, then the slot is renamed
+        into place. The container's bind mount follows the renamed directory. This
+        replaces the session directory, so a DirectoryWatcher already on it restarts
+        on the new one.
+        """
+        slot_dir = self._pool_dir / pool_id
+        user_dir = self._data_dir / session_id
+        if user_dir.exists():
+            for entry in user_dir.iterdir():
+                shutil.move(entry, slot_dir / entry.name)
+            user_dir.rmdir()
+        slot_dir.rename(user_dir)
+        self._seed(user_dir)
+
+    async def _discard_pooled(self, slot: PooledContainer) -> None:
+        try:
+            await self._stop_or_orphan(slot.container_id)
+        finally:
+            self._reserved_ports.discard(slot.host_port)
+            self._release_capacity(slot.profile)
+            shutil.rmtree(self._pool_dir / slot.pool_id, ignore_errors=True)
+
+    async def _start_pooled(self) -> None:
+        profile = self._default_profile
+        if self._capacity_waiting or not self._fits(profile):
+            return  # capacity was taken or claimed since the deficit was computed
+        pool_id = uuid.uuid4().hex[:12]
+        slot_dir = self._pool_dir / pool_id
+        # Raises when the range is full, before anything else is reserved or created
+        port = self._allocate_port()
+        self._take_capacity(profile)
+        self._pool_starting += 1
+        slot = None
+        try:
+            slot_dir.mkdir(parents=True, exist_ok=True)
+            container = await self._run_container(
+                name=f"{_POOL_NAME_PREFIX}{pool_id}",
+                port=port,
+                mount=self._pool_host_dir / pool_id,
+                labels={"kitsune.pool": pool_id},
+                profile=profile,
+            )
+            slot = PooledContainer(container_id=container.id, pool_id=pool_id, host_port=port, profile=profile)
+            await self._wait_until_ready(port, timeout=30)
+            self._pool.append(slot)
+        except BaseException:
+            if slot is not None:
+                await self._discard_pooled(slot)
+            else:
+                self._reserved_ports.discard(port)
+                self._release_capacity(profile)
+                shutil.rmtree(slot_dir, ignore_errors=True)
+            raise
+        finally:
+            self._pool_starting -= 1
+
+    def _pool_deficit(self) -> int:
+        if self._capacity_waiting:
+            return 0  # sessions are waiting for the capacity a warm container would take
+        idle = len(self._pool) + self._pool_starting
+        headroom = self._pool_high_water - len(self._containers) - idle
+        return max(0, min(self._pool_size - idle, headroom, self._room_for(self._default_profile)))
+
+    async def _replenish_loop(self) -> None:
+        backoff = 1.0
+        while True:
+            deficit = self._pool_deficit()
+            if deficit == 0:
+                self._pool_wakeup.clear()
+                await self._pool_wakeup.wait()
+                continue
+            results = await asyncio.gather(
+                *(self._start_pooled() for _ in range(deficit)),
+                return_exceptions=True,
+            )
+            errors = [r for r in results if isinstance(r, Exception)]
+            if errors:
+                logger.warning(f"Pool replenishment failed: {errors[0]}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 60.0)
+            else:
+                backoff = 1.0
+
+    # -- idle reaping --
+
+    async def _reaper_loop(self) -> None:
+        """Sleep until the earliest idle expiry, then reap everything that has expired."""
+        while True:
+            now = time.time()
+            due: list[ContainerInfo] = []
+            while self._expiries and self._expiries[0][0] <= now:
+                _, container_id, session_id = heapq.heappop(self._expiries)
+                info = self._containers.get(session_id)
+                if info is None or info.container_id != container_id:
+                    continue  # destroyed since, or replaced by a newer container with its own entry
+                expiry = info.last_activity + self._idle_timeout
+                if expiry > now:
+                    heapq.heappush(self._expiries, (expiry, container_id, session_id))
+                else:
+                    due.append(info)
+            if due:
+                # Reap in the background so slow probes or stops don't delay later expiries
+                task = asyncio.create_task(self._reap(due))
+                self._reaping.add(task)
+                task.add_done_callback(self._reaping.discard)
+            if self._orphans and (self._orphan_task is None or self._orphan_task.done()):
+                self._orphan_task = asyncio.create_task(self._stop_orphans())
+                self._reaping.add(self._orphan_task)
+                self._orphan_task.add_done_callback(self._reaping.discard)
+
+            # New sessions set the event so the sleep is re-armed for their expiry
+            self._reaper_wakeup.clear()
+            delay = self._expiries[0][0] - time.time() if self._expiries else None
+            if self._orphans:
+                delay = _ORPHAN_RETRY if delay is None else min(delay, _ORPHAN_RETRY)
+            try:
+                await asyncio.wait_for(self._reaper_wakeup.wait(), delay)
+            except TimeoutError:
+                pass
+
+    async def _stop_orphans(self) -> None:
+        for container_id in list(self._orphans):
+            try:
+                await self._stop_container(container_id)
+            except Exception as e:
+                logger.warning(f"Still failing to stop container {container_id[:12]}: {e!r}")
+            else:
+                self._orphans.discard(container_id)
+                logger.info(f"Stopped orphaned container {container_id[:12]}")
+
+    async def _reap(self, due: list[ContainerInfo]) -> None:
+        connected = await asyncio.gather(*(self._has_connections(info.host_port) for info in due))
+        kept = [info for info, active in zip(due, connected) if active]
+        for info in kept:
+            # Someone has the notebook open: treat that as activity and check again later
+            info.touch()
+            self._kept_alive += 1
+            heapq.heappush(self._expiries, (info.last_activity + self._idle_timeout, info.container_id, info.session_id))
+        results = await asyncio.gather(
+            *(self._reap_one(info) for info, active in zip(due, connected) if not active),
+            return_exceptions=True,
+        )
+        # Re-pushed entries may be the earliest; re-arm the reaper's sleep for them
+        self._reaper_wakeup.set()
+        errors = [r for r in results if isinstance(r, Exception)]
+        if errors:
+            logger.warning(f"Failed to stop {len(errors)} idle containers: {errors[0]!r}")
+
+    async def _reap_one(self, info: ContainerInfo) -> None:
+        async with self._session_locks.hold(info.session_id):
+            now = time.time()
+            expiry = info.last_activity + self._idle_timeout
+            # Used or destroyed while we were probing or waiting for the lock
+            if self._containers.get(info.session_id) is not info:
+                return
+            if expiry > now:
+                heapq.heappush(self._expiries, (expiry, info.container_id, info.session_id))
+                return
+            await self._teardown(info)
+        self._reaped += 1
+        self._idle_seconds += now - info.last_activity
+        self.reap_delay.observe(now - expiry)
+        logger.info(f"Reaped idle sandbox for session {info.session_id}")
+
+    async def _has_connections(self, host_port: int) -> bool:
+        """Whether anyone has the container's notebook open. Unreachable counts as no."""
+        async with self._probe_limit:
             try:
-                async with httpx.AsyncClient() as client:
-                    resp = await client.get(
-                        f"http://localhost:{info.host_port}/api/status/connections",
-                        timeout=3,
-                    )
-                    if resp.status_code == 200 and resp.json().get("active", 0) > 0:
-                        info.touch()
-                        continue
-            except Exception:
-                pass  # Unreachable container — proceed with cleanup
-            await self.destroy(sid)
+                resp = await _sandbox_http().get(
+                    f"http://{self.host}:{host_port}/api/status/connections", timeout=3,
+                )
+                return resp.status_code == 200 and resp.json().get("active", 0) > 0
+            except (httpx.HTTPError, ValueError):
+                return False
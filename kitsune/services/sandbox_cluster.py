@@ -0,0 +1,180 @@
+"""Spreading sandboxes over several Docker daemons."""
+
+from __future__ import annotations
+
+import asyncio
+from pathlib import Path
+from typing import Callable
+
+import docker
+
+from kitsune.config import get_config
+from kitsune.logging import get_logger
+from kitsune.services.docker_client import AsyncDocker
+from kitsune.services.metrics import Metric, gauge
+from kitsune.services.run_cache import RunCache
+from kitsune.services.sandbox import ContainerInfo, ResourceProfile, SandboxBackend, SandboxManager
+from kitsune.services.sandbox_fake import FakeSandbox
+
+logger = get_logger("sandbox")
+
+
+class SandboxCluster:
+    """Sandboxes spread over several Docker daemons, one SandboxManager per node.
+
+    A new session goes to the least loaded node, preferring one with a warm container
+    for the default profile. Every later call for the session goes to that node for as
+    long as its container runs. Notebook files live on storage shared by all nodes, so
+    a session whose container was stopped may be placed on any node next time. Nodes
+    that fail to start are left out of placement.
+    """
+
+    def __init__(self, nodes: list[SandboxManager]) -> None:
+        self._nodes = nodes
+        self._routes: dict[str, SandboxManager] = {}
+        self._down: set[str] = set()
+        # Nodes share one run cache: results depend on the notebook files, not the node
+        self.run_cache = nodes[0].run_cache
+
+    # -- lifecycle --
+
+    async def startup(self) -> None:
+        results = await asyncio.gather(*(node.startup() for node in self._nodes), return_exceptions=True)
+        for node, result in zip(self._nodes, results):
+            if isinstance(result, Exception):
+                logger.error(f"Sandbox node {node.host} is unavailable: {result!r}")
+                self._down.add(node.host)
+                continue
+            for session_id in node.session_ids():
+                self._routes.setdefault(session_id, node)
+        if len(self._down) == len(self._nodes):
+            raise RuntimeError("No sandbox node is available")
+
+    async def shutdown(self) -> None:
+        await asyncio.gather(*(node.shutdown() for node in self._nodes), return_exceptions=True)
+
+    # -- public API --
+
+    async def get_or_create(self, session_id: str, profile: str | None = None) -> ContainerInfo:
+        node = self._node(session_id)
+        if node is None:
+            self.profile(profile)  # unknown profiles fail before a node is picked
+            node = self._place(profile)
+            self._routes[session_id] = node
+        try:
+            return await node.get_or_create(session_id, profile)
+        finally:
+            if not node.has_session(session_id) and self._routes.get(session_id) is node:
+                del self._routes[session_id]
+
+    async def destroy(self, session_id: str) -> None:
+        node = self._routes.pop(session_id, None)
+        if node is not None:
+            await node.destroy(session_id)
+
+    def profile(self, name: str | None = None) -> ResourceProfile:
+        return self._nodes[0].profile(name)
+
+    def get_info(self, session_id: str) -> ContainerInfo | None:
+        node = self._node(session_id)
+        return node.get_info(session_id) if node else None
+
+    def status(self) -> dict:
+        return {
+            "containers": sum(len(node.session_ids()) for node in self._nodes),
+            "nodes": {
+                node.host: {
+                    "up": node.host not in self._down,
+                    "load": round(node.load(), 3),
+                    **node.status(),
+                }
+                for node in self._nodes
+            },
+        }
+
+    def metrics(self) -> list[Metric]:
+        result = []
+        for node in self._nodes:
+            up = node.host not in self._down
+            result.append(gauge("kitsune_sandbox_node_up", "Whether the node takes sessions", up, node=node.host))
+            result.append(gauge("kitsune_sandbox_node_load", "Busiest resource fraction", node.load(), node=node.host))
+            for metric in node.metrics():
+                metric.labels["node"] = node.host
+                result.append(metric)
+        return result
+
+    def get_user_dir(self, session_id: str) -> Path:
+        return self._nodes[0].get_user_dir(session_id)
+
+    async def exec_in_container(
+        self,
+        session_id: str,
+        command: list[str],
+        timeout: int | None = None,
+        on_output: Callable[[str], None] | None = None,
+    ) -> str:
+        return await self._require(session_id).exec_in_container(session_id, command, timeout, on_output)
+
+    async def run_in_kernel(
+        self,
+        session_id: str,
+        notebook: str,
+        cells: list[dict],
+        timeout: int | None = None,
+        on_event: Callable[[dict], None] | None = None,
+        inputs: str | None = None,
+    ) -> dict:
+        return await self._require(session_id).run_in_kernel(
+            session_id, notebook, cells, timeout, on_event, inputs,
+        )
+
+    # -- internal --
+
+    def _node(self, session_id: str) -> SandboxManager | None:
+        """The node running the session's container, if it has one."""
+        node = self._routes.get(session_id)
+        if node is not None and not node.has_session(session_id):
+            # Stopped since (idle, evicted or destroyed on the node); place it afresh next time
+            del self._routes[session_id]
+            return None
+        return node
+
+    def _require(self, session_id: str) -> SandboxManager:
+        node = self._node(session_id)
+        if node is None:
+            raise RuntimeError(f"No container for session {session_id}")
+        return node
+
+    def _place(self, profile: str | None) -> SandboxManager:
+        # Drop routes of sessions whose containers have gone, so the table tracks live sessions
+        for session_id in [s for s, node in self._routes.items() if not node.has_session(s)]:
+            del self._routes[session_id]
+
+        def key(node: SandboxManager) -> tuple[bool, bool, float]:
+            # A warm container is already accounted for, so even a full node can take the session
+            warm = profile in (None, "default") and node.warm() > 0
+            load = node.load()
+            return load >= 1 and not warm, not warm, load
+
+        up = [node for node in self._nodes if node.host not in self._down]
+        return min(up, key=key)
+
+
+def create_sandbox() -> SandboxBackend:
+    """The sandbox backend SANDBOX_BACKEND and SANDBOX_NODES call for.
+
+    The fake backend when asked for, else a SandboxManager on the local daemon or a
+    cluster over SANDBOX_NODES.
+    """
+    config = get_config()
+    if config.SANDBOX_BACKEND == "fake":
+        return FakeSandbox(config.SANDBOX_FAKE_START_LATENCY, config.SANDBOX_FAKE_EXEC_LATENCY)
+    if not config.SANDBOX_NODES:
+        return SandboxManager()
+    run_cache = RunCache()
+    nodes = []
+    for entry in config.SANDBOX_NODES:
+        host, _, url = entry.partition("=")
+        client = docker.DockerClient(base_url=url)
+        nodes.append(SandboxManager(AsyncDocker(client), host=host, run_cache=run_cache))
+    return SandboxCluster(nodes)
@@ -0,0 +1,169 @@
+"""In-process stand-in for the Docker sandbox, for load tests and working without Docker."""
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+import time
+from pathlib import Path
+from typing import Callable
+
+from kitsune.config import get_config
+from kitsune.services.metrics import Metric, counter, gauge
+from kitsune.services.run_cache import RunCache
+from kitsune.services.sandbox import ContainerInfo, ResourceProfile, load_profiles
+
+
+class FakeSandbox:
+    """A SandboxBackend that starts no containers.
+
+    Creating a sandbox takes `start_latency` seconds and each command or notebook cell
+    `exec_latency` seconds. Commands only echo what they would have run and every cell
+    succeeds. Notebook files are real files under NOTEBOOK_DATA_DIR, so listing and
+    watching notebooks behave as usual. The returned URLs point at nothing.
+    """
+
+    def __init__(self, start_latency: float, exec_latency: float) -> None:
+        config = get_config()
+        self._start_latency = start_latency
+        self._exec_latency = exec_latency
+        self._data_dir = Path(config.NOTEBOOK_DATA_DIR)
+        self._profiles = load_profiles()
+        self._ports = itertools.count(config.MARIMO_PORT_START)
+        self._containers: dict[str, ContainerInfo] = {}
+        self._creating: dict[str, asyncio.Task[ContainerInfo]] = {}
+        self._counters = {"created": 0, "execs": 0, "cells": 0}
+        self.run_cache = RunCache()
+
+    async def startup(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        for task in self._creating.values():
+            task.cancel()
+
+    async def get_or_create(self, session_id: str, profile: str | None = None) -> ContainerInfo:
+        info = self._containers.get(session_id)
+        if info is not None:
+            info.touch()
+            return info
+        task = self._creating.get(session_id)
+        if task is None:
+            task = asyncio.create_task(self._create(session_id, self.profile(profile)))
+            self._creating[session_id] = task
+            task.add_done_callback(lambda _: self._creating.pop(session_id, None))
+        return await asyncio.shield(task)
+
+    async def destroy(self, session_id: str) -> None:
+        self._containers.pop(session_id, None)
+
+    def profile(self, name: str | None = None) -> ResourceProfile:
+        try:
+            return self._profiles[name or "default"]
+        except KeyError:
+            raise ValueError(f"Unknown sandbox profile {name!r}") from None
+
+    def get_info(self, session_id: str) -> ContainerInfo | None:
+        info = self._containers.get(session_id)
+        if info:
+            info.touch()
+        return info
+
+    def status(self) -> dict:
+        now = time.time()
+        return {
+            "backend": "fake",
+            "containers": len(self._containers),
+            "creating": len(self._creating),
+            "sessions": [
+                {
+                    "session_id": info.session_id,
+                    "host_port": info.host_port,
+                    "profile": info.profile.name,
+                    "idle_seconds": int(now - info.last_activity),
+                }
+                for info in self._containers.values()
+            ],
+            **self._counters,
+            "run_cache": self.run_cache.stats(),
+        }
+
+    def metrics(self) -> list[Metric]:
+        return [
+            gauge("kitsune_sandbox_containers", "Session containers running", len(self._containers)),
+            gauge("kitsune_sandbox_creating", "Session containers being created", len(self._creating)),
+            counter("kitsune_sandbox_fake_created_total", "Fake sandboxes created", self._counters["created"]),
+            counter("kitsune_sandbox_fake_execs_total", "Fake commands run", self._counters["execs"]),
+            counter("kitsune_sandbox_fake_cells_total", "Fake notebook cells run", self._counters["cells"]),
+        ]
+
+    def get_user_dir(self, session_id: str) -> Path:
+        return self._data_dir / session_id
+
+    async def exec_in_container(
+        self,
+        session_id: str,
+        command: list[str],
+        timeout: int | None = None,
+        on_output: Callable[[str], None] | None = None,
+    ) -> str:
+        self._require(session_id).touch()
+        await asyncio.sleep(self._exec_latency)
+        self._counters["execs"] += 1
+        output = f"[fake sandbox] {' '.join(command)}\n"
+        if on_output is not None:
+            on_output(output)
+        return output
+
+    async def run_in_kernel(
+        self,
+        session_id: str,
+        notebook: str,
+        cells: list[dict],
+        timeout: int | None = None,
+        on_event: Callable[[dict], None] | None = None,
+        inputs: str | None = None,
+    ) -> dict:
+        """Run every cell, each taking exec_latency, in the shape KernelSession.run returns."""
+        self._require(session_id).touch()
+        results = []
+        for index, cell in enumerate(cells):
+            start = time.perf_counter()
+            await asyncio.sleep(self._exec_latency)
+            result = {
+                "name": cell.get("name"),
+                "status": "ok",
+                "stdout": "",
+                "output": None,
+                "duration_ms": round((time.perf_counter() - start) * 1000, 2),
+            }
+            results.append(result)
+            if on_event is not None:
+                on_event({"event": "cell", "index": index, **result})
+        self._counters["cells"] += len(cells)
+        return {
+            "cells": results,
+            "executed": len(cells),
+            "duration_ms": round(sum(r["duration_ms"] for r in results), 2),
+        }
+
+    # -- internal --
+
+    async def _create(self, session_id: str, profile: ResourceProfile) -> ContainerInfo:
+        self.get_user_dir(session_id).mkdir(parents=True, exist_ok=True)
+        await asyncio.sleep(self._start_latency)
+        info = ContainerInfo(
+            container_id=f"fake-{session_id}",
+            session_id=session_id,
+            host_port=next(self._ports),
+            profile=profile,
+        )
+        self._containers[session_id] = info
+        self._counters["created"] += 1
+        return info
+
+    def _require(self, session_id: str) -> ContainerInfo:
+        info = self._containers.get(session_id)
+        if info is None:
+            raise RuntimeError(f"No container for session {session_id}")
+        return info
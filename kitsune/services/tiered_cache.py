@@ -0,0 +1,167 @@
+"""Two-tier (memory + SQLite) TTL cache with stale-while-revalidate and request coalescing."""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+
+from kitsune.logging import get_logger
+from kitsune.services.metrics import Metric, counter, gauge
+
+logger = get_logger("cache")
+
+Fetch = Callable[[], Awaitable[dict[str, Any]]]
+
+
+@dataclass
+class _Entry:
+    value: dict[str, Any]
+    expires_at: float
+    stale_until: float
+
+
+class TieredCache:
+    """Caches JSON results in an in-memory LRU backed by a SQLite file.
+
+    A fresh entry is returned as-is. An entry past its TTL but within the stale
+    window is returned immediately while a background task refreshes it. Concurrent
+    lookups of the same missing key share one fetch.
+    """
+
+    def __init__(self, path: Path, memory_entries: int, stale_ttl: float) -> None:
+        self._path = path
+        self._memory_entries = memory_entries
+        self._stale_ttl = stale_ttl
+        self._memory: OrderedDict[str, _Entry] = OrderedDict()
+        self._inflight: dict[str, asyncio.Task[dict[str, Any]]] = {}
+        self._db: sqlite3.Connection | None = None
+        self._db_lock = threading.Lock()
+        self._counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "refresh_errors": 0,
+        }
+
+    async def get_or_fetch(self, key: str, ttl: float, fetch: Fetch) -> dict[str, Any]:
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry is not None:
+            self._memory.move_to_end(key)
+            tier = "memory_hits"
+        else:
+            entry = await asyncio.to_thread(self._db_get, key)
+            if entry is not None:
+                self._remember(key, entry)
+            tier = "disk_hits"
+
+        if entry is not None and now < entry.expires_at:
+            self._counters[tier] += 1
+            return entry.value
+        if entry is not None and now < entry.stale_until:
+            self._counters["stale_hits"] += 1
+            if key not in self._inflight:
+                self._start_fetch(key, ttl, fetch).add_done_callback(self._log_refresh_error)
+            return entry.value
+
+        if key in self._inflight:
+            self._counters["coalesced"] += 1
+            task = self._inflight[key]
+        else:
+            self._counters["misses"] += 1
+            task = self._start_fetch(key, ttl, fetch)
+        # Shield so one cancelled caller doesn't fail the others sharing the fetch
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict[str, Any]:
+        lookups = sum(self._counters[k] for k in ("memory_hits", "disk_hits", "stale_hits", "misses", "coalesced"))
+        hits = lookups - self._counters["misses"]
+        return {
+            **self._counters,
+            "memory_entries": len(self._memory),
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+        }
+
+    def metrics(self, prefix: str) -> list[Metric]:
+        result = [
+            counter(f"{prefix}_lookups_total", "Cache lookups by outcome", self._counters[outcome], outcome=outcome)
+            for outcome in ("memory_hits", "disk_hits", "stale_hits", "misses", "coalesced")
+        ]
+        result.append(
+            counter(f"{prefix}_refresh_errors_total", "Failed background refreshes", self._counters["refresh_errors"]),
+        )
+        result.append(gauge(f"{prefix}_memory_entries", "Entries in the memory tier", len(self._memory)))
+        return result
+
+    def close(self) -> None:
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    # -- internal --
+
+    def _start_fetch(self, key: str, ttl: float, fetch: Fetch) -> asyncio.Task[dict[str, Any]]:
+        async def run() -> dict[str, Any]:
+            value = await fetch()
+            now = time.time()
+            entry = _Entry(value=value, expires_at=now + ttl, stale_until=now + ttl + self._stale_ttl)
+            self._remember(key, entry)
+            await asyncio.to_thread(self._db_put, key, entry)
+            return value
+
+        task = asyncio.create_task(run())
+        self._inflight[key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return task
+
+    def _log_refresh_error(self, task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            self._counters["refresh_errors"] += 1
+            logger.warning(f"Background cache refresh failed: {task.exception()}")
+
+    def _remember(self, key: str, entry: _Entry) -> None:
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self._memory_entries:
+            self._memory.popitem(last=False)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(self._path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, stale_until REAL NOT NULL)"
+            )
+        return self._db
+
+    def _db_get(self, key: str) -> _Entry | None:
+        with self._db_lock:
+            row = self._connect().execute(
+                "SELECT value, expires_at, stale_until FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return _Entry(value=json.loads(row[0]), expires_at=row[1], stale_until=row[2])
+
+    def _db_put(self, key: str, entry: _Entry) -> None:
+        with self._db_lock:
+            db = self._connect()
+            db.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at, stale_until) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(entry.value), entry.expires_at, entry.stale_until),
+            )
+            db.execute("DELETE FROM cache WHERE stale_until < ?", (time.time(),))
+            db.commit()
@@ -0,0 +1,177 @@
+"""Deciding which URLs tools may fetch, based on where their hosts actually resolve."""
+
+from __future__ import annotations
+
+import asyncio
+import ipaddress
+import socket
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from urllib.parse import urlsplit
+
+from kitsune.config import get_config
+
+IPAddress = ipaddress.IPv4Address | ipaddress.IPv6Address
+IPNetwork = ipaddress.IPv4Network | ipaddress.IPv6Network
+
+
+# IPv6 prefixes whose last 32 bits are an IPv4 address: NAT64 (RFC 6052) and the
+# deprecated IPv4-compatible form
+_NAT64 = ipaddress.ip_network("64:ff9b::/96")
+_IPV4_COMPATIBLE = ipaddress.ip_network("::/96")
+
+
+class BlockedUrlError(ValueError):
+    pass
+
+
+def _embedded_ipv4(address: IPAddress) -> ipaddress.IPv4Address | None:
+    """The IPv4 address an IPv6 address reaches by mapping, translation or tunnelling."""
+    if not isinstance(address, ipaddress.IPv6Address):
+        return None
+    if address.ipv4_mapped:
+        return address.ipv4_mapped
+    if address in _NAT64 or (address in _IPV4_COMPATIBLE and int(address) > 1):
+        return ipaddress.IPv4Address(int(address) & 0xFFFFFFFF)
+    if address.sixtofour:
+        return address.sixtofour
+    if address.teredo:
+        return address.teredo[1]  # the client's address; the first is the Teredo server's
+    return None
+
+
+def _is_public(address: IPAddress) -> bool:
+    # 64:ff9b::a00:1 and friends reach 10.0.0.1, so judge the embedded IPv4 address
+    address = _embedded_ipv4(address) or address
+    return address.is_global and not address.is_multicast
+
+
+def _parse_rules(entries: tuple[str, ...]) -> tuple[list[IPNetwork], list[str]]:
+    networks, hosts = [], []
+    for entry in entries:
+        try:
+            networks.append(ipaddress.ip_network(entry, strict=False))
+        except ValueError:
+            hosts.append(entry.lower().removeprefix("*."))
+    return networks, hosts
+
+
+def _host_matches(host: str, patterns: list[str]) -> bool:
+    return any(host == p or host.endswith("." + p) for p in patterns)
+
+
+class UrlPolicy:
+    """Allows http(s) URLs whose host resolves only to public addresses.
+
+    Every address a hostname resolves to is checked, so names pointing at private,
+    loopback, link-local or ULA addresses are refused however the URL spells them.
+    IPv6 addresses that embed an IPv4 one (mapped, NAT64, 6to4, Teredo) are judged
+    by the IPv4 address they reach.
+    Resolutions are cached for `ttl` seconds and concurrent lookups of one host share
+    a single resolver call.
+
+    Allow/deny entries are hostnames (matching subdomains too) or CIDR networks. Deny
+    wins over allow; an allowed hostname skips resolution, an allowed network admits
+    addresses in it that would otherwise be refused.
+    """
+
+    def __init__(
+        self,
+        allow: tuple[str, ...] = (),
+        deny: tuple[str, ...] = (),
+        ttl: float = 300,
+        timeout: float = 2,
+        max_entries: int = 4096,
+    ) -> None:
+        self._allow_networks, self._allow_hosts = _parse_rules(allow)
+        self._deny_networks, self._deny_hosts = _parse_rules(deny)
+        self._ttl = ttl
+        self._timeout = timeout
+        self._max_entries = max_entries
+        self._cache: OrderedDict[str, tuple[float, list[IPAddress]]] = OrderedDict()
+        self._inflight: dict[str, asyncio.Task[list[IPAddress]]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def check(self, url: str) -> None:
+        """Raise BlockedUrlError if url may not be fetched."""
+        try:
+            parts = urlsplit(url)
+            host = parts.hostname
+        except ValueError:
+            raise BlockedUrlError(f"Blocked URL: could not parse {url!r}") from None
+        if parts.scheme not in ("http", "https") or not host:
+            raise BlockedUrlError("Blocked URL: only http(s) URLs with a host are allowed")
+        host = host.lower().rstrip(".")
+
+        if _host_matches(host, self._deny_hosts):
+            raise BlockedUrlError(f"Blocked URL: {host} is on the deny list")
+        if _host_matches(host, self._allow_hosts):
+            return
+
+        for address in await self._resolve(host):
+            # Network rules apply to an embedded IPv4 address as well as the address itself
+            forms = [address, *filter(None, [_embedded_ipv4(address)])]
+            if any(form in net for form in forms for net in self._deny_networks):
+                raise BlockedUrlError(f"Blocked URL: {host} resolves to denied address {address}")
+            if not _is_public(address) and not any(form in net for form in forms for net in self._allow_networks):
+                raise BlockedUrlError(f"Blocked URL: {host} resolves to non-public address {address}")
+
+    async def is_allowed(self, url: str) -> bool:
+        try:
+            await self.check(url)
+        except BlockedUrlError:
+            return False
+        return True
+
+    def stats(self) -> dict:
+        return {"entries": len(self._cache), "hits": self.hits, "misses": self.misses}
+
+    async def _resolve(self, host: str) -> list[IPAddress]:
+        try:
+            return [ipaddress.ip_address(host)]
+        except ValueError:
+            pass
+
+        cached = self._cache.get(host)
+        if cached and cached[0] > time.monotonic():
+            self._cache.move_to_end(host)
+            self.hits += 1
+            return cached[1]
+        self.misses += 1
+
+        task = self._inflight.get(host)
+        if task is None:
+            task = asyncio.create_task(self._lookup(host))
+            self._inflight[host] = task
+            task.add_done_callback(lambda _: self._inflight.pop(host, None))
+        return await asyncio.shield(task)
+
+    async def _lookup(self, host: str) -> list[IPAddress]:
+        loop = asyncio.get_running_loop()
+        try:
+            infos = await asyncio.wait_for(
+                loop.getaddrinfo(host, None, type=socket.SOCK_STREAM), self._timeout,
+            )
+        except (OSError, asyncio.TimeoutError) as e:
+            # Not cached, so a transient resolver failure doesn't block the host for a whole TTL
+            raise BlockedUrlError(f"Blocked URL: could not resolve {host} ({e or 'timeout'})") from None
+        # Strip IPv6 scope ids ("fe80::1%eth0") before parsing
+        addresses = list({ipaddress.ip_address(info[4][0].split("%")[0]) for info in infos})
+        self._cache[host] = (time.monotonic() + self._ttl, addresses)
+        self._cache.move_to_end(host)
+        while len(self._cache) > self._max_entries:
+            self._cache.popitem(last=False)
+        return addresses
+
+
+@lru_cache
+def get_url_policy() -> UrlPolicy:
+    config = get_config()
+    return UrlPolicy(
+        allow=config.URL_ALLOWLIST,
+        deny=config.URL_DENYLIST,
+        ttl=config.URL_DNS_CACHE_TTL,
+        timeout=config.URL_DNS_TIMEOUT,
+    )
@@ -0,0 +1,183 @@
+"""Shared directory watchers fanned out to SSE subscribers."""
+
+from __future__ import annotations
+
+import asyncio
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable
+
+import watchfiles
+
+from kitsune.config import get_config
+from kitsune.logging import get_logger
+from kitsune.services.metrics import Metric, counter, gauge
+
+logger = get_logger("watcher")
+
+# Seconds between attempts to watch again a directory that is gone or whose watch failed
+_RESTART_DELAY = 1.0
+
+# Queue items are ("snapshot", full listing) or ("diff", {"added": [...], "removed": [...]})
+WatchEvent = tuple[str, Any]
+
+
+@dataclass
+class _WatchedDir:
+    listing: list[dict]
+    stop: asyncio.Event = field(default_factory=asyncio.Event)
+    subscribers: set[asyncio.Queue[WatchEvent]] = field(default_factory=set)
+    task: asyncio.Task | None = None
+
+
+class DirectoryWatcher:
+    """Runs one watchfiles watcher per directory, however many clients subscribe to it.
+
+    Bursts of file events are debounced by watchfiles. Subscribers receive only the
+    difference between consecutive listings; a subscriber that falls behind gets a
+    fresh snapshot instead of the diffs it missed. If the directory is deleted or
+    replaced, or the watch fails, it is watched afresh (once the path exists again)
+    and every subscriber resynced.
+    """
+
+    def __init__(
+        self,
+        lister: Callable[[Path], list[dict]],
+        on_change: Callable[[set[Path]], None] | None = None,
+    ) -> None:
+        config = get_config()
+        self._lister = lister
+        self._on_change = on_change
+        self._debounce_ms = config.NOTEBOOK_WATCH_DEBOUNCE_MS
+        self._queue_size = config.NOTEBOOK_WATCH_QUEUE_SIZE
+        self._dirs: dict[Path, _WatchedDir] = {}
+        # changes: debounced batches of file events; events: queue puts; resyncs: snapshots sent to slow
+        # consumers; restarts: watches restarted on a replaced directory
+        self._counters = {"changes": 0, "events": 0, "resyncs": 0, "restarts": 0}
+
+    @asynccontextmanager
+    async def subscribe(self, directory: Path) -> AsyncIterator[tuple[list[dict], asyncio.Queue[WatchEvent]]]:
+        """Yield the current listing and a queue of subsequent changes.
+
+        The directory must exist. The watcher stops when its last subscriber exits.
+        """
+        watched = self._dirs.get(directory)
+        if watched is not None and watched.task is not None and watched.task.done():
+            # Shouldn't happen, as _watch restarts itself, but never attach to a dead watch
+            watched.stop.set()
+            watched = None
+        if watched is None:
+            watched = _WatchedDir(listing=self._lister(directory))
+            watched.task = asyncio.create_task(self._watch(directory, watched))
+            self._dirs[directory] = watched
+        queue: asyncio.Queue[WatchEvent] = asyncio.Queue(maxsize=self._queue_size)
+        watched.subscribers.add(queue)
+        try:
+            yield watched.listing, queue
+        finally:
+            watched.subscribers.discard(queue)
+            if not watched.subscribers and self._dirs.get(directory) is watched:
+                del self._dirs[directory]
+                watched.stop.set()
+                if watched.task:
+                    watched.task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "directories": len(self._dirs),
+            "subscribers": sum(len(w.subscribers) for w in self._dirs.values()),
+            **self._counters,
+        }
+
+    def metrics(self) -> list[Metric]:
+        return [
+            gauge("kitsune_watcher_directories", "Directories being watched", len(self._dirs)),
+            gauge(
+                "kitsune_watcher_subscribers", "Open watch streams",
+                sum(len(w.subscribers) for w in self._dirs.values()),
+            ),
+            counter("kitsune_watcher_changes_total", "Debounced batches of file events", self._counters["changes"]),
+            counter("kitsune_watcher_events_total", "Events queued for subscribers", self._counters["events"]),
+            counter("kitsune_watcher_resyncs_total", "Snapshots sent to slow subscribers", self._counters["resyncs"]),
+            counter("kitsune_watcher_restarts_total", "Watches restarted on their directory", self._counters["restarts"]),
+        ]
+
+    async def shutdown(self) -> None:
+        tasks = [w.task for w in self._dirs.values() if w.task]
+        for watched in self._dirs.values():
+            watched.stop.set()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._dirs.clear()
+
+    async def _watch(self, directory: Path, watched: _WatchedDir) -> None:
+        restarting = False
+        while not watched.stop.is_set():
+            if restarting and not directory.is_dir():
+                await self._pause(watched)  # deleted; wait for it to come back
+                continue
+            replaced = False
+            try:
+                if restarting:
+                    self._counters["restarts"] += 1
+                    self._resync(directory, watched)
+                # True when the directory's inode went away, e.g. claiming a pooled sandbox
+                # renames its slot over the session directory
+                replaced = await self._follow(directory, watched)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Watcher for {directory} failed, restarting: {e!r}")
+            restarting = True
+            if not replaced:
+                await self._pause(watched)
+
+    @staticmethod
+    async def _pause(watched: _WatchedDir) -> None:
+        try:
+            await asyncio.wait_for(watched.stop.wait(), _RESTART_DELAY)
+        except TimeoutError:
+            pass
+
+    async def _follow(self, directory: Path, watched: _WatchedDir) -> bool:
+        """Relay changes until stopped, or return True once the directory itself is deleted or replaced."""
+        path = directory.absolute()
+        async for changes in watchfiles.awatch(
+            directory,
+            stop_event=watched.stop,
+            debounce=self._debounce_ms,
+            recursive=False,
+        ):
+            self._counters["changes"] += 1
+            paths = {Path(p) for _, p in changes}
+            if self._on_change:
+                self._on_change(paths)
+            if path in paths:
+                return True
+            if not any(p.suffix == ".py" for p in paths):
+                continue
+            listing = self._lister(directory)
+            added = [nb for nb in listing if nb not in watched.listing]
+            removed = [nb for nb in watched.listing if nb not in listing]
+            watched.listing = listing
+            if added or removed:
+                self._publish(watched, ("diff", {"added": added, "removed": removed}))
+        return False
+
+    def _resync(self, directory: Path, watched: _WatchedDir) -> None:
+        watched.listing = self._lister(directory)
+        self._publish(watched, ("snapshot", watched.listing))
+
+    def _publish(self, watched: _WatchedDir, event: WatchEvent) -> None:
+        for queue in watched.subscribers:
+            try:
+                queue.put_nowait(event)
+                self._counters["events"] += 1
+            except asyncio.QueueFull:
+                # Slow consumer: drop what it hasn't read and resync it with a snapshot
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(("snapshot", watched.listing))
+                self._counters["resyncs"] += 1
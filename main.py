@@ -1,30 +1,58 @@
 import asyncio
 import json
 import pathlib
+from collections.abc import AsyncIterator
 from contextlib import asynccontextmanager
+from typing import Any
 
 import logfire
 import uvicorn
-import watchfiles
 from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
+from pydantic import ValidationError
+from pydantic_ai import AgentRunResult
 from pydantic_ai.ui.vercel_ai import VercelAIAdapter
+from pydantic_ai.ui.vercel_ai.response_types import BaseChunk, DataChunk
 from sse_starlette.sse import EventSourceResponse
 
-from kitsune.agents.marimo import create_agent, create_deps
-from kitsune.services.sandbox import SandboxManager
+from kitsune.agents.marimo import create_agent, create_deps, history, model, notebook_cache
+from kitsune.agents.tools import tool_calls
+from kitsune.agents.tools.websearch import get_search_cache, search_metrics
+from kitsune.config import get_config
+from kitsune.services.admission import AdmissionController, AdmissionRejected
+from kitsune.services.conversations import ConversationStore, to_model_messages
+from kitsune.services.http import http_clients
+from kitsune.services.metrics import Registry
+from kitsune.services.outbound import get_guard
+from kitsune.services.sandbox import SandboxCapacityError
+from kitsune.services.sandbox_cluster import create_sandbox
+from kitsune.services.url_policy import get_url_policy
+from kitsune.services.watcher import DirectoryWatcher
 
 logfire.configure()
 logfire.instrument_pydantic_ai()
 
-sandbox = SandboxManager()
+config = get_config()
+sandbox = create_sandbox()
+conversations = ConversationStore(pathlib.Path(config.CONVERSATION_DB_PATH))
+admission = AdmissionController(
+    max_concurrent=config.CHAT_MAX_CONCURRENT,
+    per_session=config.CHAT_MAX_PER_SESSION,
+    max_queue=config.CHAT_MAX_QUEUE,
+    queue_timeout=config.CHAT_QUEUE_TIMEOUT,
+)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     await sandbox.startup()
     yield
+    await watcher.shutdown()
     await sandbox.shutdown()
+    await http_clients.aclose()
+    get_search_cache().close()
+    conversations.close()
 
 
 app = FastAPI(title="Kitsune", lifespan=lifespan)
@@ -37,13 +65,66 @@ async def health():
     return {"status": "ok"}
 
 
+async def _with_progress(
+    stream: AsyncIterator[BaseChunk],
+    progress: asyncio.Queue[BaseChunk],
+) -> AsyncIterator[BaseChunk]:
+    """Interleave tool progress chunks into the agent's event stream."""
+    done = DataChunk(type="data-done", data=None)
+
+    async def pump():
+        try:
+            async for chunk in stream:
+                await progress.put(chunk)
+        finally:
+            await progress.put(done)
+
+    task = asyncio.create_task(pump())
+    try:
+        while (chunk := await progress.get()) is not done:
+            yield chunk
+        await task
+    finally:
+        task.cancel()
+
+
 # Vercel AI chat endpoint
 @app.post("/chat")
 async def chat(request: Request) -> Response:
     # TODO: extract session_id from auth/header once auth is wired up
     session_id = request.headers.get("x-session-id", "default")
-    deps = create_deps(session_id=session_id, sandbox=sandbox)
-    return await VercelAIAdapter.dispatch_request(request, agent=agent, deps=deps)
+    try:
+        admitted = await admission.admit(session_id)
+    except AdmissionRejected as e:
+        return JSONResponse(
+            {"detail": e.reason},
+            status_code=e.status_code,
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    try:
+        adapter = await VercelAIAdapter.from_request(request, agent=agent)
+        # The client sends only the new message; earlier turns come from the conversation store
+        message_history = await conversations.history(session_id)
+    except ValidationError as e:
+        admitted.release()
+        return Response(content=e.json(), media_type="application/json", status_code=422)
+    except BaseException:
+        admitted.release()
+        raise
+    new_messages = adapter.messages
+
+    async def on_complete(result: AgentRunResult[Any]) -> None:
+        await conversations.append(session_id, [*new_messages, *result.new_messages()])
+
+    progress: asyncio.Queue[BaseChunk] = asyncio.Queue()
+
+    def on_progress(data: dict[str, Any]) -> None:
+        progress.put_nowait(DataChunk(type="data-tool-progress", data=data, transient=True))
+
+    deps = create_deps(session_id=session_id, sandbox=sandbox, progress=on_progress)
+    run = adapter.run_stream(deps=deps, message_history=message_history, on_complete=on_complete)
+    stream = _with_progress(run, progress)
+    return admitted.response(adapter.streaming_response(admitted.guard(stream)))
 
 #TODO: add auth and session management to these endpoints as well, and enforce that users can only access their own sandbox/notebooks
 @app.get("/sandbox/status")
@@ -51,6 +132,25 @@ async def sandbox_status():
     return sandbox.status()
 
 
+@app.get("/chat/status")
+async def chat_status():
+    return admission.stats()
+
+
+@app.get("/models/status")
+async def models_status():
+    return {"backends": model.stats(), "history": history.stats()}
+
+
+@app.get("/search/status")
+async def search_status():
+    return {
+        "cache": get_search_cache().stats(),
+        "providers": {name: get_guard(name).stats() for name in ("linkup", "tavily")},
+        "url_policy": get_url_policy().stats(),
+    }
+
+
 def _list_notebooks(nb_dir: pathlib.Path) -> list[dict]:
     """List .py notebooks in nb_dir, falling back to templates if none exist."""
     if not nb_dir.exists() or not any(nb_dir.glob("*.py")):
@@ -63,6 +163,14 @@ def _list_notebooks(nb_dir: pathlib.Path) -> list[dict]:
     ]
 
 
+def _invalidate_notebooks(paths: set[pathlib.Path]) -> None:
+    for path in paths:
+        notebook_cache.invalidate(path)
+
+
+watcher = DirectoryWatcher(_list_notebooks, on_change=_invalidate_notebooks)
+
+
 # Notebook listing (scoped to session)
 @app.get("/notebooks")
 async def list_notebooks(request: Request):
@@ -72,38 +180,71 @@ async def list_notebooks(request: Request):
 
 
 # SSE endpoint that pushes notebook list updates when .py files change.
+# The first message is the full list; later ones are "diff" events with the
+# added and removed notebooks, or a full list again if the client fell behind.
+# All clients of a session share one directory watcher. sse-starlette cancels
+# the generator on disconnect, which unsubscribes it.
 # EventSource can't send custom headers, so session_id is passed as a query
 # param here only — intentional divergence from the header-based pattern.
 @app.get("/notebooks/watch")
-async def watch_notebooks(request: Request, session_id: str):
+async def watch_notebooks(session_id: str):
     nb_dir = sandbox.get_user_dir(session_id)
     nb_dir.mkdir(parents=True, exist_ok=True)  # awatch requires path to exist
 
     async def generator():
-        stop = asyncio.Event()
-
-        async def _watch_disconnect():
-            while not await request.is_disconnected():
-                await asyncio.sleep(0.5)
-            stop.set()
-
-        asyncio.create_task(_watch_disconnect())
-
-        # Emit current list immediately so the client doesn't wait for a change
-        yield {"data": json.dumps(_list_notebooks(nb_dir))}
-
-        async for changes in watchfiles.awatch(nb_dir, stop_event=stop):
-            if any(str(p).endswith(".py") for _, p in changes):
-                yield {"data": json.dumps(_list_notebooks(nb_dir))}
+        async with watcher.subscribe(nb_dir) as (listing, queue):
+            # Emit current list immediately so the client doesn't wait for a change
+            yield {"data": json.dumps(listing)}
+            while True:
+                event, data = await queue.get()
+                if event == "snapshot":
+                    yield {"data": json.dumps(data)}
+                else:
+                    yield {"event": event, "data": json.dumps(data)}
 
     return EventSourceResponse(generator())
 
 
-# Get or create sandbox container, return marimo edit URL
+# Get or create sandbox container, return marimo edit URL.
+# `profile` picks the resource profile if the container has to be started.
 @app.get("/notebooks/{session_id}")
-async def get_notebook_url(session_id: str):
-    info = await sandbox.get_or_create(session_id)
-    return {"url": f"http://localhost:{info.host_port}"}
+async def get_notebook_url(session_id: str, profile: str | None = None):
+    try:
+        info = await sandbox.get_or_create(session_id, profile)
+    except ValueError as e:
+        return JSONResponse({"detail": str(e)}, status_code=400)
+    except SandboxCapacityError as e:
+        return JSONResponse({"detail": str(e)}, status_code=503)
+    return {"url": info.url}
+
+
+@app.get("/sessions/{session_id}/messages")
+async def get_session_messages(session_id: str, before: int | None = None, limit: int = 50):
+    """A page of the session's history as UI messages, newest page first.
+
+    Pass the returned `before` to get the previous page; it is null on the oldest page.
+    """
+    limit = max(1, min(limit, 200))
+    page = await conversations.page(session_id, before=before, limit=limit)
+    messages = VercelAIAdapter.dump_messages(to_model_messages(page))
+    return {
+        "messages": [m.model_dump(mode="json", by_alias=True, exclude_none=True) for m in messages],
+        "before": page[0].id if len(page) == limit else None,
+    }
+
+
+# Collectors read the counters and histograms the components keep anyway, at scrape time
+metrics = Registry()
+metrics.register(sandbox.metrics)
+metrics.register(sandbox.run_cache.metrics)
+metrics.register(tool_calls.metrics)
+metrics.register(search_metrics)
+metrics.register(watcher.metrics)
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 
 static_dir = pathlib.Path("static")
@@ -0,0 +1,25 @@
+"""Shared test setup.
+
+Run with `uv run --with pytest pytest`. No Docker daemon, model server or network is
+needed: sandboxes are FakeSandbox and models are pydantic-ai's test models.
+"""
+
+import os
+
+import pytest
+
+from kitsune.config import reset_config_cache
+
+# Required settings, set before any test module imports code that reads the config
+for key in ("OPENROUTER_API_KEY", "LINKUP_API_KEY", "TAVILY_API_KEY"):
+    os.environ.setdefault(key, "test")
+os.environ.setdefault("LOGFIRE_IGNORE_NO_CONFIG", "1")
+
+
+@pytest.fixture(autouse=True)
+def config(monkeypatch, tmp_path):
+    """A fresh config for every test, with notebook data under its tmp_path."""
+    monkeypatch.setenv("NOTEBOOK_DATA_DIR", str(tmp_path / "notebooks"))
+    reset_config_cache()
+    yield
+    reset_config_cache()
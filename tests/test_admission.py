@@ -0,0 +1,116 @@
+import asyncio
+
+import pytest
+from starlette.responses import StreamingResponse
+
+from kitsune.services.admission import AdmissionController, AdmissionRejected
+
+
+def controller(max_concurrent=2, per_session=1, max_queue=1, queue_timeout=0.05) -> AdmissionController:
+    return AdmissionController(max_concurrent, per_session, max_queue, queue_timeout)
+
+
+def test_per_session_limit():
+    async def run():
+        admission = controller()
+        first = await admission.admit("a")
+        with pytest.raises(AdmissionRejected) as rejected:
+            await admission.admit("a")
+        assert rejected.value.status_code == 429
+        assert rejected.value.retry_after >= 1
+        other = await admission.admit("b")
+        first.release()
+        (await admission.admit("a")).release()
+        other.release()
+        assert admission.stats()["active"] == 0
+        assert admission.stats()["rejected_session"] == 1
+
+    asyncio.run(run())
+
+
+def test_queue_then_reject_when_full():
+    async def run():
+        admission = controller(max_concurrent=1, per_session=5, max_queue=1, queue_timeout=5)
+        running = await admission.admit("a")
+        waiting = asyncio.create_task(admission.admit("b"))
+        await asyncio.sleep(0)
+        assert admission.stats()["queued"] == 1
+        with pytest.raises(AdmissionRejected) as rejected:
+            await admission.admit("c")
+        assert rejected.value.status_code == 503
+
+        running.release()
+        (await waiting).release()
+        assert admission.stats()["active"] == 0
+
+    asyncio.run(run())
+
+
+def test_queue_timeout_and_cancellation_leave_nothing_behind():
+    async def run():
+        admission = controller(max_concurrent=1, per_session=1, max_queue=2, queue_timeout=0.05)
+        running = await admission.admit("a")
+        with pytest.raises(AdmissionRejected) as rejected:
+            await admission.admit("b")
+        assert rejected.value.status_code == 503
+        cancelled = asyncio.create_task(admission.admit("c"))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+
+        running.release()
+        running.release()  # idempotent
+        # b and c hold no per-session count and no slot
+        for session_id in ("b", "c", "a"):
+            (await admission.admit(session_id)).release()
+        assert admission.stats()["active"] == 0
+        assert admission.stats()["queue_timeouts"] == 1
+
+    asyncio.run(run())
+
+
+async def body():
+    yield b"data: 1\n\n"
+    yield b"data: 2\n\n"
+
+
+def test_response_releases_after_streaming():
+    async def run():
+        admission = controller(per_session=1)
+        admitted = await admission.admit("a")
+        response = admitted.response(StreamingResponse(admitted.guard(body())))
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        async def receive():
+            await asyncio.sleep(10)
+
+        await response({"type": "http", "asgi": {"spec_version": "2.4"}}, receive, send)
+        assert b"".join(m.get("body", b"") for m in sent) == b"data: 1\n\ndata: 2\n\n"
+        assert admission.stats()["active"] == 0
+
+    asyncio.run(run())
+
+
+def test_response_releases_when_the_body_never_starts():
+    async def run():
+        admission = controller(per_session=1)
+        admitted = await admission.admit("a")
+        response = admitted.response(StreamingResponse(admitted.guard(body())))
+
+        async def send(message):
+            raise OSError("client went away")
+
+        async def receive():
+            return {"type": "http.disconnect"}
+
+        with pytest.raises(Exception):
+            await response({"type": "http", "asgi": {"spec_version": "2.4"}}, receive, send)
+        assert admission.stats()["active"] == 0
+        # The session's count is back too, so its next request is admitted
+        (await admission.admit("a")).release()
+
+    asyncio.run(run())
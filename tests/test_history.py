@@ -0,0 +1,116 @@
+import asyncio
+
+import pytest
+from pydantic_ai import Agent
+from pydantic_ai.messages import (
+    ModelRequest,
+    ModelResponse,
+    TextPart,
+    ToolCallPart,
+    ToolReturnPart,
+    UserPromptPart,
+)
+from pydantic_ai.models.function import AgentInfo, DeltaToolCall, FunctionModel
+from pydantic_ai.models.test import TestModel
+
+from kitsune.agents.history import CompactingModel, HistoryCompactor
+
+LONG = "x" * 1000
+
+
+def compactor(**kwargs) -> HistoryCompactor:
+    options = {"token_budget": 100_000, "keep_turns": 2, "tool_result_max_chars": 100, "keep_tool_steps": 2}
+    return HistoryCompactor(TestModel(custom_output_text="- the summary"), **{**options, **kwargs})
+
+
+def tool_step(n: int, tool: str = "web_search", args: dict | None = None, content: str = LONG):
+    call_id = f"call-{n}"
+    return [
+        ModelResponse(parts=[ToolCallPart(tool, args or {"query": str(n)}, tool_call_id=call_id)]),
+        ModelRequest(parts=[ToolReturnPart(tool, content, tool_call_id=call_id)]),
+    ]
+
+
+def returns(messages) -> list[str]:
+    return [p.content for m in messages for p in m.parts if isinstance(p, ToolReturnPart)]
+
+
+def turn(prompt: str, *steps) -> list:
+    return [ModelRequest(parts=[UserPromptPart(prompt)]), *(m for step in steps for m in step)]
+
+
+def test_elides_all_but_the_last_tool_steps_of_a_long_run():
+    history = compactor()
+    messages = turn("analyze", *(tool_step(n) for n in range(5)))
+    compacted = asyncio.run(history.process(None, messages))
+
+    results = returns(compacted)
+    assert all(r.startswith("[Earlier result of web_search omitted") for r in results[:3])
+    assert results[3:] == [LONG, LONG]
+    assert returns(messages) == [LONG] * 5, "the input messages are left as they were"
+    assert history.stats()["tool_results_elided"] == 3
+
+
+def test_replaces_superseded_notebook_reads():
+    history = compactor(keep_tool_steps=10)
+    messages = turn(
+        "edit",
+        tool_step(0, "read_notebook", {"name": "a"}, "old source"),
+        tool_step(1, "read_notebook", {"name": "b"}, "other source"),
+        tool_step(2, "read_notebook", {"name": "a"}, "new source"),
+    )
+    results = returns(asyncio.run(history.process(None, messages)))
+    assert results[0].startswith("[Result of read_notebook omitted")
+    assert results[1:] == ["other source", "new source"]
+
+
+def test_summarizes_old_turns_when_over_budget():
+    history = compactor(token_budget=10, keep_turns=1, summary_chunk=2)
+    messages = [m for n in range(3) for m in turn(f"question {n}", [ModelResponse(parts=[TextPart("answer " * 50)])])]
+
+    compacted = asyncio.run(history.process(None, messages))
+    assert compacted[0].parts[0].content.endswith("- the summary")
+    assert compacted[1:] == messages[-2:]
+    assert history.stats()["summaries"] == 1
+
+    asyncio.run(history.process(None, messages))
+    assert history.stats()["summaries"] == 1, "the summary of an unchanged prefix is cached"
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_stored_history_keeps_full_tool_results(streaming):
+    seen = []
+
+    def respond(messages, info: AgentInfo) -> ModelResponse:
+        seen.append(returns(messages))
+        if len(seen) <= 5:
+            return ModelResponse(parts=[ToolCallPart("fetch", {"n": len(seen)}, tool_call_id=f"call-{len(seen)}")])
+        return ModelResponse(parts=[TextPart("done")])
+
+    async def respond_stream(messages, info: AgentInfo):
+        response = respond(messages, info)
+        part = response.parts[0]
+        if isinstance(part, ToolCallPart):
+            yield {0: DeltaToolCall(part.tool_name, part.args_as_json_str(), tool_call_id=part.tool_call_id)}
+        else:
+            yield part.content
+
+    history = compactor()
+    agent = Agent(CompactingModel(FunctionModel(respond, stream_function=respond_stream), history))
+
+    @agent.tool_plain
+    def fetch(n: int) -> str:
+        return LONG
+
+    async def ignore(ctx, events):
+        async for _ in events:
+            pass
+
+    result = asyncio.run(agent.run("go", event_stream_handler=ignore if streaming else None))
+
+    assert result.output == "done"
+    assert sum(r.startswith("[Earlier result of fetch omitted") for r in seen[-1]) == 3
+    assert returns(result.new_messages()) == [LONG] * 5
+    assert not any(
+        isinstance(p, UserPromptPart) and p.content != "go" for m in result.all_messages() for p in m.parts
+    )
@@ -0,0 +1,107 @@
+import pytest
+
+from kitsune.agents.notebook import CellSpec, ParsedNotebook, build_notebook
+
+SOURCE = '''\
+import marimo
+
+__generated_with = "0.0.0"
+app = marimo.App(width="medium")
+
+
+@app.cell
+def load():
+    import pandas as pd
+    df = pd.DataFrame({"a": [1, 2]})
+    return (df,)
+
+
+@app.cell(hide_code=True)
+def _(df):
+    # keep this comment
+    total = df["a"].sum()
+    return (total,)
+
+
+@app.cell
+def show(total):
+    print(total)
+    return
+
+
+if __name__ == "__main__":
+    app.run()
+'''
+
+
+def names(notebook: ParsedNotebook) -> list[str]:
+    return [spec.name for spec in notebook.specs]
+
+
+def test_round_trip_is_byte_for_byte():
+    notebook = ParsedNotebook.parse(SOURCE)
+    assert names(notebook) == ["load", "_", "show"]
+    assert notebook.render() == SOURCE
+    assert notebook.specs[1].deps == ["df"]
+    assert notebook.specs[1].returns == ["total"]
+
+
+def test_edits_leave_other_cells_untouched():
+    notebook = ParsedNotebook.parse(SOURCE)
+    notebook.replace(2, CellSpec(code="print(total * 2)", deps=["total"], name="show"))
+    notebook.insert(1, CellSpec(code="n = len(df)", deps=["df"], returns=["n"], name="count"))
+    rendered = notebook.render()
+
+    reparsed = ParsedNotebook.parse(rendered)
+    assert names(reparsed) == ["load", "count", "_", "show"]
+    assert reparsed.specs[3].code == "print(total * 2)"
+    assert "@app.cell(hide_code=True)\ndef _(df):\n    # keep this comment\n" in rendered
+    assert rendered.endswith('if __name__ == "__main__":\n    app.run()\n')
+
+
+def test_delete_and_move_keep_the_layout():
+    notebook = ParsedNotebook.parse(SOURCE)
+    notebook.move(2, 0)
+    assert names(notebook) == ["show", "load", "_"]
+    assert notebook.render().startswith(SOURCE[:SOURCE.index("@app.cell")] + "@app.cell\ndef show")
+
+    notebook.delete(0)
+    assert ParsedNotebook.parse(notebook.render()).render() == notebook.render()
+    assert names(ParsedNotebook.parse(notebook.render())) == ["load", "_"]
+
+
+def test_insert_into_empty_notebook_lands_above_the_footer():
+    notebook = ParsedNotebook.empty()
+    notebook.insert(-1, CellSpec(code="x = 1", returns=["x"]))
+    rendered = notebook.render()
+    assert rendered.index("def _():") < rendered.index("if __name__")
+    assert [spec.code for spec in ParsedNotebook.parse(rendered).specs] == ["x = 1"]
+
+
+def test_copy_is_independent():
+    notebook = ParsedNotebook.parse(SOURCE)
+    copy = notebook.copy()
+    copy.delete(0)
+    copy.move(0, 1)
+    assert notebook.render() == SOURCE
+
+
+def test_index_of():
+    notebook = ParsedNotebook.parse(SOURCE)
+    assert notebook.index_of("show") == 2
+    assert notebook.index_of(-1) == 2
+    assert notebook.index_of("1") == 1
+    with pytest.raises(IndexError):
+        notebook.index_of(3)
+    with pytest.raises(KeyError):
+        notebook.index_of("_")
+    with pytest.raises(KeyError):
+        notebook.index_of("missing")
+
+
+def test_build_notebook_parses_back_to_its_specs():
+    specs = [
+        CellSpec(code="a = 1\nb = 2", returns=["a", "b"], name="setup"),
+        CellSpec(code="print(a + b)", deps=["a", "b"]),
+    ]
+    assert ParsedNotebook.parse(build_notebook(specs)).specs == specs
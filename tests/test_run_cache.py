@@ -0,0 +1,101 @@
+import asyncio
+from types import SimpleNamespace
+
+from kitsune.agents.marimo import create_deps, run_notebook
+from kitsune.agents.notebook import CellSpec, build_notebook
+from kitsune.config import reset_config_cache
+from kitsune.services.run_cache import RunCache
+from kitsune.services.sandbox_fake import FakeSandbox
+
+NOTEBOOK = build_notebook([CellSpec(code="x = 1", returns=["x"]), CellSpec(code="print(x)", deps=["x"])])
+
+
+def test_key_covers_every_input():
+    cache = RunCache()
+    base = cache.key("nb", "source", "kernel", "inputs")
+    assert cache.key("nb", "source", "kernel", "inputs") == base
+    changed = [
+        cache.key("other", "source", "kernel", "inputs"),
+        cache.key("nb", "source 2", "kernel", "inputs"),
+        cache.key("nb", "source", "fresh", "inputs"),
+        cache.key("nb", "source", "kernel", "inputs 2"),
+    ]
+    assert base not in changed
+    assert len(set(changed)) == len(changed)
+
+
+def test_data_digest_tracks_data_files_and_helper_modules(tmp_path):
+    cache = RunCache()
+    (tmp_path / "data.csv").write_text("a,b\n1,2\n")
+    (tmp_path / "helpers.py").write_text("def f():\n    return 1\n")
+    (tmp_path / "nb.py").write_text(NOTEBOOK)
+    digest = cache.data_digest(tmp_path)
+
+    (tmp_path / "nb.py").write_text(NOTEBOOK.replace("x = 1", "x = 2"))
+    assert cache.data_digest(tmp_path) == digest, "notebooks are keyed by their own source"
+
+    (tmp_path / "helpers.py").write_text("def f():\n    return 2\n")
+    after_helper = cache.data_digest(tmp_path)
+    assert after_helper != digest
+
+    (tmp_path / "data.csv").write_text("a,b\n1,3\n")
+    assert cache.data_digest(tmp_path) != after_helper
+
+
+def test_data_digest_ignores_generated_and_hidden_files(tmp_path):
+    cache = RunCache()
+    (tmp_path / "data.csv").write_text("1\n")
+    digest = cache.data_digest(tmp_path)
+    for name in ("__marimo__", "__pycache__", ".ipynb_checkpoints"):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "state.bin").write_bytes(b"\0" * 16)
+    assert cache.data_digest(tmp_path) == digest
+
+
+def test_put_keeps_each_session_under_its_limit(monkeypatch):
+    monkeypatch.setenv("RUN_CACHE_SESSION_MAX_BYTES", "100")
+    reset_config_cache()
+    cache = RunCache()
+    for i in range(5):
+        cache.put("a", f"k{i}", {"output": "x" * 30})
+    cache.put("b", "other", {"output": "x" * 30})
+    assert cache.get("k0") is None
+    assert cache.get("k4") is not None
+    assert cache.get("other") is not None
+    assert cache.stats()["evictions"] > 0
+
+
+class FlakySandbox(FakeSandbox):
+    """A FakeSandbox whose kernel runs fail until `failing` is cleared."""
+
+    def __init__(self) -> None:
+        super().__init__(start_latency=0, exec_latency=0)
+        self.failing = True
+        self.runs = 0
+
+    async def run_in_kernel(self, *args, **kwargs) -> dict:
+        self.runs += 1
+        result = await super().run_in_kernel(*args, **kwargs)
+        if self.failing:
+            result["cells"][0]["status"] = "error"
+        return result
+
+
+def test_failed_runs_are_not_cached():
+    sandbox = FlakySandbox()
+    ctx = SimpleNamespace(deps=create_deps(session_id="s", sandbox=sandbox))
+    user_dir = sandbox.get_user_dir("s")
+    user_dir.mkdir(parents=True)
+    (user_dir / "nb.py").write_text(NOTEBOOK)
+
+    async def run() -> dict:
+        return await run_notebook(ctx, "nb")
+
+    assert asyncio.run(run())["status"] == "error"
+    sandbox.failing = False
+    retried = asyncio.run(run())
+    assert retried["status"] == "ok" and "result_cache" not in retried
+    assert sandbox.runs == 2
+
+    assert asyncio.run(run())["result_cache"] == "hit"
+    assert sandbox.runs == 2
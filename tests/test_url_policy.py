@@ -0,0 +1,86 @@
+import asyncio
+import socket
+
+import pytest
+
+from kitsune.services.url_policy import BlockedUrlError, UrlPolicy
+
+
+def allowed(policy: UrlPolicy, url: str, dns: dict[str, list[str]] | None = None) -> bool:
+    """Check url with the resolver answering from dns."""
+
+    async def getaddrinfo(host, port, type=0, **kwargs):
+        await asyncio.sleep(0)
+        if host not in (dns or {}):
+            raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+        return [(socket.AF_INET6 if ":" in a else socket.AF_INET, type, 6, "", (a, 0)) for a in dns[host]]
+
+    async def run() -> bool:
+        asyncio.get_running_loop().getaddrinfo = getaddrinfo
+        return await policy.is_allowed(url)
+
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("url", [
+    "http://93.184.216.34/",
+    "https://[2606:4700::1111]/page",
+    "http://[2002:808:808::1]/",  # 6to4 for 8.8.8.8
+    "http://[64:ff9b::808:808]/",  # NAT64 for 8.8.8.8
+])
+def test_public_addresses_are_allowed(url):
+    assert allowed(UrlPolicy(), url)
+
+
+@pytest.mark.parametrize("url", [
+    "http://127.0.0.1/",
+    "http://10.0.0.1:8080/",
+    "http://169.254.169.254/latest/meta-data/",
+    "http://[::1]/",
+    "http://[fd00::1]/",
+    "http://[fe80::1]/",
+    "http://[::ffff:10.0.0.1]/",
+    "http://[64:ff9b::a00:1]/",  # NAT64 for 10.0.0.1
+    "http://[2002:a00:1::1]/",  # 6to4 for 10.0.0.1
+    "http://[2001:0:4136:e378:8000:63bf:f5ff:fffe]/",  # Teredo, client 10.0.0.1
+    "http://[::a00:1]/",  # IPv4-compatible 10.0.0.1
+    "http://224.0.0.1/",
+])
+def test_non_public_addresses_are_blocked(url):
+    assert not allowed(UrlPolicy(), url)
+
+
+@pytest.mark.parametrize("url", ["file:///etc/passwd", "ftp://example.com/", "http:///path", "http://[::1/"])
+def test_only_http_urls_with_a_host(url):
+    assert not allowed(UrlPolicy(), url)
+
+
+def test_hostnames_are_judged_by_every_address_they_resolve_to():
+    dns = {"ok.example": ["93.184.216.34"], "mixed.example": ["93.184.216.34", "10.1.2.3"]}
+    assert allowed(UrlPolicy(), "https://ok.example/", dns)
+    assert not allowed(UrlPolicy(), "https://mixed.example/", dns)
+    assert not allowed(UrlPolicy(), "https://unresolvable.example/", dns)
+
+
+def test_allow_and_deny_rules():
+    policy = UrlPolicy(allow=("10.0.0.0/8", "*.internal.example"), deny=("93.184.216.0/24", "bad.example"))
+    dns = {"www.bad.example": ["8.8.8.8"], "svc.internal.example": ["192.168.1.1"]}
+    assert allowed(policy, "http://10.0.0.1/")
+    assert allowed(policy, "http://[64:ff9b::a00:1]/"), "allowed networks cover embedded addresses"
+    assert allowed(policy, "http://svc.internal.example/", dns)
+    assert not allowed(policy, "http://93.184.216.34/")
+    assert not allowed(policy, "http://[::ffff:93.184.216.34]/"), "denied networks cover embedded addresses"
+    assert not allowed(policy, "http://www.bad.example/", dns)
+
+
+def test_resolutions_are_cached():
+    policy = UrlPolicy()
+    dns = {"ok.example": ["93.184.216.34"]}
+    assert allowed(policy, "https://ok.example/a", dns)
+    assert allowed(policy, "https://OK.example./b", dns)
+    assert policy.stats() == {"entries": 1, "hits": 1, "misses": 1}
+
+
+def test_check_explains_the_refusal():
+    with pytest.raises(BlockedUrlError, match="non-public address 64:ff9b::a00:1"):
+        asyncio.run(UrlPolicy().check("http://[64:ff9b::a00:1]/"))